@@ -1,4 +1,3 @@
-import mysql.connector
 import time
 import logging
 import sys
@@ -30,10 +29,22 @@ from urllib3.exceptions import ReadTimeoutError
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.keys import Keys
 
+import browser_pool
+import db_pool
+import pacing
+import page_extract
+import page_nav
+import page_waits
+
 # --- Human-Like Delay ---
+# Deliberate pacing only (typing, mouse moves, breaks between products);
+# waiting for the page itself goes through page_waits.
+HUMAN_DELAY_SCALE = float(os.environ.get("SCRAPER_HUMAN_DELAY_SCALE", "1"))
+
+
 def human_delay(min_s, max_s):
     """Sleep for a random duration to mimic human behavior."""
-    delay = random.uniform(min_s, max_s)
+    delay = random.uniform(min_s, max_s) * HUMAN_DELAY_SCALE
     time.sleep(delay)
 
 
@@ -186,7 +197,7 @@ def check_1688_login(driver):
         # Navigate to order list page
         url = "https://air.1688.com/app/ctf-page/trade-order-list/buyer-order-list.html?spm=a260k.home2025.leftmenu_EXPEND.dorder&page=1&pageSize=10"
         safe_get(driver, url)
-        human_delay(8, 15)
+        page_waits.wait_for(driver, "order_page_or_login", timeout=30, settle=page_waits.LOGIN_SETTLE)
 
         # Check for login modal/popup - try multiple methods
         login_detected = False
@@ -269,7 +280,7 @@ def check_1688_login(driver):
 
             # Navigate back to order list after login
             safe_get(driver, url)
-            human_delay(4, 8)
+            page_waits.wait_for(driver, "order_page_or_login", timeout=30, settle=page_waits.LOGIN_SETTLE)
 
             # Check again if still showing login
             page_source = driver.page_source
@@ -313,75 +324,15 @@ def sanitize_filename(name):
     return sanitized[:100] if len(sanitized) > 100 else sanitized
 
 
-# --- Extract 1688 Offer ID from reference_links ---
-def extract_1688_offer_id(reference_links_raw):
-    """
-    Extract the 1688 offer ID from reference_links JSON.
-    Input:  '["https://detail.1688.com/offer/804862876701.html?spm=..."]'
-    Output: ("804862876701", "https://detail.1688.com/offer/804862876701.html")
-    Returns (None, None) if no valid URL found.
-    """
-    if not reference_links_raw:
-        return None, None
-
-    # Parse JSON if needed
-    links = reference_links_raw
-    if isinstance(links, str):
-        try:
-            links = json.loads(links)
-        except json.JSONDecodeError:
-            links = [links]
-
-    if isinstance(links, list) and len(links) > 0:
-        url = str(links[0])
-    elif isinstance(links, str):
-        url = links
-    else:
-        return None, None
-
-    # Extract offer ID via regex
-    patterns = [
-        r'offer/(\d+)\.html',
-        r'offerId=(\d+)',
-        r'/(\d{10,})',
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            offer_id = match.group(1)
-            clean_url = f"https://detail.1688.com/offer/{offer_id}.html"
-            return offer_id, clean_url
-
-    # Bare number
-    if re.match(r'^\d{10,}$', url.strip()):
-        offer_id = url.strip()
-        clean_url = f"https://detail.1688.com/offer/{offer_id}.html"
-        return offer_id, clean_url
-
-    return None, None
-
-
 # --- Database Connection ---
 def connect_db():
-    """Connect to requestDatabase for reading product data."""
-    return mysql.connector.connect(
-        host=os.environ.get("DB_HOST", "localhost"),
-        user="root",
-        password=os.environ["DB_PASSWORD"],
-        database="requestDatabase",
-        port=3306
-    )
+    """Check out a pooled requestDatabase connection for reading product data."""
+    return db_pool.get_connection()
 
 
 def connect_target_db():
-    """Connect to requestDatabase database for writing to shopee_listing_products."""
-    return mysql.connector.connect(
-        host=os.environ.get("DB_HOST", "localhost"),
-        user="root",
-        password=os.environ["DB_PASSWORD"],
-        database="requestDatabase",  # Use requestDatabase to write to shopee_listing_products
-        port=3306
-    )
+    """Check out a pooled requestDatabase connection for writing to shopee_listing_products."""
+    return db_pool.get_connection()
 
 
 def update_existing_listing(product_id, new_item_id, url_1688, product_name, variation_names, variation_imgs, description_imgs, item_date=None):
@@ -481,7 +432,7 @@ def get_product_names_from_db():
                     pass
 
             # Extract 1688 offer ID
-            offer_id, clean_url = extract_1688_offer_id(reference_links)
+            offer_id, clean_url = page_nav.extract_1688_offer_id(reference_links)
             # Fall back to product name as group key if no URL
             group_key = offer_id if offer_id else f"search:{product_name_cn}"
 
@@ -562,64 +513,25 @@ def navigate_to_order_list(driver, rebuild_driver_fn=None):
     except TimeoutException:
         pass  # Continue anyway, page may be usable
 
-    # Wait for dynamic content - the search function will do additional waiting
-    human_delay(2, 5)
+    # Wait for the search box (or a login redirect) so the session check sees the real page
+    page_waits.wait_for(driver, "order_page_or_login", timeout=30)
     logging.info("Order list page loaded.")
     return driver
 
 # --- Navigate to 1688 Product Page (Direct URL -> Search Fallback) ---
 def navigate_to_1688_product(driver, url, product_name_cn, rebuild_driver_fn=None):
     """
-    Navigate to a 1688 product page.
-    Strategy: Try direct URL first, fall back to order-list search.
-
-    Returns:
-        (driver, success): Updated driver reference and boolean success flag
+    Open a 1688 product page: direct offer URL first, order-list search as
+    fallback (see page_nav). Returns (driver, success).
     """
-    # Strategy 1: Direct URL navigation (preferred)
-    if url:
-        print(f"  [NAV] Trying direct URL: {url}")
-        driver = safe_get(driver, url, rebuild_driver_fn=rebuild_driver_fn)
-        human_delay(3, 6)
-
-        # Check if we got redirected to login page
-        if not check_session_expired(driver):
-            # Verify we're on a product page
-            is_product_page = driver.execute_script("""
-                return !!(
-                    document.querySelector('.od-gallery-preview') ||
-                    document.querySelector('#description') ||
-                    document.querySelector('.sku-filter-button') ||
-                    document.querySelector('.od-gallery-list')
-                );
-            """)
-
-            if is_product_page:
-                print(f"  [NAV] Direct URL navigation successful")
-                return driver, True
-            else:
-                print(f"  [NAV] Direct URL loaded but no product elements found, trying search fallback...")
-        else:
-            print(f"  [NAV] Session expired during direct navigation, trying search fallback...")
-
-    # Strategy 2: Order-list search fallback
-    print(f"  [NAV] Falling back to order-list search: {product_name_cn}")
-    driver = navigate_to_order_list(driver, rebuild_driver_fn)
-
-    if check_session_expired(driver):
-        print(f"  [NAV] Session expired, cannot proceed")
-        return driver, False
-
-    if not search_product(driver, product_name_cn):
-        print(f"  [NAV] Search failed for: {product_name_cn}")
-        return driver, False
-
-    if not click_product_result(driver):
-        print(f"  [NAV] No results for: {product_name_cn}")
-        return driver, False
-
-    print(f"  [NAV] Order-list search fallback successful")
-    return driver, True
+    return page_nav.navigate_to_1688_product(
+        driver, url, product_name_cn, rebuild_driver_fn,
+        safe_get=safe_get,
+        check_session_expired=check_session_expired,
+        navigate_to_order_list=navigate_to_order_list,
+        search_product=search_product,
+        click_product_result=click_product_result,
+    )
 
 # --- Search for Product ---
 def search_product(driver, product_name_cn):
@@ -627,25 +539,17 @@ def search_product(driver, product_name_cn):
     print(f"Searching for: {product_name_cn}")
 
     try:
-        # Wait for APP-ROOT element to exist first (top level)
-        print("[DEBUG] Waiting for APP-ROOT element...")
+        # Wait for the APP-ROOT shadow chain down to the search input and button
+        print("[DEBUG] Waiting for APP-ROOT search box...")
         max_wait = 30
-        app_root_found = False
-
-        for i in range(max_wait):
-            count = driver.execute_script("return document.querySelectorAll('app-root').length")
-            if count > 0:
-                print(f"[DEBUG] Found app-root after {i+1} seconds")
-                app_root_found = True
-                break
-            human_delay(0.8, 1.5)
-
-        if not app_root_found:
-            print(f"[ERROR] No app-root element found after {max_wait} seconds")
+        start = time.monotonic()
+        if page_waits.wait_for(driver, "order_search", timeout=max_wait) is None:
+            print(f"[ERROR] Search box not ready after {max_wait} seconds")
             return False
+        print(f"[DEBUG] Search box ready after {time.monotonic() - start:.1f} seconds")
 
-        # Wait for nested shadow DOMs to be ready
-        human_delay(4, 8)
+        # Results currently listed, so we can tell when the search has replaced them
+        before = page_waits.check_now(driver, "order_results_signature") or {}
 
         # Step 1: Focus the search input via shadow DOM traversal and clear it
         focus_result = driver.execute_script("""
@@ -731,7 +635,8 @@ def search_product(driver, product_name_cn):
 
         print("[DEBUG] Clicked search button via ActionChains coordinate click")
 
-        human_delay(2, 5)
+        # Wait for the result list to change; an empty result never does, so keep this short
+        page_waits.wait_for(driver, "order_results_changed", before.get("signature", ""), timeout=10)
         return True
 
     except Exception as e:
@@ -747,7 +652,7 @@ def click_product_result(driver):
         print("Waiting for product results...")
 
         # Wait for results to load after search
-        human_delay(2, 5)
+        page_waits.wait_for(driver, "order_results", timeout=5)
 
         # Product links are inside nested shadow DOM:
         # APP-ROOT -> ORDER-LIST -> ORDER-ITEM -> ORDER-ITEM-ENTRY-PRODUCT -> a.product-name
@@ -795,7 +700,7 @@ def click_product_result(driver):
         if 'error' in product_info:
             # Retry with longer wait
             print("[DEBUG] No products found, retrying with longer wait...")
-            human_delay(4, 8)
+            page_waits.wait_for(driver, "order_results", timeout=8)
 
             product_info = driver.execute_script("""
                 function findInShadow(root, selector) {
@@ -845,7 +750,7 @@ def click_product_result(driver):
         safe_get(driver, product_url)
 
         # Wait for page to load
-        human_delay(2, 5)
+        page_waits.wait_for(driver, "product_page", timeout=20)
         print(f"Product page loaded: {driver.current_url}")
         return True
 
@@ -855,490 +760,129 @@ def click_product_result(driver):
         traceback.print_exc()
         return False
 
-# --- Fetch SKU Variation Images ---
-def fetch_sku_images(driver, variation_list_cn):
+# --- Check if Session Expired (quick check) ---
+def check_session_expired(driver):
+    """Quick check if redirected to login page. Returns True if session expired."""
+    try:
+        current_url = driver.current_url.lower()
+        if "login" in current_url or "passport" in current_url:
+            return True
+        # Check page source for login form
+        page_source = driver.page_source
+        if '\u8bf7\u8f93\u5165\u624b\u673a\u53f7' in page_source or 'fm-sms-login-id' in page_source:
+            return True
+        return False
+    except:
+        return False
+
+# --- Process One Product ---
+def process_product(driver, idx, total, product, rebuild_driver_fn=None):
     """
-    Fetch SKU variation image URLs by clicking/hovering each variation button
-    and capturing the high-res preview image from the gallery.
+    Scrape every 1688 source of one product_id and upsert
+    shopee_listing_products + shopee_listing_variations per url_group.
 
     Args:
-        driver: Selenium WebDriver instance
-        variation_list_cn: JSON string like '["\u7ea2\u8272", "\u84dd\u8272", "\u7eff\u8272"]'
+        product: (product_id, product_info) item from get_product_names_from_db()
 
     Returns:
-        list: Ordered list of image URLs matching variation_list_cn order
+        (driver, success, rows_updated): driver may have been rebuilt after a crash
     """
-    # Parse variation_list_cn to get ordered list
-    if not variation_list_cn:
-        print("[INFO] No variations to fetch (variation_list_cn is empty)")
-        return []
+    product_id, product_info = product
+    pacing.POLICY.mark_work_start()
+    product_name = product_info["product_name_cn"]
+    item_date = product_info.get("item_date")
+    url_groups = product_info["url_groups"]
+    total_updated = 0
 
+    print(f"\n{'='*60}")
     try:
-        variations = json.loads(variation_list_cn)
-        if not isinstance(variations, list):
-            print("[INFO] variation_list_cn is not a list")
-            return []
-    except json.JSONDecodeError:
-        print("[INFO] Invalid JSON in variation_list_cn")
-        return []
-
-    if not variations:
-        print("[INFO] No variations to fetch (empty list)")
-        return []
-
-    print(f"\nFetching SKU images ({len(variations)} variations)...")
-
-    # Wait for SKU elements to load
-    human_delay(1.5, 4)
-
-    result = []
-    seen_bases = {}  # Cache: normalized_name -> url (to avoid duplicate clicks)
-
-    # For each variation in order
-    for variation in variations:
-        # Normalize: "\u9ed1\u8272 - 38" -> "\u9ed1\u8272", "\u7c89\u8272  M80-100\u65a4" -> "\u7c89\u8272"
-        base_variation = variation.strip()
-        if " - " in base_variation:
-            base_variation = base_variation.split(" - ")[0].strip()
-        elif re.search(r'\s{2,}', base_variation):
-            base_variation = re.split(r'\s{2,}', base_variation)[0].strip()
-
-        # Check cache first
-        if base_variation in seen_bases:
-            result.append(seen_bases[base_variation])
-            continue
-        # Scroll element into view and get fresh coordinates
-        button_info = driver.execute_script("""
-            const targetLabel = arguments[0];
-
-            // Pattern 1: button.sku-filter-button with span.label-name (need to click)
-            for (const btn of document.querySelectorAll('button.sku-filter-button')) {
-                const label = btn.querySelector('span.label-name');
-                if (label && label.textContent.trim() === targetLabel) {
-                    btn.scrollIntoView({ block: 'center' });
-                    const rect = btn.getBoundingClientRect();
-                    return {
-                        x: rect.x + rect.width / 2,
-                        y: rect.y + rect.height / 2,
-                        pattern: 'click'
-                    };
-                }
-            }
-
-            // Pattern 2: div.v-flex with span.item-label - hover over the img
-            for (const div of document.querySelectorAll('div.v-flex')) {
-                const label = div.querySelector('span.item-label');
-                const img = div.querySelector('img.ant-image-img');
-                if (label && label.textContent.trim() === targetLabel && img) {
-                    img.scrollIntoView({ block: 'center' });
-                    const rect = img.getBoundingClientRect();
-                    return {
-                        x: rect.x + rect.width / 2,
-                        y: rect.y + rect.height / 2,
-                        pattern: 'hover'
-                    };
-                }
-            }
-
-            // Pattern 3: td.ant-table-cell > div.gyp-pro-table-title with <p> label and <img> - hover for popover
-            for (const title of document.querySelectorAll('div.gyp-pro-table-title')) {
-                const p = title.querySelector('p');
-                const img = title.querySelector('img');
-                if (p && p.textContent.trim() === targetLabel && img) {
-                    img.scrollIntoView({ block: 'center' });
-                    const rect = img.getBoundingClientRect();
-                    return {
-                        x: rect.x + rect.width / 2,
-                        y: rect.y + rect.height / 2,
-                        pattern: 'hover_popover'
-                    };
-                }
-            }
-
-            return null;  // Not found
-        """, base_variation)
-
-        if not button_info and ' ' in base_variation:
-            # Fallback: retry with just the first word (e.g. "\u767d\u8272 \u5927\u53f7" -> "\u767d\u8272")
-            first_word = base_variation.split(' ')[0].strip()
-            print(f"  [RETRY] {base_variation} -> trying first word: {first_word}")
-            button_info = driver.execute_script("""
-                const targetLabel = arguments[0];
-
-                // Pattern 1: button.sku-filter-button with span.label-name (need to click)
-                for (const btn of document.querySelectorAll('button.sku-filter-button')) {
-                    const label = btn.querySelector('span.label-name');
-                    if (label && label.textContent.trim() === targetLabel) {
-                        btn.scrollIntoView({ block: 'center' });
-                        const rect = btn.getBoundingClientRect();
-                        return {
-                            x: rect.x + rect.width / 2,
-                            y: rect.y + rect.height / 2,
-                            pattern: 'click'
-                        };
-                    }
-                }
-
-                // Pattern 2: div.v-flex with span.item-label - hover over the img
-                for (const div of document.querySelectorAll('div.v-flex')) {
-                    const label = div.querySelector('span.item-label');
-                    const img = div.querySelector('img.ant-image-img');
-                    if (label && label.textContent.trim() === targetLabel && img) {
-                        img.scrollIntoView({ block: 'center' });
-                        const rect = img.getBoundingClientRect();
-                        return {
-                            x: rect.x + rect.width / 2,
-                            y: rect.y + rect.height / 2,
-                            pattern: 'hover'
-                        };
-                    }
-                }
-
-                // Pattern 3: td.ant-table-cell > div.gyp-pro-table-title with <p> label and <img> - hover for popover
-                for (const title of document.querySelectorAll('div.gyp-pro-table-title')) {
-                    const p = title.querySelector('p');
-                    const img = title.querySelector('img');
-                    if (p && p.textContent.trim() === targetLabel && img) {
-                        img.scrollIntoView({ block: 'center' });
-                        const rect = img.getBoundingClientRect();
-                        return {
-                            x: rect.x + rect.width / 2,
-                            y: rect.y + rect.height / 2,
-                            pattern: 'hover_popover'
-                        };
-                    }
-                }
+        print(f"[{idx}/{total}] Product ID: {product_id} -- {product_name}")
+    except:
+        print(f"[{idx}/{total}] Product ID: {product_id} -- [encoding issue]")
+    print(f"  1688 sources: {len(url_groups)}")
+    print(f"{'='*60}")
+    sys.stdout.flush()
 
-                return null;  // Not found
-            """, first_word)
+    any_group_succeeded = False
 
-        if not button_info:
-            print(f"  [SKIP] {base_variation} (not found on page)")
-            result.append(None)
-            continue
+    for g_idx, (group_key, group_data) in enumerate(url_groups.items(), 1):
+        url = group_data["url"]
+        group_product_name = group_data["product_name_cn"]
+        group_variations = group_data["variations"]
+        ni_ids = group_data["new_items_ids"]
 
+        print(f"\n  --- Source {g_idx}/{len(url_groups)}: {group_key} ---")
         try:
-            human_delay(0.2, 0.6)  # Wait for scroll to settle
-
-            # Move to button coordinates with humanized movement
-            should_click = button_info['pattern'] == 'click'
-            human_move_and_click(driver, button_info['x'], button_info['y'], click=should_click)
-
-            human_delay(0.4, 1.2)  # Wait for gallery/popover to update
-
-            # Get the variation image based on pattern
-            if button_info['pattern'] == 'hover_popover':
-                # Pattern 3: read the last ant-popover image (each hover appends a new popover)
-                preview_url = driver.execute_script("""
-                    const popovers = document.querySelectorAll('.ant-popover-inner-content img');
-                    if (popovers.length === 0) return null;
-                    return popovers[popovers.length - 1].src;
-                """)
-            else:
-                # Pattern 1 & 2: read from gallery preview
-                preview_url = driver.execute_script("""
-                    const img = document.querySelector('.od-gallery-preview .od-gallery-list li:first-child img.preview-img');
-                    return img ? img.src : null;
-                """)
-
-            if preview_url:
-                result.append(preview_url)
-                seen_bases[base_variation] = preview_url  # Cache for duplicates
-                print(f"  [OK] {base_variation} -> URL found")
-            else:
-                result.append(None)
-                print(f"  [WARN] {base_variation} -> no preview image found")
+            print(f"  Product: {group_product_name}")
+        except:
+            print(f"  Product: [encoding issue]")
+        print(f"  URL: {url or '(none - will search by name)'}")
+        print(f"  Variations to scrape: {len(group_variations)}")
+        print(f"  new_items IDs: {ni_ids}")
 
+        # Navigate to the 1688 product page
+        try:
+            driver, nav_success = navigate_to_1688_product(
+                driver, url, group_product_name, rebuild_driver_fn
+            )
         except Exception as e:
-            print(f"  [ERROR] {base_variation} -> {e}")
-            result.append(None)
-
-    print(f"SKU images found: {sum(1 for x in result if x)}/{len(variations)}")
-
-    return result
+            print(f"  [ERROR] Navigation failed: {e}")
+            page_nav.record_nav("failed")
+            nav_success = False
 
+        if not nav_success:
+            print(f"  [FAIL] Could not reach 1688 page for source {group_key}")
+            continue
 
-# --- Fetch Gallery Images ---
-def fetch_gallery_images(driver):
-    """
-    Fetch product gallery image URLs from 1688 product page.
-
-    Args:
-        driver: Selenium WebDriver instance
-
-    Returns:
-        list: Array of image URLs [url1, url2, ...]
-    """
-    print(f"\nFetching gallery images...")
-
-    # Wait for gallery to load
-    human_delay(1.5, 4)
-
-    # Step 1: Scroll through gallery to load all images (handle lazy loading)
-    max_scroll_attempts = 50  # Safety limit
-    for _ in range(max_scroll_attempts):
-        # Check if scroll down button exists and is visible
-        can_scroll = driver.execute_script("""
-            const btn = document.querySelector('button.od-gallery-button-under');
-            if (!btn) return false;
-            const style = window.getComputedStyle(btn);
-            return style.visibility !== 'hidden' && style.display !== 'none';
-        """)
-
-        if not can_scroll:
-            break  # No more scrolling needed
-
-        # Click the scroll button
-        driver.execute_script("""
-            const btn = document.querySelector('button.od-gallery-button-under');
-            if (btn) btn.click();
-        """)
-
-        human_delay(0.2, 0.7)  # Wait for scroll animation and image loading
-
-    # Step 2: Now collect all gallery images
-    gallery_data = driver.execute_script("""
-        const images = [];
-        let skippedVideos = 0;
-
-        // Select all li items in the gallery list
-        const items = document.querySelectorAll('.od-gallery-list > li');
-
-        items.forEach((item) => {
-            // Skip video entries (contains .od-video-wrapper)
-            if (item.querySelector('.od-video-wrapper')) {
-                skippedVideos++;
-                return;
-            }
-
-            // Get the gallery image
-            const img = item.querySelector('img.ant-image-img.preview-img');
-            if (img && img.src) {
-                images.push(img.src);
-            }
-        });
-
-        return {
-            images: images,
-            skippedVideos: skippedVideos
-        };
-    """)
-
-    if not gallery_data or not gallery_data.get('images'):
-        print("  [WARN] No gallery images found on page")
-        return []
-
-    images = gallery_data['images']
-    skipped_videos = gallery_data.get('skippedVideos', 0)
-
-    if skipped_videos > 0:
-        print(f"  [DEBUG] Found {len(images)} gallery images (skipped {skipped_videos} video)")
+        # Fetch SKU variation images for this group's variations
+        variation_list_json = json.dumps(group_variations, ensure_ascii=False)
+        page = page_extract.extract_product_page(
+            driver, variation_list_json, human_move_and_click, gallery=False
+        )
+        variation_imgs = page["variation_imgs"]
+        description_imgs = page["description_imgs"]
+
+        # Write this group's data to shopee_listing_products + shopee_listing_variations
+        print(f"\n  Writing to shopee_listing_products + shopee_listing_variations...")
+        for ni_id in ni_ids:
+            rows_affected = update_existing_listing(
+                product_id,
+                ni_id,
+                url,                # 1688_url
+                group_product_name,
+                group_variations,
+                variation_imgs,
+                description_imgs if description_imgs else [],
+                item_date
+            )
+            if rows_affected > 0:
+                total_updated += 1
+
+        any_group_succeeded = True
+        print(f"  [OK] Source {group_key} done")
+
+        # Anti-detection delays between groups
+        if g_idx < len(url_groups):
+            pacing.POLICY.gap(driver, idle_fn=simulate_idle_browsing)
+
+    # After all groups for this product_id
+    if any_group_succeeded:
+        print(f"\n[SUCCESS] Product {product_id}: {len(url_groups)} source(s) processed")
     else:
-        print(f"  [DEBUG] Found {len(images)} gallery images")
-
-    print(f"Gallery images found: {len(images)}")
+        print(f"\n[FAIL] Product {product_id}: all sources failed")
+    return driver, any_group_succeeded, total_updated
 
-    return images
 
-
-# --- Fetch Description Content ---
-def fetch_description_content(driver):
+# --- Anti-Detection Pacing Between Products ---
+def pace_between_products(driver, idx, ok=True):
     """
-    Fetch product description content (text + images) from 1688 product page.
-
-    Args:
-        driver: Selenium WebDriver instance
-
-    Returns:
-        tuple: (description_imgs, description_txt) where:
-            - description_imgs: List of image URLs (max 40)
-            - description_txt: Combined text content as string
+    Gap, idle browsing and breaks after a product, as set by the pacing policy
+    (see pacing.py / SCRAPER_PACING_FILE). idx is kept for the caller's logs;
+    the policy counts products per browser itself.
+    Returns False once the account's risk budget says to stop.
     """
-    print(f"\nFetching description content...")
-
-    # Step 1: Scroll to #description section to trigger lazy loading
-    print("  [DEBUG] Scrolling to #description section...")
-    driver.execute_script("""
-        const descSection = document.querySelector('#description');
-        if (descSection) {
-            descSection.scrollIntoView({ behavior: 'instant', block: 'center' });
-        } else {
-            window.scrollTo(0, document.body.scrollHeight);
-        }
-    """)
-    human_delay(2, 5)
-
-    # Step 2: Wait for description component to be ready
-    print("  [DEBUG] Waiting for description component...")
-    max_wait = 10
-    for i in range(max_wait):
-        is_ready = driver.execute_script("""
-            const desc = document.querySelector('#description');
-            if (!desc) return 'no_description_section';
-            
-            const vDetail = desc.querySelector('.html-description');
-            if (!vDetail) return 'no_html-description';
-            if (!vDetail.shadowRoot) return 'no_shadow_root';
-            
-            const detail = vDetail.shadowRoot.querySelector('div#detail');
-            if (!detail) return 'no_detail_div';
-            if (detail.innerHTML.length < 100) return 'content_loading';
-            
-            return 'ready';
-        """)
-        
-        if is_ready == 'ready':
-            print(f"  [DEBUG] Description ready after {i+1} seconds")
-            break
-        else:
-            print(f"  [DEBUG] Status: {is_ready}, waiting...")
-            human_delay(0.8, 2)
-    else:
-        print(f"  [WARN] Description not ready after {max_wait} seconds")
-        return ([], None)
-
-    # Step 3: Extract content
-    description_data = driver.execute_script("""
-        const desc = document.querySelector('#description');
-        if (!desc) return { error: 'No #description section found' };
-        
-        const vDetail = desc.querySelector('.html-description');
-        if (!vDetail) return { error: 'No .html-description component found' };
-        if (!vDetail.shadowRoot) return { error: vDetail.tagName + ' has no shadow root' };
-
-        const detailDiv = vDetail.shadowRoot.querySelector('div#detail');
-        if (!detailDiv) return { error: 'No div#detail in shadow root' };
-
-        const rawContent = [];
-
-        // EXCLUDE these containers entirely (by selector)
-        const excludeSelectors = [
-            '.sdmap-dynamic-offer-list',
-            '.offer-list-wapper',
-            '.desc-dynamic-module',
-            '.rich-text-component'
-        ];
-        
-        const excludeImageClasses = ['dynamic-backup-img'];
-
-        function isInsideExcludedContainer(node) {
-            let current = node;
-            while (current && current !== detailDiv) {
-                if (current.nodeType === Node.ELEMENT_NODE) {
-                    for (const selector of excludeSelectors) {
-                        if (current.matches && current.matches(selector)) {
-                            return true;
-                        }
-                    }
-                }
-                current = current.parentElement;
-            }
-            return false;
-        }
-
-        function extractContent(node) {
-            if (isInsideExcludedContainer(node)) return;
-            
-            if (node.nodeType === Node.TEXT_NODE) {
-                const text = node.textContent.trim();
-                if (text && text !== '&nbsp;') {
-                    rawContent.push({ type: 'text', content: text });
-                }
-            } else if (node.nodeType === Node.ELEMENT_NODE) {
-                for (const selector of excludeSelectors) {
-                    if (node.matches && node.matches(selector)) return;
-                }
-                
-                if (node.tagName === 'IMG') {
-                    for (const cls of excludeImageClasses) {
-                        if (node.classList.contains(cls)) return;
-                    }
-                    
-                    const src = node.getAttribute('src');
-                    if (src && !src.startsWith('data:') && src.startsWith('http')) {
-                        rawContent.push({ type: 'image', content: src });
-                    }
-                } else {
-                    for (const child of node.childNodes) {
-                        extractContent(child);
-                    }
-                }
-            }
-        }
-
-        extractContent(detailDiv);
-
-        // Merge consecutive text blocks
-        const content = [];
-        let pendingTexts = [];
-    
-        for (const item of rawContent) {
-            if (item.type === 'text') {
-                pendingTexts.push(item.content);
-            } else {
-                if (pendingTexts.length > 0) {
-                    content.push({ type: 'text', content: pendingTexts.join('\\n') });
-                    pendingTexts = [];
-                }
-                content.push({ type: 'image', content: item.content });
-            }
-        }
-
-        if (pendingTexts.length > 0) {
-            content.push({ type: 'text', content: pendingTexts.join('\\n') });
-        }
+    return pacing.POLICY.pace(driver, ok, idle_fn=simulate_idle_browsing)
 
-        return {
-            component: vDetail.tagName,
-            content: content
-        };
-    """)
-
-    # Step 4: Process the result
-    if not description_data:
-        print("  [WARN] No description data returned")
-        return ([], None)
-
-    if 'error' in description_data:
-        print(f"  [WARN] {description_data['error']}")
-        return ([], None)
-
-    content = description_data.get('content', [])
-    component = description_data.get('component', 'unknown')
-
-    print(f"  [DEBUG] Component: {component}")
-
-    # Separate images and text
-    description_imgs = [c.get('content') for c in content if c.get('type') == 'image']
-    text_blocks = [c.get('content') for c in content if c.get('type') == 'text']
-    description_txt = '\n'.join(text_blocks) if text_blocks else None
-
-    print(f"  [DEBUG] Found {len(text_blocks)} text blocks and {len(description_imgs)} images")
-
-    if not content:
-        print("  [INFO] No description content found")
-        return ([], None)
-
-    print(f"Description: {len(description_imgs)} images, {len(text_blocks)} text blocks")
-
-    # Return tuple of (images_list, combined_text)
-    return (description_imgs, description_txt)
-
-
-# --- Check if Session Expired (quick check) ---
-def check_session_expired(driver):
-    """Quick check if redirected to login page. Returns True if session expired."""
-    try:
-        current_url = driver.current_url.lower()
-        if "login" in current_url or "passport" in current_url:
-            return True
-        # Check page source for login form
-        page_source = driver.page_source
-        if '\u8bf7\u8f93\u5165\u624b\u673a\u53f7' in page_source or 'fm-sms-login-id' in page_source:
-            return True
-        return False
-    except:
-        return False
 
 # --- Process All Products ---
 def process_products(driver, products_dict, profile_path):
@@ -1363,111 +907,88 @@ def process_products(driver, products_dict, profile_path):
         human_delay(2, 5)
         return new_driver
 
-    product_ids = list(products_dict.keys())
+    products = list(products_dict.items())
 
-    for p_idx, product_id in enumerate(product_ids, 1):
-        product_info = products_dict[product_id]
-        product_name = product_info["product_name_cn"]
-        item_date = product_info.get("item_date")
-        url_groups = product_info["url_groups"]
+    for p_idx, product in enumerate(products, 1):
+        driver, ok, rows_updated = process_product(driver, p_idx, len(products), product, rebuild_driver)
+        total_updated += rows_updated
+        if ok:
+            total_success += 1
+        else:
+            total_fail += 1
 
-        print(f"\n{'='*60}")
-        try:
-            print(f"[{p_idx}/{len(product_ids)}] Product ID: {product_id} -- {product_name}")
-        except:
-            print(f"[{p_idx}/{len(product_ids)}] Product ID: {product_id} -- [encoding issue]")
-        print(f"  1688 sources: {len(url_groups)}")
-        print(f"{'='*60}")
-        sys.stdout.flush()
+        # Anti-detection: delays between products
+        if not pace_between_products(driver, p_idx, ok):
+            print("\n[WARN] Pacing policy stopped the run.")
+            break
 
-        any_group_succeeded = False
+    return total_success, total_fail, total_updated
 
-        for g_idx, (group_key, group_data) in enumerate(url_groups.items(), 1):
-            url = group_data["url"]
-            group_product_name = group_data["product_name_cn"]
-            group_variations = group_data["variations"]
-            ni_ids = group_data["new_items_ids"]
+def run_pool(profile_path):
+    """Scrape with SCRAPER_WORKERS browsers, each on its own clone of profile_path."""
+    print(f"\n[INFO] Worker-pool mode: {browser_pool.POOL_WORKERS} browsers, profiles under {browser_pool.PROFILE_CLONE_DIR}")
+    print("[INFO] Make sure ALL Chrome windows using the source profile are CLOSED before the first run!")
 
-            print(f"\n  --- Source {g_idx}/{len(url_groups)}: {group_key} ---")
-            try:
-                print(f"  Product: {group_product_name}")
-            except:
-                print(f"  Product: [encoding issue]")
-            print(f"  URL: {url or '(none - will search by name)'}")
-            print(f"  Variations to scrape: {len(group_variations)}")
-            print(f"  new_items IDs: {ni_ids}")
+    try:
+        # Fetch products from database (grouped by product_id -> 1688 source)
+        print("\nFetching products from database...")
+        products_dict = get_product_names_from_db()
 
-            # Navigate to the 1688 product page
-            try:
-                driver, nav_success = navigate_to_1688_product(
-                    driver, url, group_product_name, rebuild_driver
-                )
-            except Exception as e:
-                print(f"  [ERROR] Navigation failed: {e}")
-                nav_success = False
-
-            if not nav_success:
-                print(f"  [FAIL] Could not reach 1688 page for source {group_key}")
-                continue
+        if not products_dict:
+            print("No products found in database. Exiting.")
+            return
 
-            # Fetch SKU variation images for this group's variations
-            variation_list_json = json.dumps(group_variations, ensure_ascii=False)
-            variation_imgs = fetch_sku_images(driver, variation_list_json)
-
-            # Fetch description content
-            description_imgs, _description_txt = fetch_description_content(driver)
-
-            # Write this group's data to shopee_listing_products + shopee_listing_variations
-            print(f"\n  Writing to shopee_listing_products + shopee_listing_variations...")
-            for ni_id in ni_ids:
-                rows_affected = update_existing_listing(
-                    product_id,
-                    ni_id,
-                    url,                # 1688_url
-                    group_product_name,
-                    group_variations,
-                    variation_imgs,
-                    description_imgs if description_imgs else [],
-                    item_date
-                )
-                if rows_affected > 0:
-                    total_updated += 1
-
-            any_group_succeeded = True
-            print(f"  [OK] Source {group_key} done")
-
-            # Anti-detection delays between groups
-            if g_idx < len(url_groups):
-                human_delay(4, 10)
-                if random.random() < 0.3:
-                    print("  [IDLE] Simulating idle browsing...")
-                    simulate_idle_browsing(driver)
-
-        # After all groups for this product_id
-        if any_group_succeeded:
-            print(f"\n[SUCCESS] Product {product_id}: {len(url_groups)} source(s) processed")
-            total_success += 1
-        else:
-            print(f"\n[FAIL] Product {product_id}: all sources failed")
-            total_fail += 1
+        print_first_products(products_dict)
 
-        # Anti-detection: delays between products
-        human_delay(4, 10)
-        if random.random() < 0.3:
-            print("  [IDLE] Simulating idle browsing...")
-            simulate_idle_browsing(driver)
-
-        # Batch breaks
-        if p_idx % 15 == 0:
-            pause = random.uniform(300, 600)
-            print(f"\n[PAUSE] Long break after {p_idx} products ({pause:.0f}s)...")
-            time.sleep(pause)
-        elif p_idx % 5 == 0:
-            pause = random.uniform(120, 300)
-            print(f"\n[PAUSE] Short break after {p_idx} products ({pause:.0f}s)...")
-            time.sleep(pause)
+        # One queue item per product_id so all of its 1688 sources stay on one browser
+        total_success, total_fail, total_updated = browser_pool.run_worker_pool(
+            list(products_dict.items()), profile_path, browser_pool.POOL_WORKERS,
+            setup_driver=setup_driver,
+            login_check=check_1688_login,
+            process_item=process_product,
+            pace=pace_between_products,
+        )
+        print_summary(products_dict, total_success, total_fail, total_updated)
 
-    return total_success, total_fail, total_updated
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        print("\nScript completed.")
+
+
+def print_first_products(products_dict):
+    total_urls = sum(len(p["url_groups"]) for p in products_dict.values())
+    print(f"Found {len(products_dict)} products with {total_urls} 1688 sources to process.")
+    sys.stdout.flush()
+
+    # Debug: print first few products
+    print("\n[DEBUG] First 3 products:")
+    for i, (pid, info) in enumerate(list(products_dict.items())[:3]):
+        try:
+            print(f"  {i+1}. Product ID: {pid} -- {info['product_name_cn']}")
+            print(f"      Date: {info.get('item_date')}")
+            for gk, gd in info['url_groups'].items():
+                print(f"      Source: {gk} -> {len(gd['variations'])} variations, IDs: {gd['new_items_ids']}")
+        except:
+            print(f"  {i+1}. Product ID: {pid} -- [encoding error]")
+    sys.stdout.flush()
+
+
+def print_summary(products_dict, total_success, total_fail, total_updated):
+    total_urls = sum(len(p["url_groups"]) for p in products_dict.values())
+    print("\n" + "="*60)
+    print("SUMMARY")
+    print("="*60)
+    print(f"Total Products: {len(products_dict)}")
+    print(f"Total 1688 Sources: {total_urls}")
+    print(f"Success: {total_success}")
+    print(f"Failed: {total_fail}")
+    print(f"Rows Updated: {total_updated}")
+    page_nav.print_nav_stats()
+    page_waits.WAIT_STATS.print_summary()
+    pacing.POLICY.print_summary()
 
 def main():
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -1481,6 +1002,10 @@ def main():
     print("="*60)
     print("Data will be saved to: requestDatabase.shopee_listing_products + shopee_listing_variations")
 
+    if browser_pool.POOL_WORKERS > 1:
+        run_pool(profile_path)
+        return
+
     # Setup driver with profile
     print("\nStarting Chrome with profile...")
     print("[INFO] Make sure ALL Chrome windows are CLOSED before running!")
@@ -1502,34 +1027,11 @@ def main():
             print("No products found in database. Exiting.")
             return
 
-        total_urls = sum(len(p["url_groups"]) for p in products_dict.values())
-        print(f"Found {len(products_dict)} products with {total_urls} 1688 sources to process.")
-        sys.stdout.flush()
-
-        # Debug: print first few products
-        print("\n[DEBUG] First 3 products:")
-        for i, (pid, info) in enumerate(list(products_dict.items())[:3]):
-            try:
-                print(f"  {i+1}. Product ID: {pid} -- {info['product_name_cn']}")
-                print(f"      Date: {info.get('item_date')}")
-                for gk, gd in info['url_groups'].items():
-                    print(f"      Source: {gk} -> {len(gd['variations'])} variations, IDs: {gd['new_items_ids']}")
-            except:
-                print(f"  {i+1}. Product ID: {pid} -- [encoding error]")
-        sys.stdout.flush()
+        print_first_products(products_dict)
 
         # Process all products
         total_success, total_fail, total_updated = process_products(driver, products_dict, profile_path)
-
-        # Summary
-        print("\n" + "="*60)
-        print("SUMMARY")
-        print("="*60)
-        print(f"Total Products: {len(products_dict)}")
-        print(f"Total 1688 Sources: {total_urls}")
-        print(f"Success: {total_success}")
-        print(f"Failed: {total_fail}")
-        print(f"Rows Updated: {total_updated}")
+        print_summary(products_dict, total_success, total_fail, total_updated)
 
     except Exception as e:
         logging.error(f"Unexpected error: {e}")
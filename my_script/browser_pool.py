@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+"""
+Multi-browser worker pool for the 1688 scrapers.
+
+Chrome locks a user-data-dir to a single process, so each worker gets its own
+copy of the logged-in profile (cloned once, then reused across runs so any
+re-login sticks) and drives its own undetected_chromedriver instance. Workers
+pull products from one shared queue, so a slow or crashed browser never holds
+up the others. Pacing goes through the scraper's pace callback (see pacing.py).
+
+Usage (from a scraper):
+    import browser_pool
+
+    success, fail, rows = browser_pool.run_worker_pool(
+        products, profile_path, browser_pool.POOL_WORKERS,
+        setup_driver=setup_driver,
+        login_check=check_1688_login,
+        process_item=process_product,   # (driver, idx, total, item, rebuild_fn) -> (driver, ok, rows)
+        pace=pace_between_products,     # (driver, worker_done, ok) -> False to stop the worker
+    )
+
+Configuration (environment):
+    SCRAPER_WORKERS         number of browsers (1 = the scrapers' classic single-browser loop)
+    SCRAPER_PROFILE_DIR     where worker profiles are cloned (default ~/1688_scraper_profiles)
+    SCRAPER_REFRESH_PROFILES=1  re-copy the source profile over existing clones
+"""
+
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+POOL_WORKERS = max(1, int(os.environ.get("SCRAPER_WORKERS", "1")))
+PROFILE_CLONE_DIR = os.environ.get(
+    "SCRAPER_PROFILE_DIR", os.path.join(os.path.expanduser("~"), "1688_scraper_profiles")
+)
+REFRESH_PROFILES = os.environ.get("SCRAPER_REFRESH_PROFILES", "0") == "1"
+
+# Seconds between worker start-ups so N browsers don't hit 1688 in the same instant
+WORKER_START_STAGGER = (20, 60)
+
+# Lock files a running Chrome leaves behind and caches not worth copying
+_CLONE_IGNORE = shutil.ignore_patterns(
+    "Singleton*", "lockfile", "*.tmp",
+    "Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "DawnCache", "Crashpad",
+)
+
+# undetected_chromedriver patches one shared chromedriver binary on start-up;
+# creating drivers concurrently races on that file
+_DRIVER_LOCK = threading.Lock()
+
+
+# =========================
+# PROFILES
+# =========================
+
+def clone_profile(profile_path: str, worker_no: int, refresh: bool = REFRESH_PROFILES) -> str:
+    """
+    Return a private copy of profile_path for worker_no, copying it on first use.
+    Existing clones are reused (they keep their own cookies) unless refresh is set.
+    """
+    dest = os.path.join(PROFILE_CLONE_DIR, f"worker-{worker_no}")
+    if os.path.isdir(dest) and not refresh:
+        return dest
+
+    print(f"[INFO] Cloning Chrome profile for worker {worker_no} -> {dest}")
+    try:
+        shutil.copytree(profile_path, dest, ignore=_CLONE_IGNORE, dirs_exist_ok=True)
+    except shutil.Error as e:
+        # Files held open by a running Chrome can't be copied; the rest of the profile is usable
+        print(f"[WARN] Worker {worker_no}: {len(e.args[0])} profile file(s) could not be copied")
+    return dest
+
+
+def new_driver(setup_driver: Callable[[str], Any], profile_dir: str):
+    """Start a browser on profile_dir, one at a time across the pool."""
+    with _DRIVER_LOCK:
+        return setup_driver(profile_dir)
+
+
+# =========================
+# POOL
+# =========================
+
+class PoolStats:
+    """Thread-safe success/fail/row totals, overall and per worker."""
+
+    def __init__(self):
+        self.success = 0
+        self.fail = 0
+        self.rows = 0
+        self.by_worker: Dict[int, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, worker_no: int, ok: bool, rows: int) -> None:
+        with self._lock:
+            per = self.by_worker.setdefault(worker_no, {"success": 0, "fail": 0, "rows": 0})
+            key = "success" if ok else "fail"
+            per[key] += 1
+            per["rows"] += rows
+            if ok:
+                self.success += 1
+            else:
+                self.fail += 1
+            self.rows += rows
+
+
+def _worker(worker_no: int, profile_path: str, work: "queue.Queue[Tuple[int, Any]]", total: int,
+            stats: PoolStats, setup_driver, login_check, process_item, pace) -> None:
+    tag = f"[W{worker_no}]"
+    if worker_no > 1:
+        delay = random.uniform(*WORKER_START_STAGGER) * (worker_no - 1)
+        print(f"{tag} Starting in {delay:.0f}s")
+        time.sleep(delay)
+
+    profile_dir = clone_profile(profile_path, worker_no)
+
+    def rebuild_driver():
+        print(f"  {tag} [INFO] Creating new browser instance...")
+        driver = new_driver(setup_driver, profile_dir)
+        time.sleep(random.uniform(2, 5))
+        return driver
+
+    try:
+        driver = new_driver(setup_driver, profile_dir)
+    except Exception as e:
+        print(f"{tag} [ERROR] Could not start browser: {e}")
+        return
+
+    try:
+        if not login_check(driver):
+            # Leave the queue to the workers that are logged in
+            print(f"{tag} [ERROR] Not logged in to 1688 with {profile_dir}; worker exiting.")
+            return
+
+        done = 0
+        while True:
+            try:
+                idx, item = work.get_nowait()
+            except queue.Empty:
+                break
+
+            print(f"\n{tag} picked up item {idx}/{total} ({work.qsize()} left in queue)")
+            try:
+                driver, ok, rows = process_item(driver, idx, total, item, rebuild_driver)
+            except Exception as e:
+                print(f"{tag} [ERROR] Item {idx} failed: {e}")
+                ok, rows = False, 0
+            stats.record(worker_no, ok, rows)
+
+            done += 1
+            if not work.empty() and pace(driver, done, ok) is False:
+                print(f"{tag} Pacing policy stopped this worker")
+                break
+
+        print(f"{tag} Queue drained after {done} item(s)")
+    finally:
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+def run_worker_pool(items: Sequence[Any], profile_path: str, workers: int,
+                    setup_driver: Callable[[str], Any],
+                    login_check: Callable[[Any], bool],
+                    process_item: Callable[..., Tuple[Any, bool, int]],
+                    pace: Callable[[Any, int, bool], Any]) -> Tuple[int, int, int]:
+    """
+    Process items across `workers` browsers sharing one queue.
+    Returns (success, fail, rows) like the scrapers' process_products();
+    items no worker got to (every browser failed its login check, or pacing
+    stopped the run) count as failed.
+    """
+    total = len(items)
+    work: "queue.Queue[Tuple[int, Any]]" = queue.Queue()
+    for idx, item in enumerate(items, 1):
+        work.put((idx, item))
+
+    workers = max(1, min(workers, total))
+    stats = PoolStats()
+    print(f"[INFO] Starting {workers} browser worker(s) for {total} item(s)")
+
+    threads: List[threading.Thread] = []
+    for worker_no in range(1, workers + 1):
+        t = threading.Thread(
+            target=_worker,
+            args=(worker_no, profile_path, work, total, stats, setup_driver, login_check, process_item, pace),
+            name=f"browser-worker-{worker_no}",
+            daemon=True,
+        )
+        t.start()
+        threads.append(t)
+    for t in threads:
+        t.join()
+
+    unprocessed = work.qsize()
+    if unprocessed:
+        print(f"[WARN] {unprocessed} item(s) left unprocessed (no worker remained to take them)")
+
+    print("\nPer-worker results:")
+    for worker_no in sorted(stats.by_worker):
+        per = stats.by_worker[worker_no]
+        print(f"  W{worker_no}: {per['success']} ok, {per['fail']} failed, {per['rows']} row(s)")
+
+    return stats.success, stats.fail + unprocessed, stats.rows
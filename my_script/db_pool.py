@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared MySQL connection pool for shopee_api.py and the 1688 scrapers.
+
+All scripts talk to the same requestDatabase with the same credentials, so they
+share one config and one mysql.connector pool per process instead of opening a
+fresh connection for every query.
+
+Usage:
+    import db_pool
+
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        ...
+
+    conn = db_pool.get_connection()   # caller must conn.close() to return it
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from mysql.connector import pooling
+from mysql.connector import Error as MySQLError
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+DB_CFG = dict(
+    host=os.environ.get("DB_HOST", "localhost"),
+    user="root",
+    password=os.environ["DB_PASSWORD"],
+    database="requestDatabase",
+    port=int(os.environ.get("DB_PORT", "3306")),
+)
+
+# mysql.connector caps a pool at 32 connections
+POOL_SIZE = max(1, min(int(os.environ.get("DB_POOL_SIZE", "5")), pooling.CNX_POOL_MAXSIZE))
+POOL_NAME = "requestDatabase"
+
+# How long get_connection() waits for a free connection before giving up
+POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+
+# =========================
+# POOL
+# =========================
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool() -> pooling.MySQLConnectionPool:
+    """Create the process-wide pool on first use."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = pooling.MySQLConnectionPool(
+                    pool_name=POOL_NAME,
+                    pool_size=POOL_SIZE,
+                    pool_reset_session=True,
+                    **DB_CFG,
+                )
+                print(f"[INFO] MySQL pool '{POOL_NAME}' ready ({POOL_SIZE} connection(s))")
+    return _POOL
+
+
+def get_connection():
+    """
+    Check out a health-checked connection from the pool.
+    Blocks up to POOL_CHECKOUT_TIMEOUT seconds when every connection is in use.
+    Call close() on the returned connection to hand it back to the pool.
+    """
+    pool = _get_pool()
+    deadline = time.monotonic() + POOL_CHECKOUT_TIMEOUT
+    while True:
+        try:
+            conn = pool.get_connection()
+        except pooling.PoolError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+            continue
+
+        try:
+            # Reconnects a connection the server dropped while it sat idle
+            conn.ping(reconnect=True, attempts=2, delay=1)
+            return conn
+        except MySQLError as e:
+            print(f"[WARN] Discarding unhealthy pooled connection: {e}")
+            try:
+                conn.close()
+            except MySQLError:
+                pass
+            if time.monotonic() >= deadline:
+                raise
+
+
+@contextmanager
+def connection():
+    """Context manager around get_connection() that always returns the connection."""
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""
+Anti-detection pacing policy for the 1688 scrapers.
+
+Decides how long a browser waits between products: the gap, the occasional
+idle browsing, periodic short/long breaks and cool-downs after risk signals.
+Settings come from configuration instead of being hard-coded in the loops:
+
+  * target_per_hour spaces product starts across the whole account (all pool
+    workers clone the same logged-in profile, so they share one schedule)
+  * max_per_hour / max_per_day are the account's hard risk budget
+  * risk signals (login redirects, offer URLs that load without any product
+    elements) raise a caution factor that stretches every delay and pause the
+    whole account for a cool-down; successes decay it back (multiplicative
+    back-off, additive recovery, like shopee_api's RateLimiter)
+  * too many back-offs in an hour stops the run rather than burn the account
+
+The defaults reproduce the scrapers' previous fixed behaviour (4-10s gaps, 30%
+idle browsing, 120-300s every 5 and 300-600s every 15 products) and never
+stop a run: every signal weight is 0 and max_per_hour, max_per_day and
+max_signals_per_hour are unset. Once configured, a run stops early when
+max_per_day is reached or when back-offs exceed max_signals_per_hour;
+a failed product on its own is never a risk signal.
+
+Configuration:
+    SCRAPER_PACING_FILE   JSON file (default scraper_pacing.json next to this script):
+                          {"default": {...}, "accounts": {"<name>": {...}}}
+    SCRAPER_ACCOUNT       which "accounts" entry to layer over "default"
+
+Usage:
+    import pacing
+
+    pacing.POLICY.mark_work_start()              # top of process_product
+    pacing.POLICY.signal("login_redirect")       # when check_session_expired() fires
+    pacing.POLICY.signal("empty_result")         # offer URL loaded without product elements
+    if not pacing.POLICY.pace(driver, ok, idle_fn=simulate_idle_browsing):
+        ...  # risk budget exhausted, stop this run
+    pacing.POLICY.print_summary()
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+PACING_FILE = os.environ.get(
+    "SCRAPER_PACING_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scraper_pacing.json")
+)
+ACCOUNT = os.environ.get("SCRAPER_ACCOUNT", "default")
+
+DEFAULT_SETTINGS: Dict[str, Any] = {
+    # Account-wide product starts per hour; None = gap-only pacing
+    "target_per_hour": None,
+    # Per-worker gap after each product (seconds, scaled by caution)
+    "min_gap_seconds": 4,
+    "max_gap_seconds": 10,
+    "idle_chance": 0.3,
+    # Per-worker batch breaks (0 disables)
+    "break_every": 5,
+    "break_seconds": [120, 300],
+    "long_break_every": 15,
+    "long_break_seconds": [300, 600],
+    # Hard risk budget for the account (None = unlimited)
+    "max_per_hour": None,
+    "max_per_day": None,
+    # Adaptation to risk signals (weight 1.0 = one signal triggers a back-off; 0 = ignored)
+    "signal_weights": {"login_redirect": 0.0, "empty_result": 0.0},
+    "cooldown_seconds": [300, 900],
+    "backoff_factor": 2.0,
+    "max_caution": 8.0,
+    "recovery_step": 0.1,
+    # Back-offs within an hour before the run stops (None = never stop)
+    "max_signals_per_hour": None,
+}
+
+
+def load_settings(path: str = PACING_FILE, account: str = ACCOUNT) -> Dict[str, Any]:
+    """DEFAULT_SETTINGS overlaid with the file's "default" block, then the account's block."""
+    settings = dict(DEFAULT_SETTINGS)
+    if not os.path.exists(path):
+        return settings
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"[WARN] Could not read pacing config {path}: {e}; using defaults")
+        return settings
+
+    layers = [data.get("default", {})]
+    if account != "default":
+        if account not in data.get("accounts", {}):
+            print(f"[WARN] Pacing config has no account '{account}'; using its default block")
+        layers.append(data.get("accounts", {}).get(account, {}))
+
+    for layer in layers:
+        for key, value in layer.items():
+            if key not in DEFAULT_SETTINGS:
+                print(f"[WARN] Unknown pacing setting '{key}' ignored")
+                continue
+            settings[key] = value
+    return settings
+
+
+# =========================
+# POLICY
+# =========================
+
+class PacingPolicy:
+    """Thread-safe pacing for one account, shared by every browser worker using it."""
+
+    def __init__(self, account: str, settings: Dict[str, Any]):
+        self.account = account
+        self.settings = settings
+        self.caution = 1.0
+
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._starts_hour: Deque[float] = deque()
+        self._starts_day: Deque[float] = deque()
+        self._signal_times: Deque[float] = deque()
+        self._pressure = 0.0
+        self._resume_at = 0.0
+        self._stopped = False
+
+        # Per worker thread: when its current product started and how many it has done
+        self._work_start: Dict[int, float] = {}
+        self._done: Dict[int, int] = {}
+
+        self.products = 0
+        self.work_seconds = 0.0
+        self.pacing_seconds = 0.0
+        self.pacing_by_kind: Dict[str, float] = {}
+        self.signals: Dict[str, int] = {}
+        self.backoffs = 0
+        self._started = time.monotonic()
+
+    # ----- signals -----
+
+    def signal(self, kind: str) -> None:
+        """Record a risk signal; enough weight triggers a back-off and cool-down."""
+        weight = self.settings["signal_weights"].get(kind, 0.0)
+        with self._lock:
+            self.signals[kind] = self.signals.get(kind, 0) + 1
+            self._pressure += weight
+            if weight <= 0 or self._pressure < 1.0:
+                return
+            self._pressure = 0.0
+            self._back_off_locked(kind)
+
+    def _back_off_locked(self, kind: str) -> None:
+        now = time.monotonic()
+        self.backoffs += 1
+        self.caution = min(self.caution * self.settings["backoff_factor"], self.settings["max_caution"])
+        # Cool-down holds every worker on the account, not just the one that saw the signal
+        pause = self._uniform(self.settings["cooldown_seconds"])
+        self._resume_at = max(self._resume_at, now + pause)
+
+        self._signal_times.append(now)
+        while self._signal_times and now - self._signal_times[0] > 3600:
+            self._signal_times.popleft()
+        limit = self.settings["max_signals_per_hour"]
+        if limit and len(self._signal_times) > limit:
+            self._stopped = True
+            print(f"[ERROR] Pacing: {len(self._signal_times)} risk back-offs within an hour "
+                  f"(limit {limit}) for account '{self.account}'; stopping.")
+        else:
+            print(f"  [PACING] Risk signal '{kind}' -> caution x{self.caution:.2f}, {pause:.0f}s cool-down")
+
+    def _recover_locked(self) -> None:
+        # Additive decrease of caution on every successful product
+        self._pressure = 0.0
+        self.caution = max(1.0, self.caution - self.settings["recovery_step"])
+
+    # ----- timing -----
+
+    def mark_work_start(self) -> None:
+        """Called when a worker begins a product; the time until pace() counts as work."""
+        tid = threading.get_ident()
+        with self._lock:
+            self._work_start.setdefault(tid, time.monotonic())
+
+    def _sleep(self, seconds: float, kind: str) -> None:
+        if seconds <= 0:
+            return
+        time.sleep(seconds)
+        with self._lock:
+            self.pacing_seconds += seconds
+            self.pacing_by_kind[kind] = self.pacing_by_kind.get(kind, 0.0) + seconds
+
+    def _maybe_idle(self, driver, idle_fn) -> None:
+        if idle_fn is None or driver is None or random.random() >= self.settings["idle_chance"]:
+            return
+        print("  [IDLE] Simulating idle browsing...")
+        start = time.monotonic()
+        idle_fn(driver)
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.pacing_seconds += elapsed
+            self.pacing_by_kind["idle"] = self.pacing_by_kind.get("idle", 0.0) + elapsed
+
+    def _uniform(self, bounds) -> float:
+        low, high = bounds
+        return random.uniform(low, high) * self.caution
+
+    def _reserve_slot_locked(self, now: float, gap: float) -> float:
+        """Earliest time this worker may start its next product under the account-wide target."""
+        start = max(now + gap, self._resume_at)
+        target = self.settings["target_per_hour"]
+        if target:
+            interval = 3600.0 / target * self.caution * random.uniform(0.7, 1.3)
+            start = max(start, self._next_slot)
+            self._next_slot = start + interval
+        return start
+
+    def _budget_wait_locked(self, at: float) -> Optional[float]:
+        """Extra seconds needed to stay inside max_per_hour; None when max_per_day is spent."""
+        while self._starts_hour and at - self._starts_hour[0] > 3600:
+            self._starts_hour.popleft()
+        while self._starts_day and at - self._starts_day[0] > 86400:
+            self._starts_day.popleft()
+
+        per_day = self.settings["max_per_day"]
+        if per_day and len(self._starts_day) >= per_day:
+            return None
+        per_hour = self.settings["max_per_hour"]
+        if per_hour and len(self._starts_hour) >= per_hour:
+            return self._starts_hour[0] + 3600 - at
+        return 0.0
+
+    def pace(self, driver=None, ok: bool = True, idle_fn: Optional[Callable[[Any], None]] = None) -> bool:
+        """
+        Sleep between products for the calling worker.
+        Returns False when the account's risk budget is spent and the run should stop.
+        """
+        tid = threading.get_ident()
+        now = time.monotonic()
+        with self._lock:
+            self.products += 1
+            self.work_seconds += now - self._work_start.pop(tid, now)
+            done = self._done[tid] = self._done.get(tid, 0) + 1
+            if ok:
+                self._recover_locked()
+            if self._stopped:
+                return False
+
+        # Idle browsing to break predictable patterns
+        self._maybe_idle(driver, idle_fn)
+
+        # Batch breaks to avoid sustained rapid activity
+        long_every, short_every = self.settings["long_break_every"], self.settings["break_every"]
+        if long_every and done % long_every == 0:
+            pause = self._uniform(self.settings["long_break_seconds"])
+            print(f"\n[PAUSE] Long break after {done} products ({pause:.0f}s)...")
+            self._sleep(pause, "long_break")
+        elif short_every and done % short_every == 0:
+            pause = self._uniform(self.settings["break_seconds"])
+            print(f"\n[PAUSE] Short break after {done} products ({pause:.0f}s)...")
+            self._sleep(pause, "break")
+
+        # Gap + account-wide schedule + hourly/daily budget
+        gap = self._uniform((self.settings["min_gap_seconds"], self.settings["max_gap_seconds"]))
+        with self._lock:
+            now = time.monotonic()
+            start = self._reserve_slot_locked(now, gap)
+            cooling = start > now + gap and start <= self._resume_at
+            budget_wait = self._budget_wait_locked(start)
+            if budget_wait is None:
+                print(f"[WARN] Pacing: max_per_day ({self.settings['max_per_day']}) reached "
+                      f"for account '{self.account}'; stopping.")
+                self._stopped = True
+                return False
+            start += budget_wait
+            self._starts_hour.append(start)
+            self._starts_day.append(start)
+
+        if budget_wait > 0:
+            print(f"\n[PACING] Hourly budget ({self.settings['max_per_hour']}) reached; waiting {budget_wait:.0f}s...")
+            kind = "budget"
+        elif cooling:
+            print(f"\n[PACING] Cool-down after risk signal ({start - now:.0f}s)...")
+            kind = "cooldown"
+        else:
+            kind = "gap"
+        self._sleep(start - now, kind)
+
+        with self._lock:
+            self._work_start[tid] = time.monotonic()
+            return not self._stopped
+
+    def gap(self, driver=None, idle_fn: Optional[Callable[[Any], None]] = None) -> None:
+        """Short gap between page visits inside one product (e.g. several 1688 sources)."""
+        gap = self._uniform((self.settings["min_gap_seconds"], self.settings["max_gap_seconds"]))
+        with self._lock:
+            gap = max(gap, self._resume_at - time.monotonic())
+        self._sleep(gap, "gap")
+        self._maybe_idle(driver, idle_fn)
+
+    # ----- reporting -----
+
+    def print_summary(self) -> None:
+        with self._lock:
+            total = self.work_seconds + self.pacing_seconds
+            wall = time.monotonic() - self._started
+            print(f"\nPACING (account '{self.account}')")
+            if total > 0:
+                print(f"  Working: {self.work_seconds:.0f}s ({self.work_seconds / total:.0%})  "
+                      f"Pacing: {self.pacing_seconds:.0f}s ({self.pacing_seconds / total:.0%})")
+            for kind, seconds in sorted(self.pacing_by_kind.items()):
+                print(f"    {kind}: {seconds:.0f}s")
+            if wall > 0 and self.products:
+                print(f"  Effective rate: {self.products / wall * 3600:.1f} products/hour "
+                      f"(target {self.settings['target_per_hour'] or 'n/a'})")
+            print(f"  Risk signals: {self.signals or 'none'}, back-offs: {self.backoffs}, caution now x{self.caution:.2f}")
+
+
+def load_policy(account: str = ACCOUNT) -> PacingPolicy:
+    return PacingPolicy(account, load_settings(account=account))
+
+
+POLICY = load_policy()
@@ -0,0 +1,536 @@
+# -*- coding: utf-8 -*-
+
+"""
+Single-pass product page extraction for the 1688 scrapers.
+
+The old fetch_gallery_images / fetch_sku_images / fetch_description_content
+each drove the page one small execute_script at a time: up to 50 polls of the
+gallery scroll button, a readiness poll loop for the description, and several
+locate/read calls per SKU. Every call is a WebDriver round trip.
+
+extract_product_page() injects one async JS bundle that, inside the page:
+  * waits for the gallery, scrolls it to the end and collects the image URLs
+  * scrolls to #description, waits for div#detail and extracts text + images
+  * resolves every SKU label to the selector layout that holds it
+and returns all of it as one structured result. Only the SKU preview images
+still need per-variation work, since they appear only after a real (trusted)
+mouse click/hover; each of those is one locate call, the mouse action and one
+readiness wait.
+
+Usage:
+    import page_extract
+
+    page = page_extract.extract_product_page(driver, variation_list_cn, human_move_and_click)
+    page["gallery_urls"], page["variation_imgs"], page["description_imgs"], page["description_txt"]
+"""
+
+import json
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from selenium.common.exceptions import JavascriptException, TimeoutException, WebDriverException
+
+import page_waits
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+GALLERY_TIMEOUT_MS = 10000
+SKU_TIMEOUT_MS = 8000
+DESCRIPTION_TIMEOUT_MS = 15000
+# Pause between gallery scroll-button clicks (animation + lazy image load)
+GALLERY_SCROLL_PAUSE_MS = 250
+GALLERY_MAX_SCROLLS = 50
+
+
+# =========================
+# JS BUNDLE
+# =========================
+
+# Shared by the bundle and the per-variation locate call
+_SKU_FINDER = """
+function findSkuElement(targetLabel) {
+    // Pattern 1: button.sku-filter-button with span.label-name (need to click)
+    for (const btn of document.querySelectorAll('button.sku-filter-button')) {
+        const label = btn.querySelector('span.label-name');
+        if (label && label.textContent.trim() === targetLabel) return {el: btn, pattern: 'click'};
+    }
+
+    // Pattern 2: div.v-flex with span.item-label - hover over the img
+    for (const div of document.querySelectorAll('div.v-flex')) {
+        const label = div.querySelector('span.item-label');
+        const img = div.querySelector('img.ant-image-img');
+        if (label && label.textContent.trim() === targetLabel && img) return {el: img, pattern: 'hover'};
+    }
+
+    // Pattern 3: td.ant-table-cell > div.gyp-pro-table-title with <p> label and <img> - hover for popover
+    for (const title of document.querySelectorAll('div.gyp-pro-table-title')) {
+        const p = title.querySelector('p');
+        const img = title.querySelector('img');
+        if (p && p.textContent.trim() === targetLabel && img) return {el: img, pattern: 'hover_popover'};
+    }
+
+    return null;
+}
+"""
+
+_PAGE_SCRIPT = _SKU_FINDER + """
+const done = arguments[arguments.length - 1];
+const opts = arguments[0];
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+async function waitFor(fn, timeoutMs) {
+    const end = Date.now() + timeoutMs;
+    while (Date.now() < end) {
+        const value = fn();
+        if (value) return value;
+        await sleep(100);
+    }
+    return fn();
+}
+
+async function collectGallery() {
+    const started = Date.now();
+    const ready = await waitFor(() => document.querySelector('.od-gallery-list > li img.preview-img'), opts.galleryTimeoutMs);
+
+    // Scroll through gallery to load all images (handle lazy loading)
+    let scrolls = 0;
+    for (; scrolls < opts.galleryMaxScrolls; scrolls++) {
+        const btn = document.querySelector('button.od-gallery-button-under');
+        if (!btn) break;
+        const style = window.getComputedStyle(btn);
+        if (style.visibility === 'hidden' || style.display === 'none') break;
+        btn.click();
+        await sleep(opts.galleryScrollPauseMs);
+    }
+
+    const images = [];
+    let skippedVideos = 0;
+    document.querySelectorAll('.od-gallery-list > li').forEach((item) => {
+        // Skip video entries (contains .od-video-wrapper)
+        if (item.querySelector('.od-video-wrapper')) {
+            skippedVideos++;
+            return;
+        }
+        const img = item.querySelector('img.ant-image-img.preview-img');
+        if (img && img.src) images.push(img.src);
+    });
+
+    return {ready: !!ready, images: images, skippedVideos: skippedVideos, scrolls: scrolls, ms: Date.now() - started};
+}
+
+function descriptionStatus() {
+    const desc = document.querySelector('#description');
+    if (!desc) return 'no_description_section';
+    const vDetail = desc.querySelector('.html-description');
+    if (!vDetail) return 'no_html-description';
+    if (!vDetail.shadowRoot) return 'no_shadow_root';
+    const detail = vDetail.shadowRoot.querySelector('div#detail');
+    if (!detail) return 'no_detail_div';
+    if (detail.innerHTML.length < 100) return 'content_loading';
+    return 'ready';
+}
+
+function extractDescription() {
+    const desc = document.querySelector('#description');
+    if (!desc) return { error: 'No #description section found' };
+
+    const vDetail = desc.querySelector('.html-description');
+    if (!vDetail) return { error: 'No .html-description component found' };
+    if (!vDetail.shadowRoot) return { error: vDetail.tagName + ' has no shadow root' };
+
+    const detailDiv = vDetail.shadowRoot.querySelector('div#detail');
+    if (!detailDiv) return { error: 'No div#detail in shadow root' };
+
+    const rawContent = [];
+
+    // EXCLUDE these containers entirely (by selector)
+    const excludeSelectors = [
+        '.sdmap-dynamic-offer-list',
+        '.offer-list-wapper',
+        '.desc-dynamic-module',
+        '.rich-text-component'
+    ];
+
+    const excludeImageClasses = ['dynamic-backup-img'];
+
+    function isInsideExcludedContainer(node) {
+        let current = node;
+        while (current && current !== detailDiv) {
+            if (current.nodeType === Node.ELEMENT_NODE) {
+                for (const selector of excludeSelectors) {
+                    if (current.matches && current.matches(selector)) {
+                        return true;
+                    }
+                }
+            }
+            current = current.parentElement;
+        }
+        return false;
+    }
+
+    function extractContent(node) {
+        if (isInsideExcludedContainer(node)) return;
+
+        if (node.nodeType === Node.TEXT_NODE) {
+            const text = node.textContent.trim();
+            if (text && text !== '&nbsp;') {
+                rawContent.push({ type: 'text', content: text });
+            }
+        } else if (node.nodeType === Node.ELEMENT_NODE) {
+            for (const selector of excludeSelectors) {
+                if (node.matches && node.matches(selector)) return;
+            }
+
+            if (node.tagName === 'IMG') {
+                for (const cls of excludeImageClasses) {
+                    if (node.classList.contains(cls)) return;
+                }
+
+                const src = node.getAttribute('src');
+                if (src && !src.startsWith('data:') && src.startsWith('http')) {
+                    rawContent.push({ type: 'image', content: src });
+                }
+            } else {
+                for (const child of node.childNodes) {
+                    extractContent(child);
+                }
+            }
+        }
+    }
+
+    extractContent(detailDiv);
+
+    // Merge consecutive text blocks
+    const content = [];
+    let pendingTexts = [];
+
+    for (const item of rawContent) {
+        if (item.type === 'text') {
+            pendingTexts.push(item.content);
+        } else {
+            if (pendingTexts.length > 0) {
+                content.push({ type: 'text', content: pendingTexts.join('\\n') });
+                pendingTexts = [];
+            }
+            content.push({ type: 'image', content: item.content });
+        }
+    }
+
+    if (pendingTexts.length > 0) {
+        content.push({ type: 'text', content: pendingTexts.join('\\n') });
+    }
+
+    return {
+        component: vDetail.tagName,
+        content: content
+    };
+}
+
+async function collectDescription() {
+    const started = Date.now();
+    // Scroll to #description section to trigger lazy loading
+    const descSection = document.querySelector('#description');
+    if (descSection) {
+        descSection.scrollIntoView({ behavior: 'instant', block: 'center' });
+    } else {
+        window.scrollTo(0, document.body.scrollHeight);
+    }
+
+    const ready = await waitFor(() => descriptionStatus() === 'ready', opts.descriptionTimeoutMs);
+    if (!ready) return {status: descriptionStatus(), ms: Date.now() - started};
+
+    const data = extractDescription();
+    data.status = 'ready';
+    data.ms = Date.now() - started;
+    return data;
+}
+
+async function resolveSkuTargets(labels) {
+    // Wait for any of the three SKU selector layouts to render
+    await waitFor(() => document.querySelector('button.sku-filter-button span.label-name, div.v-flex span.item-label, div.gyp-pro-table-title p'), opts.skuTimeoutMs);
+
+    const targets = {};
+    for (const label of labels) {
+        let used = label;
+        let found = findSkuElement(label);
+        if (!found && label.includes(' ')) {
+            // Fallback: just the first word of the label
+            used = label.split(' ')[0].trim();
+            found = findSkuElement(used);
+        }
+        targets[label] = found ? {pattern: found.pattern, label: used} : null;
+    }
+    return targets;
+}
+
+(async () => {
+    const result = {};
+    try {
+        if (opts.gallery) result.gallery = await collectGallery();
+        if (opts.labels.length) result.skuTargets = await resolveSkuTargets(opts.labels);
+        if (opts.description) result.description = await collectDescription();
+    } catch (e) {
+        result.error = e.message;
+    }
+    done(result);
+})();
+"""
+
+# Scroll one SKU element into view, let layout settle, and return its
+# coordinates plus what the gallery/popover shows before we touch it
+_SKU_TARGET_SCRIPT = _SKU_FINDER + """
+const done = arguments[arguments.length - 1];
+const found = findSkuElement(arguments[0]);
+if (!found) {
+    done(null);
+} else {
+    found.el.scrollIntoView({ block: 'center' });
+    // Two frames for the scroll to apply; the timeout covers throttled background windows
+    let settled = false;
+    const measure = () => {
+        if (settled) return;
+        settled = true;
+        const rect = found.el.getBoundingClientRect();
+        const preview = document.querySelector('.od-gallery-preview .od-gallery-list li:first-child img.preview-img');
+        done({
+            x: rect.x + rect.width / 2,
+            y: rect.y + rect.height / 2,
+            pattern: found.pattern,
+            preview: preview ? preview.src : '',
+            popovers: document.querySelectorAll('.ant-popover-inner-content img').length
+        });
+    };
+    requestAnimationFrame(() => requestAnimationFrame(measure));
+    setTimeout(measure, 150);
+}
+"""
+
+_READ_SKU_IMAGE_SCRIPT = """
+if (arguments[0] === 'hover_popover') {
+    // Pattern 3: read the last ant-popover image (each hover appends a new popover)
+    const popovers = document.querySelectorAll('.ant-popover-inner-content img');
+    return popovers.length ? popovers[popovers.length - 1].src : null;
+}
+// Pattern 1 & 2: read from gallery preview
+const img = document.querySelector('.od-gallery-preview .od-gallery-list li:first-child img.preview-img');
+return img ? img.src : null;
+"""
+
+
+# =========================
+# HELPERS
+# =========================
+
+def _script_timeout(driver) -> float:
+    """The driver's async-script timeout in seconds (WebDriver's default of 30 if it can't be read)."""
+    try:
+        return driver.timeouts.script
+    except Exception:
+        return 30
+
+
+def parse_variation_list(variation_list_cn) -> List[str]:
+    """variation_list_cn JSON string -> list of variation names ([] when empty/invalid)."""
+    if not variation_list_cn:
+        print("[INFO] No variations to fetch (variation_list_cn is empty)")
+        return []
+    try:
+        variations = json.loads(variation_list_cn)
+    except json.JSONDecodeError:
+        print("[INFO] Invalid JSON in variation_list_cn")
+        return []
+    if not isinstance(variations, list):
+        print("[INFO] variation_list_cn is not a list")
+        return []
+    if not variations:
+        print("[INFO] No variations to fetch (empty list)")
+    return variations
+
+
+def sku_base_label(variation: str) -> str:
+    """Normalize: "\u9ed1\u8272 - 38" -> "\u9ed1\u8272", "\u7c89\u8272  M80-100\u65a4" -> "\u7c89\u8272"."""
+    base = variation.strip()
+    if " - " in base:
+        base = base.split(" - ")[0].strip()
+    elif re.search(r'\s{2,}', base):
+        base = re.split(r'\s{2,}', base)[0].strip()
+    return base
+
+
+def _split_description(description: Optional[Dict[str, Any]]):
+    """Bundle description result -> (description_imgs, description_txt) with the scrapers' logging."""
+    if not description:
+        print("  [WARN] No description data returned")
+        return ([], None)
+    if description.get('status') != 'ready':
+        print(f"  [WARN] Description not ready after {DESCRIPTION_TIMEOUT_MS // 1000} seconds "
+              f"(status: {description.get('status')})")
+        return ([], None)
+    if 'error' in description:
+        print(f"  [WARN] {description['error']}")
+        return ([], None)
+
+    content = description.get('content', [])
+    print(f"  [DEBUG] Description ready after {description.get('ms', 0) / 1000:.1f} seconds, "
+          f"component: {description.get('component', 'unknown')}")
+
+    # Separate images and text
+    description_imgs = [c.get('content') for c in content if c.get('type') == 'image']
+    text_blocks = [c.get('content') for c in content if c.get('type') == 'text']
+    description_txt = '\n'.join(text_blocks) if text_blocks else None
+
+    if not content:
+        print("  [INFO] No description content found")
+        return ([], None)
+
+    print(f"Description: {len(description_imgs)} images, {len(text_blocks)} text blocks")
+    return (description_imgs, description_txt)
+
+
+def _collect_sku_images(driver, variations: List[str], targets: Optional[Dict[str, Any]],
+                        move_and_click: Callable[..., None]) -> List[Optional[str]]:
+    """
+    Click/hover each SKU and capture its preview image, in variation order.
+    targets is the bundle's label -> {label, pattern} map; None when the bundle
+    never resolved it, in which case each SKU is located on its own.
+    """
+    result = []
+    seen_bases = {}  # Cache: normalized_name -> url (to avoid duplicate clicks)
+
+    for variation in variations:
+        base_variation = sku_base_label(variation)
+        if base_variation in seen_bases:
+            result.append(seen_bases[base_variation])
+            continue
+
+        if targets is not None:
+            target = targets.get(base_variation)
+            if not target:
+                print(f"  [SKIP] {base_variation} (not found on page)")
+                result.append(None)
+                continue
+            candidates = [target["label"]]
+        else:
+            candidates = [base_variation]
+            if ' ' in base_variation:
+                # Fallback: just the first word of the label
+                candidates.append(base_variation.split(' ')[0].strip())
+
+        try:
+            info = None
+            for label in candidates:
+                info = driver.execute_async_script(_SKU_TARGET_SCRIPT, label)
+                if info:
+                    break
+            if not info:
+                print(f"  [SKIP] {base_variation} ({'no longer' if targets is not None else 'not found'} on page)")
+                result.append(None)
+                continue
+            if label != base_variation:
+                print(f"  [RETRY] {base_variation} -> using first word: {label}")
+
+            # Move to button coordinates with humanized movement
+            move_and_click(driver, info['x'], info['y'], click=info['pattern'] == 'click')
+
+            # Wait for gallery/popover to update (an already-selected SKU never changes it)
+            if info['pattern'] == 'hover_popover':
+                preview_url = page_waits.wait_for(driver, "popover_added", info['popovers'], timeout=3)
+            else:
+                preview_url = page_waits.wait_for(driver, "gallery_preview_changed", info['preview'], timeout=3)
+            if not preview_url:
+                preview_url = driver.execute_script(_READ_SKU_IMAGE_SCRIPT, info['pattern'])
+
+            if preview_url:
+                result.append(preview_url)
+                seen_bases[base_variation] = preview_url
+                print(f"  [OK] {base_variation} -> URL found")
+            else:
+                result.append(None)
+                print(f"  [WARN] {base_variation} -> no preview image found")
+
+        except Exception as e:
+            print(f"  [ERROR] {base_variation} -> {e}")
+            result.append(None)
+
+    print(f"SKU images found: {sum(1 for x in result if x)}/{len(variations)}")
+    return result
+
+
+# =========================
+# EXTRACTION
+# =========================
+
+def extract_product_page(driver, variation_list_cn, move_and_click: Callable[..., None],
+                         gallery: bool = True, description: bool = True) -> Dict[str, Any]:
+    """
+    Collect gallery URLs, SKU preview images (aligned with variation_list_cn) and
+    description content from the current offer page in as few round trips as possible.
+
+    Returns:
+        {"gallery_urls": [...], "variation_imgs": [...],
+         "description_imgs": [...], "description_txt": str | None}
+    """
+    variations = parse_variation_list(variation_list_cn)
+    labels = list(dict.fromkeys(sku_base_label(v) for v in variations))
+    page: Dict[str, Any] = {"gallery_urls": [], "variation_imgs": [], "description_imgs": [], "description_txt": None}
+
+    print(f"\nExtracting product page (gallery: {gallery}, {len(labels)} SKU label(s), description: {description})...")
+    opts = {
+        "gallery": gallery,
+        "description": description,
+        "labels": labels,
+        "galleryTimeoutMs": GALLERY_TIMEOUT_MS,
+        "galleryMaxScrolls": GALLERY_MAX_SCROLLS,
+        "galleryScrollPauseMs": GALLERY_SCROLL_PAUSE_MS,
+        "skuTimeoutMs": SKU_TIMEOUT_MS,
+        "descriptionTimeoutMs": DESCRIPTION_TIMEOUT_MS,
+    }
+    budget_s = (GALLERY_TIMEOUT_MS + GALLERY_MAX_SCROLLS * GALLERY_SCROLL_PAUSE_MS
+                + SKU_TIMEOUT_MS + DESCRIPTION_TIMEOUT_MS) / 1000
+    start = time.monotonic()
+    old_timeout = _script_timeout(driver)
+    try:
+        driver.set_script_timeout(budget_s + 10)
+        data = driver.execute_async_script(_PAGE_SCRIPT, opts) or {}
+    except (JavascriptException, TimeoutException) as e:
+        print(f"  [WARN] Page extraction failed: {e}")
+        data = {}
+    finally:
+        # The per-SKU locate calls below rely on the normal timeout
+        try:
+            driver.set_script_timeout(old_timeout)
+        except WebDriverException:
+            pass
+    print(f"  [DEBUG] Page bundle finished in {time.monotonic() - start:.1f}s")
+    if data.get("error"):
+        print(f"  [WARN] Page extraction error: {data['error']}")
+
+    if gallery:
+        gallery_data = data.get("gallery") or {}
+        images = gallery_data.get("images") or []
+        if not images:
+            print("  [WARN] No gallery images found on page")
+        else:
+            skipped_videos = gallery_data.get("skippedVideos", 0)
+            print(f"  [DEBUG] Found {len(images)} gallery images after {gallery_data.get('scrolls', 0)} scroll(s)"
+                  + (f" (skipped {skipped_videos} video)" if skipped_videos else ""))
+        print(f"Gallery images found: {len(images)}")
+        page["gallery_urls"] = images
+
+    # SKU clicks change the gallery, so they run after the bundle has read it
+    if variations:
+        print(f"\nFetching SKU images ({len(variations)} variations)...")
+        targets = data.get("skuTargets")
+        if not isinstance(targets, dict):
+            print("  [WARN] SKU targets missing from the page bundle, locating each SKU directly")
+            targets = None
+        page["variation_imgs"] = _collect_sku_images(driver, variations, targets, move_and_click)
+
+    if description:
+        page["description_imgs"], page["description_txt"] = _split_description(data.get("description"))
+
+    return page
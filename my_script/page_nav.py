@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+1688 offer-page navigation shared by the 1688 scrapers.
+
+Products are opened by their offer URL from reference_links when there is one;
+the order-list search is the fallback. NAV_STATS counts which path each
+product took, across pool workers.
+
+The order-list steps (opening the list, searching, clicking the result) and
+the session check stay in the scrapers and are passed in as callbacks, the
+same way browser_pool takes setup_driver / login_check.
+
+Usage:
+    import page_nav
+
+    offer_id, url = page_nav.extract_1688_offer_id(reference_links)
+    driver, ok = page_nav.navigate_to_1688_product(
+        driver, url, product_name_cn, rebuild_driver_fn,
+        safe_get=safe_get,
+        check_session_expired=check_session_expired,
+        navigate_to_order_list=navigate_to_order_list,
+        search_product=search_product,
+        click_product_result=click_product_result,
+    )
+    page_nav.print_nav_stats()
+"""
+
+import json
+import re
+import threading
+from typing import Any, Callable, Optional, Tuple
+
+import pacing
+import page_waits
+
+
+# =========================
+# OFFER URLS
+# =========================
+
+_OFFER_ID_PATTERNS = [
+    r'offer/(\d+)\.html',
+    r'offerId=(\d+)',
+    r'/(\d{10,})',
+]
+
+
+def extract_1688_offer_id(reference_links_raw) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Extract the 1688 offer ID from reference_links JSON.
+    Input:  '["https://detail.1688.com/offer/804862876701.html?spm=..."]'
+    Output: ("804862876701", "https://detail.1688.com/offer/804862876701.html")
+    Returns (None, None) if no valid URL found.
+    """
+    if not reference_links_raw:
+        return None, None
+
+    # Parse JSON if needed
+    links = reference_links_raw
+    if isinstance(links, str):
+        try:
+            links = json.loads(links)
+        except json.JSONDecodeError:
+            links = [links]
+
+    if isinstance(links, list) and len(links) > 0:
+        url = str(links[0])
+    elif isinstance(links, (str, int)):
+        # A bare offer ID parses as a JSON number
+        url = str(links)
+    else:
+        return None, None
+
+    # Extract offer ID via regex
+    for pattern in _OFFER_ID_PATTERNS:
+        match = re.search(pattern, url)
+        if match:
+            offer_id = match.group(1)
+            return offer_id, f"https://detail.1688.com/offer/{offer_id}.html"
+
+    # Bare number
+    if re.match(r'^\d{10,}$', url.strip()):
+        offer_id = url.strip()
+        return offer_id, f"https://detail.1688.com/offer/{offer_id}.html"
+
+    return None, None
+
+
+# =========================
+# NAVIGATION STATS
+# =========================
+
+# How each product page was reached: direct offer URL, order-list search after a
+# failed direct attempt, search because there was no reference link, or not at all
+NAV_STATS = {"direct": 0, "search_fallback": 0, "search_only": 0, "failed": 0}
+_NAV_STATS_LOCK = threading.Lock()
+
+
+def record_nav(path: str) -> None:
+    with _NAV_STATS_LOCK:
+        NAV_STATS[path] += 1
+
+
+def print_nav_stats() -> None:
+    total = sum(NAV_STATS.values())
+    if not total:
+        return
+    print("\nNAVIGATION PATHS")
+    print(f"  Direct URL: {NAV_STATS['direct']} ({NAV_STATS['direct'] / total:.0%})")
+    print(f"  Search fallback after direct URL: {NAV_STATS['search_fallback']}")
+    print(f"  Search only (no reference link): {NAV_STATS['search_only']}")
+    print(f"  Failed: {NAV_STATS['failed']}")
+
+
+# =========================
+# NAVIGATION
+# =========================
+
+def navigate_to_1688_product(driver, url: Optional[str], product_name_cn: str,
+                             rebuild_driver_fn: Optional[Callable[[], Any]] = None, *,
+                             safe_get: Callable[..., Any],
+                             check_session_expired: Callable[[Any], bool],
+                             navigate_to_order_list: Callable[..., Any],
+                             search_product: Callable[[Any, str], bool],
+                             click_product_result: Callable[[Any], bool],
+                             renavigate_on_expired: bool = False):
+    """
+    Navigate to a 1688 product page.
+    Strategy: Try direct URL first, fall back to order-list search.
+
+    An expired session on the order list fails the product, unless
+    renavigate_on_expired is set: then the order list is opened once more and
+    the search goes ahead (the new-product scraper's original behaviour).
+
+    Returns:
+        (driver, success): Updated driver reference and boolean success flag
+    """
+    # Strategy 1: Direct URL navigation (preferred)
+    if url:
+        print(f"  [NAV] Trying direct URL: {url}")
+        driver = safe_get(driver, url, rebuild_driver_fn=rebuild_driver_fn)
+        page_waits.wait_for(driver, "product_page_or_login", timeout=20)
+
+        # Check if we got redirected to login page
+        if not check_session_expired(driver):
+            # Verify we're on a product page
+            if page_waits.check_now(driver, "product_page"):
+                print(f"  [NAV] Direct URL navigation successful")
+                record_nav("direct")
+                return driver, True
+            print(f"  [NAV] Direct URL loaded but no product elements found, trying search fallback...")
+            pacing.POLICY.signal("empty_result")
+        else:
+            print(f"  [NAV] Session expired during direct navigation, trying search fallback...")
+            pacing.POLICY.signal("login_redirect")
+
+    # Strategy 2: Order-list search fallback
+    print(f"  [NAV] Falling back to order-list search: {product_name_cn}")
+    driver = navigate_to_order_list(driver, rebuild_driver_fn)
+
+    if check_session_expired(driver):
+        pacing.POLICY.signal("login_redirect")
+        if not renavigate_on_expired:
+            print(f"  [NAV] Session expired, cannot proceed")
+            record_nav("failed")
+            return driver, False
+        print("\n" + "="*60)
+        print("[WARNING] Session expired! Please login again.")
+        print("="*60)
+        driver = navigate_to_order_list(driver, rebuild_driver_fn)
+
+    if not search_product(driver, product_name_cn):
+        print(f"  [NAV] Search failed for: {product_name_cn}")
+        record_nav("failed")
+        return driver, False
+
+    if not click_product_result(driver):
+        print(f"  [NAV] No results for: {product_name_cn}")
+        record_nav("failed")
+        return driver, False
+
+    print(f"  [NAV] Order-list search fallback successful")
+    record_nav("search_fallback" if url else "search_only")
+    return driver, True
@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+
+"""
+Readiness waits for the 1688 scrapers.
+
+Replaces fixed human_delay() sleeps on the critical path with waits on the
+concrete elements the next step needs (the app-root shadow chain on the order
+list, .od-gallery-list, the description's div#detail, ...). Each wait is one
+execute_async_script call: the condition is checked immediately, then again on
+every DOM mutation (MutationObserver) and on a short interval, since mutations
+inside shadow roots never reach a document-level observer. The call returns
+as soon as the page is ready instead of sleeping for the worst case.
+
+Deliberate human-like pauses (typing, mouse moves, breaks between products)
+are pacing, not readiness, and stay in the scrapers' human_delay().
+
+Usage:
+    import page_waits
+
+    if page_waits.wait_for(driver, "order_search", timeout=30) is None:
+        ...  # not ready in time
+
+    # Login check: the answer must hold for LOGIN_SETTLE seconds, so a login
+    # modal or redirect that arrives after the page renders still wins
+    state = page_waits.wait_for(driver, "order_page_or_login", timeout=30, settle=page_waits.LOGIN_SETTLE)
+
+Conditions are JS function bodies in CONDITIONS; they see extra positional
+arguments as `args` and return a truthy value (passed back to Python) once ready.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from selenium.common.exceptions import JavascriptException, TimeoutException, WebDriverException
+from selenium.webdriver.support.ui import WebDriverWait
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+# Default upper bound for a readiness wait (seconds)
+WAIT_TIMEOUT = float(os.environ.get("SCRAPER_WAIT_TIMEOUT", "30"))
+
+# In-page re-check interval for changes a MutationObserver can't see (ms)
+POLL_MS = 150
+
+# How long the logged-in/logged-out answer must stay unchanged before the
+# login checks trust it (seconds); 1688's login modal can show up late
+LOGIN_SETTLE = float(os.environ.get("SCRAPER_LOGIN_SETTLE", "5"))
+
+
+# =========================
+# CONDITIONS
+# =========================
+
+_LOGIN_FORM = """
+    const url = location.href.toLowerCase();
+    if (url.includes('login') || url.includes('passport')) return 'login';
+    if (document.querySelector('input#fm-sms-login-id, input[name="fm-sms-login-id"], button.fm-submit.sms-login, .fm-login, #login-form')) return 'login';
+    if (document.querySelector('iframe[src*="login"], iframe[src*="passport"]')) return 'login';
+"""
+
+_ORDER_SEARCH = """
+    const appRoot = document.querySelector('app-root');
+    const orderSearch = appRoot && appRoot.shadowRoot && appRoot.shadowRoot.querySelector('order-search');
+    if (!orderSearch || !orderSearch.shadowRoot) return false;
+    const keywords = orderSearch.shadowRoot.querySelector('order-search-keywords');
+    const actions = orderSearch.shadowRoot.querySelector('order-search-actions');
+    if (!keywords || !keywords.shadowRoot || !actions || !actions.shadowRoot) return false;
+    if (!actions.shadowRoot.querySelector('q-button[type="primary"]')) return false;
+    for (const qInput of keywords.shadowRoot.querySelectorAll('q-input')) {
+        const placeholder = qInput.getAttribute('placeholder') || '';
+        if (placeholder.includes('\u5546\u54c1\u540d\u79f0') && qInput.shadowRoot && qInput.shadowRoot.querySelector('input')) {
+            return 'ready';
+        }
+    }
+    return false;
+"""
+
+_PRODUCT_LINKS = """
+    function findInShadow(root, selector) {
+        let result = root.querySelectorAll(selector);
+        if (result.length > 0) return Array.from(result);
+        for (const el of root.querySelectorAll('*')) {
+            if (el.shadowRoot) {
+                result = findInShadow(el.shadowRoot, selector);
+                if (result.length > 0) return result;
+            }
+        }
+        return [];
+    }
+    const links = findInShadow(document, 'a.product-name');
+    const signature = links.map(a => a.getAttribute('href')).join('|');
+"""
+
+_PRODUCT_PAGE = """
+    if (document.querySelector('.od-gallery-preview, #description, .sku-filter-button, .od-gallery-list')) return 'ready';
+"""
+
+CONDITIONS: Dict[str, str] = {
+    # Order list search box: app-root -> order-search -> order-search-keywords -> q-input -> input
+    "order_search": _ORDER_SEARCH,
+
+    # Order list usable, or bounced to the login form / passport page
+    "order_page_or_login": """
+        const login = (function () {""" + _LOGIN_FORM + """ return false; })();
+        if (login) return login;
+    """ + _ORDER_SEARCH,
+
+    # Signature of the a.product-name links currently listed (taken before a search)
+    "order_results_signature": _PRODUCT_LINKS + "return {signature: signature};",
+
+    # At least one order result whose link set differs from args[0] (the pre-search signature)
+    "order_results_changed": _PRODUCT_LINKS + """
+        if (links.length === 0 || signature === args[0]) return false;
+        return {count: links.length};
+    """,
+
+    # At least one order result is listed
+    "order_results": _PRODUCT_LINKS + "return links.length > 0 ? {count: links.length} : false;",
+
+    # Offer detail page rendered
+    "product_page": _PRODUCT_PAGE + "return false;",
+
+    # Offer detail page rendered, or redirected to login
+    "product_page_or_login": """
+        const login = (function () {""" + _LOGIN_FORM + """ return false; })();
+        if (login) return login;
+    """ + _PRODUCT_PAGE + "return false;",
+
+    # Gallery thumbnails have their image sources
+    "gallery": """
+        for (const item of document.querySelectorAll('.od-gallery-list > li')) {
+            const img = item.querySelector('img.preview-img');
+            if (img && img.src) return 'ready';
+        }
+        return false;
+    """,
+
+    # Any of the three SKU selector layouts page_extract understands
+    "sku_options": """
+        if (document.querySelector('button.sku-filter-button span.label-name, div.v-flex span.item-label, div.gyp-pro-table-title p')) return 'ready';
+        return false;
+    """,
+
+    # Gallery preview swapped away from args[0] after a SKU click/hover
+    "gallery_preview_changed": """
+        const img = document.querySelector('.od-gallery-preview .od-gallery-list li:first-child img.preview-img');
+        return (img && img.src && img.src !== args[0]) ? img.src : false;
+    """,
+
+    # A new SKU popover appeared (more than args[0] popover images)
+    "popover_added": """
+        const imgs = document.querySelectorAll('.ant-popover-inner-content img');
+        if (imgs.length <= args[0]) return false;
+        const src = imgs[imgs.length - 1].src;
+        return src ? src : false;
+    """,
+
+    # Description shadow DOM: #description .html-description -> div#detail with content
+    "description": """
+        const desc = document.querySelector('#description');
+        const vDetail = desc && desc.querySelector('.html-description');
+        if (!vDetail || !vDetail.shadowRoot) return false;
+        const detail = vDetail.shadowRoot.querySelector('div#detail');
+        return (detail && detail.innerHTML.length >= 100) ? 'ready' : false;
+    """,
+}
+
+_WAIT_SCRIPT = """
+const done = arguments[arguments.length - 1];
+const settleMs = arguments[arguments.length - 2];
+const timeoutMs = arguments[arguments.length - 3];
+const args = Array.prototype.slice.call(arguments, 0, arguments.length - 3);
+
+function check() {
+    try {
+        %(condition)s
+    } catch (e) {
+        return false;
+    }
+}
+
+let finished = false;
+let observer = null;
+let timer = null;
+let deadline = null;
+let scheduled = false;
+// The current truthy value (as JSON) and since when it has held, for settleMs
+let held = null;
+let heldSince = 0;
+
+function finish(value) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    clearInterval(timer);
+    clearTimeout(deadline);
+    done(value ? value : null);
+}
+
+function recheck() {
+    scheduled = false;
+    const value = check();
+    if (!value) {
+        held = null;
+        return;
+    }
+    const key = JSON.stringify(value);
+    if (key !== held) {
+        held = key;
+        heldSince = Date.now();
+    }
+    if (Date.now() - heldSince >= settleMs) finish(value);
+}
+
+recheck();
+if (!finished) {
+    observer = new MutationObserver(() => {
+        if (!scheduled) {
+            scheduled = true;
+            setTimeout(recheck, 0);
+        }
+    });
+    observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true});
+    timer = setInterval(recheck, %(poll_ms)d);
+    deadline = setTimeout(() => finish(null), timeoutMs);
+}
+"""
+
+_CHECK_SCRIPT = """
+const args = arguments;
+try {
+    %(condition)s
+} catch (e) {
+    return false;
+}
+"""
+
+
+# =========================
+# WAITS
+# =========================
+
+class WaitStats:
+    """Per-condition wait count, total seconds and timeouts (shared across pool workers)."""
+
+    def __init__(self):
+        self.by_name: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            entry = self.by_name.setdefault(name, {"count": 0, "seconds": 0.0, "timeouts": 0})
+            entry["count"] += 1
+            entry["seconds"] += seconds
+            if timed_out:
+                entry["timeouts"] += 1
+
+    def print_summary(self) -> None:
+        if not self.by_name:
+            return
+        print("\nREADINESS WAITS")
+        for name, entry in sorted(self.by_name.items()):
+            avg = entry["seconds"] / entry["count"] if entry["count"] else 0.0
+            print(f"  {name}: {entry['count']} wait(s), avg {avg:.1f}s, {entry['timeouts']} timeout(s)")
+
+
+WAIT_STATS = WaitStats()
+
+
+def _poll(driver, script: str, args, timeout: float, settle: float) -> Any:
+    """Fallback for pages where execute_async_script can't run (navigation mid-wait)."""
+    held = {"value": None, "since": 0.0}
+
+    def settled(d):
+        value = d.execute_script(script, *args)
+        if not value:
+            held["value"] = None
+            return False
+        now = time.monotonic()
+        if value != held["value"]:
+            held["value"], held["since"] = value, now
+        return value if now - held["since"] >= settle else False
+
+    try:
+        return WebDriverWait(driver, max(timeout, 0.1), poll_frequency=POLL_MS / 1000.0).until(settled)
+    except WebDriverException:
+        return None
+
+
+def wait_for(driver, name: str, *args, timeout: float = None, settle: float = 0.0) -> Any:
+    """
+    Block until CONDITIONS[name] is truthy in the page, up to timeout seconds.
+    With settle, the value must stay the same for that many seconds first.
+    Returns the condition's value, or None if the page never got there (or
+    the browser errored - like the sleeps this replaces, a wait never raises).
+    """
+    timeout = WAIT_TIMEOUT if timeout is None else timeout
+    condition = CONDITIONS[name]
+    start = time.monotonic()
+
+    result = None
+    try:
+        driver.set_script_timeout(timeout + 5)
+        result = driver.execute_async_script(
+            _WAIT_SCRIPT % {"condition": condition, "poll_ms": POLL_MS},
+            *args, int(timeout * 1000), int(settle * 1000),
+        )
+    except (JavascriptException, TimeoutException):
+        # "document unloaded while waiting for result": re-check on the new page
+        remaining = timeout - (time.monotonic() - start)
+        if remaining > 0:
+            result = _poll(driver, _CHECK_SCRIPT % {"condition": condition}, args, remaining, settle)
+    except WebDriverException as e:
+        print(f"  [WAIT] {name}: browser error ({type(e).__name__})")
+
+    elapsed = time.monotonic() - start
+    WAIT_STATS.record(name, elapsed, result is None)
+    if result is None:
+        print(f"  [WAIT] {name}: not ready after {elapsed:.1f}s")
+    return result
+
+
+def check_now(driver, name: str, *args) -> Any:
+    """Evaluate CONDITIONS[name] once without waiting."""
+    return driver.execute_script(_CHECK_SCRIPT % {"condition": CONDITIONS[name]}, *args) or None
@@ -9,27 +9,36 @@ DRY RUN MODE - Only prints output, does not store to database.
 
 import sys
 import io
+import argparse
 import time
 import os
+import queue
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
 
 # Fix Windows console encoding for Unicode characters in API responses
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
 import hmac
 import hashlib
 import json
+import sqlite3
+import unicodedata
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import requests
-import mysql.connector
-from mysql.connector import Error as MySQLError
+from requests.adapters import HTTPAdapter
+
+import db_pool
 
 
 # =========================
 # CONFIGURATION
 # =========================
 
-HOST = "https://partner.shopeemobile.com"
+HOST = os.environ.get("SHOPEE_HOST", "https://partner.shopeemobile.com")
 
 PARTNER_ID = 2012161
 _TMP_KEY = os.environ["SHOPEE_PARTNER_KEY"]
@@ -38,115 +47,1222 @@ PARTNER_KEY = _TMP_KEY.encode()
 # API paths
 PATH_ITEM_BASE_INFO = "/api/v2/product/get_item_base_info"
 PATH_GET_MODEL_LIST = "/api/v2/product/get_model_list"
-
-# Database config
-DB_CFG = dict(
-    host=os.environ.get("DB_HOST", "localhost"),
-    user="root",
-    password=os.environ["DB_PASSWORD"],
-    database="requestDatabase",
-)
+PATH_GET_ITEM_LIST = "/api/v2/product/get_item_list"
+PATH_REFRESH_TOKEN = "/api/v2/auth/access_token/get"
 
 # DRY RUN - no database writes
 DRY_RUN = False
 
+# Streaming pipeline - bounded queues between stages keep memory flat
+PIPELINE_QUEUE_SIZE = int(os.environ.get("SHOPEE_PIPELINE_QUEUE_SIZE", "200"))
+DB_READ_PAGE_SIZE = 500         # new_items rows fetched per round trip
+PROGRESS_EVERY = 100            # items between progress lines when not --verbose
+
+# Rows per multi-row UPDATE / commit in shopee_listing_products
+DB_WRITE_BATCH_SIZE = int(os.environ.get("SHOPEE_DB_WRITE_BATCH_SIZE", "200"))
+# Table ListingWriter updates (shopee_benchmark points it at a scratch copy)
+LISTING_TABLE = "shopee_listing_products"
+
+# Response cache - on-disk base-info / model-list payloads, reused across runs.
+# Opt-in (SHOPEE_RESPONSE_CACHE=1 or --cache): a cached base-info hit is served
+# without asking Shopee for its update_time, so it is only safe for quick
+# re-runs such as finishing a crashed run, not for regular syncs.
+CACHE_ENABLED = os.environ.get("SHOPEE_RESPONSE_CACHE", "0").lower() in ("1", "true", "yes")
+CACHE_FILE = os.environ.get(
+    "SHOPEE_CACHE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "shopee_response_cache.sqlite3"),
+)
+CACHE_TTL = int(os.environ.get("SHOPEE_CACHE_TTL", str(6 * 3600)))            # seconds
+CACHE_MAX_BYTES = int(os.environ.get("SHOPEE_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Fast JSON - decode with orjson/msgspec when installed, else stdlib json
+FAST_JSON = os.environ.get("SHOPEE_FAST_JSON", "1").lower() not in ("0", "false", "no")
+
+# Fetch planner - call get_model_list only when base-info tier_variation is incomplete
+ALWAYS_FETCH_MODELS = os.environ.get("SHOPEE_ALWAYS_FETCH_MODELS", "").lower() in ("1", "true", "yes")
+
+# Incremental sync - per-shop watermarks live in a local state file
+SYNC_STATE_FILE = os.environ.get(
+    "SHOPEE_SYNC_STATE_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "shopee_sync_state.json"),
+)
+SYNC_WATERMARK_OVERLAP = 300    # seconds re-scanned before the last watermark
+
+# Checkpoint journal - finished (shop_id, product_id) pairs of the current run, for --resume
+CHECKPOINT_FILE = os.environ.get(
+    "SHOPEE_CHECKPOINT_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "shopee_checkpoint.sqlite3"),
+)
+
+# Concurrency - shops run in parallel, model-list calls run in parallel per shop
+MAX_SHOP_WORKERS = int(os.environ.get("SHOPEE_MAX_SHOP_WORKERS", "4"))
+MAX_INFLIGHT_PER_SHOP = int(os.environ.get("SHOPEE_MAX_INFLIGHT_PER_SHOP", "4"))
+MAX_INFLIGHT_PER_PARTNER = int(os.environ.get("SHOPEE_MAX_INFLIGHT_PER_PARTNER", "16"))
+
+# HTTP client - one pooled keep-alive session shared by all endpoints
+HTTP_POOL_SIZE = int(os.environ.get("SHOPEE_HTTP_POOL_SIZE", str(MAX_INFLIGHT_PER_PARTNER)))
+HTTP_TIMEOUT = 30
+HTTP2_ENABLED = os.environ.get("SHOPEE_HTTP2", "").lower() in ("1", "true", "yes")
+
+# Rate limits (requests/second) - token bucket per partner and per shop
+PARTNER_RATE_LIMIT = float(os.environ.get("SHOPEE_PARTNER_RPS", "10"))
+SHOP_RATE_LIMIT = float(os.environ.get("SHOPEE_SHOP_RPS", "5"))
+THROTTLE_COOLDOWN = 10          # seconds without a throttle before the rate recovers
+
+# Retries - exponential backoff with full jitter, bounded by a per-endpoint budget
+RETRY_MAX_ATTEMPTS = int(os.environ.get("SHOPEE_RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = 0.5          # seconds, doubled per attempt
+RETRY_MAX_DELAY = 20            # seconds
+RETRY_BUDGET_RATIO = 0.2        # retries allowed per original request...
+RETRY_BUDGET_MIN = 10           # ...on top of this fixed allowance
+
+# Circuit breaker - per endpoint path
+BREAKER_FAILURE_THRESHOLD = 5   # consecutive transient failures before opening
+BREAKER_RESET_TIMEOUT = 30      # seconds before a half-open probe is allowed
+
+# Metrics - Prometheus textfile and/or JSON run report written at the end of a run
+METRICS_FILE = os.environ.get("SHOPEE_METRICS_FILE")
+RUN_REPORT_FILE = os.environ.get("SHOPEE_RUN_REPORT")
+
+# Token refresh - access tokens live ~4h; refresh this long before expires_at
+TOKEN_REFRESH_MARGIN = int(os.environ.get("SHOPEE_TOKEN_REFRESH_MARGIN", "900"))   # seconds
+TOKEN_CHECK_INTERVAL = 60       # seconds between background expiry checks
+TOKEN_RETRY_MAX = 1800          # failed refreshes back off from TOKEN_CHECK_INTERVAL up to this
+
+# Shopee `error` codes worth retrying; anything else (error_auth, error_param,
+# error_permission, error_item_not_found, ...) is fatal for that request.
+RETRYABLE_API_ERRORS = {
+    "error_server",
+    "error_inner",
+    "error_network",
+    "error_busy",
+    "error_system_busy",
+    "error_timeout",
+}
+
+# Shopee `error` codes meaning the access token was rejected (expired/revoked);
+# "invalid_acceess_token" is Shopee's own spelling
+AUTH_API_ERRORS = {
+    "error_auth",
+    "invalid_access_token",
+    "invalid_acceess_token",
+}
+
+
+# =========================
+# CONCURRENCY
+# =========================
+
+_PARTNER_SLOTS = threading.BoundedSemaphore(MAX_INFLIGHT_PER_PARTNER)
+_SHOP_SLOTS: Dict[int, threading.BoundedSemaphore] = {}
+_SHOP_SLOTS_LOCK = threading.Lock()
+
+
+@contextmanager
+def _request_slot(shop_id: int):
+    """
+    Hold one in-flight request slot for shop_id and for the partner.
+    The shop slot is taken first so a waiting shop never pins a partner slot.
+    """
+    with _SHOP_SLOTS_LOCK:
+        shop_sem = _SHOP_SLOTS.get(shop_id)
+        if shop_sem is None:
+            shop_sem = threading.BoundedSemaphore(MAX_INFLIGHT_PER_SHOP)
+            _SHOP_SLOTS[shop_id] = shop_sem
+    with shop_sem:
+        with _PARTNER_SLOTS:
+            yield
+
+
+# =========================
+# ERRORS
+# =========================
+
+class ShopeeAPIError(RuntimeError):
+    """Failed Shopee call. `retryable` says whether trying again can help."""
+
+    def __init__(self, message: str, error: Any = None, status_code: Optional[int] = None,
+                 retryable: bool = False):
+        super().__init__(message)
+        self.error = error
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+class ShopeeRateLimitError(ShopeeAPIError):
+    """Shopee rejected the call because a partner/shop quota was exceeded."""
+
+    def __init__(self, message: str, error: Any = None, status_code: Optional[int] = None):
+        super().__init__(message, error, status_code, retryable=True)
+
+
+class CircuitOpenError(ShopeeAPIError):
+    """The endpoint's circuit breaker is open; the call was not attempted."""
+
+
+def _is_rate_limited(status_code: int, error: Any) -> bool:
+    """HTTP 429 or an `error_too_many_request`-style API error code."""
+    return status_code == 429 or "too_many_request" in str(error or "").lower()
+
+
+def _is_retryable_status(status_code: int) -> bool:
+    """5xx, 408 and 429 are transient; other 4xx are not."""
+    return status_code >= 500 or status_code in (408, 429)
+
+
+def _is_retryable_error(error: Any) -> bool:
+    return str(error or "").lower() in RETRYABLE_API_ERRORS
+
+
+def _is_auth_error(error: Any) -> bool:
+    return str(error or "").lower() in AUTH_API_ERRORS
+
+
+# =========================
+# METRICS
+# =========================
+
+# Upper bounds (seconds) of the timing histogram buckets
+HISTOGRAM_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket timing histogram, as in the Prometheus exposition format."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        i = 0
+        while i < len(HISTOGRAM_BUCKETS) and value > HISTOGRAM_BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return HISTOGRAM_BUCKETS[i] if i < len(HISTOGRAM_BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and timing histograms keyed by name + labels.
+
+    Stage timings go to the `stage_seconds` histogram (stage=db_read, sign,
+    rate_limit_wait, http, decode, parse, write), per-shop HTTP latency to
+    `http_request_seconds`. Exported as Prometheus text (prometheus_text) or
+    a JSON report (report).
+    """
+
+    def __init__(self, prefix: str = "shopee"):
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._types: Dict[str, str] = {}
+        self._values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._types.setdefault(name, "counter")
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._types.setdefault(name, "gauge")
+            self._values[key] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._types.setdefault(name, "histogram")
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+    def stage_totals(self) -> Dict[str, Dict[str, float]]:
+        """Per stage: calls and seconds summed over all worker threads."""
+        totals: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            for (name, labels), hist in self._histograms.items():
+                if name != "stage_seconds":
+                    continue
+                stage = dict(labels)["stage"]
+                entry = totals.setdefault(stage, {"count": 0, "seconds": 0.0})
+                entry["count"] += hist.count
+                entry["seconds"] += hist.sum
+        return totals
+
+    def prometheus_text(self) -> str:
+        def fmt(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                full = f"{self.prefix}_{name}"
+                lines.append(f"# TYPE {full} {self._types[name]}")
+                if self._types[name] == "histogram":
+                    for (n, labels), hist in sorted(self._histograms.items()):
+                        if n != name:
+                            continue
+                        cumulative = 0
+                        for bound, count in zip(HISTOGRAM_BUCKETS + ("+Inf",), hist.counts):
+                            cumulative += count
+                            lines.append(f"{full}_bucket{fmt(labels, (('le', str(bound)),))} {cumulative}")
+                        lines.append(f"{full}_sum{fmt(labels)} {hist.sum:.6f}")
+                        lines.append(f"{full}_count{fmt(labels)} {hist.count}")
+                else:
+                    for (n, labels), value in sorted(self._values.items()):
+                        if n == name:
+                            lines.append(f"{full}{fmt(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._values.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": hist.count,
+                    "sum": round(hist.sum, 6),
+                    # None = beyond the last bucket (keeps the report valid JSON)
+                    **{
+                        name_q: (None if v == float("inf") else v)
+                        for name_q, v in (
+                            ("p50", hist.quantile(0.5)),
+                            ("p95", hist.quantile(0.95)),
+                            ("p99", hist.quantile(0.99)),
+                        )
+                    },
+                }
+                for (name, labels), hist in sorted(self._histograms.items())
+            ]
+        return {
+            "started": datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "wall_seconds": round(time.time() - self.started, 3),
+            "stages": self.stage_totals(),
+            "metrics": values,
+            "histograms": histograms,
+        }
+
+
+METRICS = Metrics()
+
+
+def _write_atomic(path: str, text: str) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+# =========================
+# RATE LIMITING
+# =========================
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with adaptive rate.
+    on_throttle() halves the rate (at most once per second, so one burst of
+    concurrent rejections counts as one signal); after THROTTLE_COOLDOWN seconds without a
+    throttle the rate climbs back towards max_rate by 10% of max per second.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: Optional[float] = None):
+        self.name = name
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = rate / 16
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.throttled = 0
+        self._created = time.monotonic()
+        self._last_refill = self._created
+        self._last_throttle = 0.0
+        self._grants: deque = deque()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rate < self.max_rate and now - self._last_throttle >= THROTTLE_COOLDOWN:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1 * elapsed)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available (returns 0), else the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self._grants.append(now)
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Block until one token is available."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease after Shopee reports a quota hit."""
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self.tokens = 0
+            if now - self._last_throttle >= 1.0:
+                self.rate = max(self.min_rate, self.rate / 2)
+            self._last_throttle = now
+
+    def throughput(self, window: float = 60.0) -> float:
+        """Granted requests per second over the last `window` seconds."""
+        with self._lock:
+            now = time.monotonic()
+            window = max(1e-3, min(window, now - self._created))
+            while self._grants and self._grants[0] < now - window:
+                self._grants.popleft()
+            return len(self._grants) / window
+
+
+class RateLimiter:
+    """One bucket for the partner plus one bucket per shop_id."""
+
+    def __init__(self, partner_rate: float, shop_rate: float):
+        self.shop_rate = shop_rate
+        self.partner = TokenBucket(f"partner {PARTNER_ID}", partner_rate)
+        self.shops: Dict[int, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def shop_bucket(self, shop_id: int) -> TokenBucket:
+        with self._lock:
+            bucket = self.shops.get(shop_id)
+            if bucket is None:
+                bucket = TokenBucket(f"shop {shop_id}", self.shop_rate)
+                self.shops[shop_id] = bucket
+            return bucket
+
+    def acquire(self, shop_id: int) -> None:
+        self.shop_bucket(shop_id).acquire()
+        self.partner.acquire()
+
+    def on_throttle(self, shop_id: int) -> None:
+        # Shopee doesn't say which quota tripped, so back off both
+        self.shop_bucket(shop_id).on_throttle()
+        self.partner.on_throttle()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Current rate, observed throughput and throttle count per bucket."""
+        with self._lock:
+            buckets = [self.partner] + list(self.shops.values())
+        return [
+            {
+                "bucket": b.name,
+                "rate": round(b.rate, 2),
+                "max_rate": b.max_rate,
+                "throughput": round(b.throughput(), 2),
+                "throttled": b.throttled,
+            }
+            for b in buckets
+        ]
+
+
+RATE_LIMITER = RateLimiter(PARTNER_RATE_LIMIT, SHOP_RATE_LIMIT)
+
+
+# =========================
+# RETRIES & CIRCUIT BREAKER
+# =========================
+
+class CircuitBreaker:
+    """
+    Per-endpoint breaker. Opens after BREAKER_FAILURE_THRESHOLD consecutive
+    transient failures, fails fast while open, and lets a single probe
+    through once BREAKER_RESET_TIMEOUT has passed (half-open).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= BREAKER_RESET_TIMEOUT:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError(f"Circuit open for {self.name}, skipping call")
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= BREAKER_FAILURE_THRESHOLD:
+                if self.state != "open":
+                    self.opened += 1
+                    print(f"[WARN] Circuit opened for {self.name} after {self.failures} failure(s)")
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    Caps retries per endpoint at RETRY_BUDGET_MIN + RETRY_BUDGET_RATIO x requests,
+    so a widespread outage can't multiply load on Shopee.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.retries < RETRY_BUDGET_MIN + RETRY_BUDGET_RATIO * self.requests:
+                self.retries += 1
+                return True
+            self.denied += 1
+            return False
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BUDGETS: Dict[str, RetryBudget] = {}
+_RESILIENCE_LOCK = threading.Lock()
+
+
+def _endpoint_guards(path: str):
+    """(CircuitBreaker, RetryBudget) for an endpoint path."""
+    with _RESILIENCE_LOCK:
+        if path not in _BREAKERS:
+            _BREAKERS[path] = CircuitBreaker(path)
+            _BUDGETS[path] = RetryBudget()
+        return _BREAKERS[path], _BUDGETS[path]
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given 0-based retry attempt."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+
+
+def retry_stats() -> List[Dict[str, Any]]:
+    """Breaker state and retry budget usage per endpoint."""
+    with _RESILIENCE_LOCK:
+        paths = list(_BREAKERS.keys())
+    return [
+        {
+            "endpoint": path,
+            "breaker": _BREAKERS[path].state,
+            "opened": _BREAKERS[path].opened,
+            "requests": _BUDGETS[path].requests,
+            "retries": _BUDGETS[path].retries,
+            "retries_denied": _BUDGETS[path].denied,
+        }
+        for path in paths
+    ]
+
+
+# =========================
+# HTTP CLIENT
+# =========================
+
+_HTTP_CLIENT = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+
+def _build_http_client():
+    """
+    Build the shared keep-alive client for partner.shopeemobile.com.
+    Uses httpx with HTTP/2 when SHOPEE_HTTP2 is set and httpx[http2] is
+    installed, otherwise a pooled requests.Session.
+    """
+    if HTTP2_ENABLED:
+        try:
+            import httpx
+            client = httpx.Client(
+                http2=True,
+                headers={"Accept": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                ),
+            )
+            print(f"[INFO] HTTP client: httpx (HTTP/2), pool size {HTTP_POOL_SIZE}")
+            return client
+        except ImportError:
+            print("[WARN] SHOPEE_HTTP2 set but httpx[http2] is not installed, using requests")
+
+    session = requests.Session()
+    session.headers.update({"Accept": "application/json"})
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    print(f"[INFO] HTTP client: requests (HTTP/1.1 keep-alive), pool size {HTTP_POOL_SIZE}")
+    return session
+
+
+def get_http_client():
+    """Return the process-wide HTTP client, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        with _HTTP_CLIENT_LOCK:
+            if _HTTP_CLIENT is None:
+                _HTTP_CLIENT = _build_http_client()
+    return _HTTP_CLIENT
+
+
+def close_http_client() -> None:
+    """Close pooled connections (end of run)."""
+    global _HTTP_CLIENT
+    with _HTTP_CLIENT_LOCK:
+        if _HTTP_CLIENT is not None:
+            _HTTP_CLIENT.close()
+            _HTTP_CLIENT = None
+
+
+# =========================
+# DECODING
+# =========================
+
+_JSON_LOADS: Optional[Callable[[bytes], Any]] = None
+
+
+def _build_json_loads() -> Callable[[bytes], Any]:
+    """orjson, then msgspec, then stdlib json - all take raw bytes."""
+    if FAST_JSON:
+        try:
+            import orjson
+            print("[INFO] JSON decoder: orjson")
+            return orjson.loads
+        except ImportError:
+            pass
+        try:
+            import msgspec
+            print("[INFO] JSON decoder: msgspec")
+            return msgspec.json.Decoder().decode
+        except ImportError:
+            pass
+    return json.loads
+
+
+def decode_json(raw: bytes) -> Any:
+    global _JSON_LOADS
+    if _JSON_LOADS is None:
+        _JSON_LOADS = _build_json_loads()
+    return _JSON_LOADS(raw)
+
+
+def _compact_tiers(tiers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """tier_variation keeping only tier name, option text and option image_url."""
+    compact = []
+    for tier in tiers or []:
+        options = []
+        for opt in tier.get("option_list") or []:
+            image_url = (opt.get("image") or {}).get("image_url")
+            option = {"option": opt.get("option", "")}
+            if image_url:
+                option["image"] = {"image_url": image_url}
+            options.append(option)
+        compact.append({"name": tier.get("name", ""), "option_list": options})
+    return compact
+
+
+def compact_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce a get_item_base_info item to the fields parse_product_details,
+    needs_model_list and the pipeline read. The extended_description text
+    fields are joined into `description` up front (same result as
+    parse_product_details' fallback), dropping image fields and ids.
+    """
+    field_list = ((item.get("description_info") or {}).get("extended_description") or {}).get("field_list") or []
+    text_parts = [f.get("text", "") for f in field_list if f.get("field_type") == "text"]
+    return {
+        "item_id": item.get("item_id"),
+        "item_name": item.get("item_name", ""),
+        "has_model": item.get("has_model"),
+        "update_time": item.get("update_time"),
+        "description": "\n".join(text_parts) if text_parts else item.get("description", ""),
+        "tier_variation": _compact_tiers(item.get("tier_variation")),
+    }
+
+
+def compact_model_list(response: Dict[str, Any]) -> Dict[str, Any]:
+    """get_model_list response reduced to its tier_variation; the per-model list is unused."""
+    return {"tier_variation": _compact_tiers(response.get("tier_variation"))}
+
+
+# =========================
+# RESPONSE CACHE
+# =========================
+
+class ResponseCache:
+    """
+    SQLite-backed cache of per-item Shopee payloads keyed by
+    (shop_id, endpoint, item_id). Entries expire after CACHE_TTL, the oldest
+    are evicted once the payloads exceed CACHE_MAX_BYTES, and an entry is
+    stale when the item's Shopee update_time no longer matches.
+    """
+
+    def __init__(self, path: str, ttl: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                shop_id     INTEGER NOT NULL,
+                endpoint    TEXT    NOT NULL,
+                item_id     INTEGER NOT NULL,
+                update_time INTEGER,
+                fetched_at  REAL    NOT NULL,
+                size        INTEGER NOT NULL,
+                payload     TEXT    NOT NULL,
+                PRIMARY KEY (shop_id, endpoint, item_id)
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_fetched_at ON response_cache (fetched_at)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+
+    def get(self, shop_id: int, endpoint: str, item_id: int,
+            update_time: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Cached payload, or None if missing, expired, or older than update_time."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT update_time, fetched_at, payload FROM response_cache "
+                "WHERE shop_id = ? AND endpoint = ? AND item_id = ?",
+                (shop_id, endpoint, item_id),
+            ).fetchone()
+            if (
+                row is None
+                or time.time() - row[1] > self.ttl
+                or (update_time is not None and row[0] != update_time)
+            ):
+                self.misses += 1
+                METRICS.inc("cache_requests_total", endpoint=endpoint.rsplit("/", 1)[-1], result="miss")
+                return None
+            self.hits += 1
+            METRICS.inc("cache_requests_total", endpoint=endpoint.rsplit("/", 1)[-1], result="hit")
+            return json.loads(row[2])
+
+    def put(self, shop_id: int, endpoint: str, item_id: int, payload: Dict[str, Any],
+            update_time: Optional[int]) -> None:
+        data = json.dumps(payload, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            old = self._db.execute(
+                "SELECT size FROM response_cache WHERE shop_id = ? AND endpoint = ? AND item_id = ?",
+                (shop_id, endpoint, item_id),
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache "
+                "(shop_id, endpoint, item_id, update_time, fetched_at, size, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (shop_id, endpoint, item_id, update_time, time.time(), size, data),
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict_locked()
+            self._db.commit()
+
+    def invalidate(self, shop_id: int, item_id: int, update_time: Optional[int] = None) -> None:
+        """Drop every endpoint's entry for an item (only those older than update_time, if given)."""
+        with self._lock:
+            where = "shop_id = ? AND item_id = ?"
+            params: Tuple[Any, ...] = (shop_id, item_id)
+            if update_time is not None:
+                where += " AND (update_time IS NULL OR update_time <> ?)"
+                params += (update_time,)
+            freed = self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM response_cache WHERE {where}", params
+            ).fetchone()[0]
+            self._db.execute(f"DELETE FROM response_cache WHERE {where}", params)
+            self._db.commit()
+            self._total_bytes -= freed
+
+    def _evict_locked(self) -> None:
+        """Drop expired entries, then the oldest ones until 90% of max_bytes."""
+        self._db.execute("DELETE FROM response_cache WHERE fetched_at < ?", (time.time() - self.ttl,))
+        target = int(self.max_bytes * 0.9)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        if total > target:
+            cutoff = None
+            running = total
+            for fetched_at, size in self._db.execute(
+                "SELECT fetched_at, size FROM response_cache ORDER BY fetched_at"
+            ):
+                running -= size
+                cutoff = fetched_at
+                if running <= target:
+                    break
+            self._db.execute("DELETE FROM response_cache WHERE fetched_at <= ?", (cutoff,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        self._total_bytes = total
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide response cache, or None when caching is disabled."""
+    global _RESPONSE_CACHE
+    if not CACHE_ENABLED:
+        return None
+    if _RESPONSE_CACHE is None:
+        with _RESPONSE_CACHE_LOCK:
+            if _RESPONSE_CACHE is None:
+                _RESPONSE_CACHE = ResponseCache(CACHE_FILE, CACHE_TTL, CACHE_MAX_BYTES)
+    return _RESPONSE_CACHE
+
 
 # =========================
 # SHOPEE SIGNING & API
 # =========================
 
+class ShopeeSigner:
+    """
+    Shopee request signer and URL builder.
+
+    hmac.new() derives the padded inner/outer key states from PARTNER_KEY on
+    every call. Here that is done once, and the `partner_id + path` prefix of
+    the base string is absorbed once per path, so signing a request is one
+    copy() of the cached state plus a short update. The fixed part of each URL
+    is likewise built once per path.
+    """
+
+    def __init__(self, partner_id: int, partner_key: bytes, host: str):
+        self.partner_id = partner_id
+        self.host = host
+        self._keyed = hmac.new(partner_key, digestmod=hashlib.sha256)
+        self._path_states: Dict[str, Any] = {}
+        self._url_prefixes: Dict[str, str] = {}
+        self._param_prefixes: Dict[str, str] = {}
+
+    def _path_state(self, path: str):
+        state = self._path_states.get(path)
+        if state is None:
+            state = self._keyed.copy()
+            state.update(f"{self.partner_id}{path}".encode())
+            self._path_states[path] = state
+        return state
+
+    def sign(self, path: str, timestamp: int, access_token: str = "", shop_id: Any = "") -> str:
+        """HMAC-SHA256 of partner_id + path + timestamp + access_token + shop_id."""
+        mac = self._path_state(path).copy()
+        mac.update(f"{timestamp}{access_token}{shop_id}".encode())
+        return mac.hexdigest()
+
+    def sign_many(self, entries: List[Tuple[str, Any, int, str]]) -> List[str]:
+        """
+        Sign many (path, shop_id, timestamp, access_token) tuples at once.
+        Identical tuples (same shop and path within the same second) are signed once.
+        """
+        signed: Dict[Tuple[str, Any, int, str], str] = {}
+        out = []
+        for entry in entries:
+            sign = signed.get(entry)
+            if sign is None:
+                path, shop_id, timestamp, access_token = entry
+                sign = signed[entry] = self.sign(path, timestamp, access_token, shop_id)
+            out.append(sign)
+        return out
+
+    def encode_params(self, params: Dict[str, Any]) -> str:
+        """`&key=value` query fragment; values are sent as-is like the signed fields."""
+        parts = []
+        for key, value in params.items():
+            prefix = self._param_prefixes.get(key)
+            if prefix is None:
+                prefix = self._param_prefixes[key] = f"&{key}="
+            parts.append(prefix)
+            parts.append(str(value))
+        return "".join(parts)
+
+    def url(self, path: str, shop_id: Any, access_token: str, timestamp: int,
+            params: Optional[Dict[str, Any]] = None, sign: Optional[str] = None) -> str:
+        """Fully signed shop-level URL for `path`."""
+        prefix = self._url_prefixes.get(path)
+        if prefix is None:
+            prefix = self._url_prefixes[path] = f"{self.host}{path}?partner_id={self.partner_id}"
+        if sign is None:
+            sign = self.sign(path, timestamp, access_token, shop_id)
+        url = f"{prefix}&timestamp={timestamp}&shop_id={shop_id}&access_token={access_token}&sign={sign}"
+        if params:
+            url += self.encode_params(params)
+        return url
+
+    def public_url(self, path: str, timestamp: int) -> str:
+        """Signed partner-level URL (no shop_id / access_token), e.g. for token refresh."""
+        sign = self.sign(path, timestamp)
+        return f"{self.host}{path}?partner_id={self.partner_id}&timestamp={timestamp}&sign={sign}"
+
+    def urls(self, entries: List[Tuple[str, Any, str, Dict[str, Any]]], timestamp: int) -> List[str]:
+        """Signed URLs for many (path, shop_id, access_token, params) requests sharing one timestamp."""
+        signs = self.sign_many([(path, shop_id, timestamp, token) for path, shop_id, token, _ in entries])
+        return [
+            self.url(path, shop_id, token, timestamp, params, sign)
+            for (path, shop_id, token, params), sign in zip(entries, signs)
+        ]
+
+
+SIGNER = ShopeeSigner(PARTNER_ID, PARTNER_KEY, HOST)
+
+
 def _sign(path: str, token: str, shop_id: int, timestamp: int) -> str:
     """Generate Shopee API signature."""
-    base_string = f"{PARTNER_ID}{path}{timestamp}{token}{shop_id}".encode()
-    return hmac.new(PARTNER_KEY, base_string, hashlib.sha256).hexdigest()
+    return SIGNER.sign(path, timestamp, token, shop_id)
 
 
-def fetch_item_base_info(shop_id: int, access_token: str, item_ids: List[int]) -> Dict[str, Any]:
+def _shopee_get(path: str, shop_id: int, access_token: str, params: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Fetch product base info from Shopee API.
-    Can fetch up to 50 items at once.
+    Signed GET against a shop-level Shopee endpoint over the shared HTTP session.
+    Transient failures (timeouts, 5xx, throttling, retryable `error` codes) are
+    retried with jittered backoff while the endpoint's retry budget allows;
+    fatal errors and an open circuit breaker raise straight away.
+    Returns the `response` object; raises ShopeeAPIError on failure.
     """
-    ts = int(time.time())
-    sign = _sign(PATH_ITEM_BASE_INFO, access_token, shop_id, ts)
-
-    # Convert item_ids list to comma-separated string
-    item_id_str = ",".join(str(i) for i in item_ids)
-
-    # Request specific fields so the API returns description & variation data
-    fields = "item_id,item_name,description,image,tier_variation"
-
-    url = (
-        f"{HOST}{PATH_ITEM_BASE_INFO}"
-        f"?sign={sign}"
-        f"&shop_id={shop_id}"
-        f"&partner_id={PARTNER_ID}"
-        f"&access_token={access_token}"
-        f"&timestamp={ts}"
-        f"&item_id_list={item_id_str}"
-        f"&need_tax_info=false"
-        f"&need_complaint_policy=false"
-        f"&fields={fields}"
-    )
+    breaker, budget = _endpoint_guards(path)
+    budget.on_request()
+    access_token = TOKENS.fresh_token(shop_id, access_token)
+
+    attempt = 0
+    token_refreshed = False
+    while True:
+        breaker.before_call()
+        try:
+            result = _shopee_get_once(path, shop_id, access_token, params)
+        except ShopeeAPIError as e:
+            if not _record_failure(e, shop_id, breaker):
+                if _is_auth_error(e.error) and not token_refreshed:
+                    # Token expired before the background refresh got to it -
+                    # refresh once (or pick up a fresher token) and try again
+                    token_refreshed = True
+                    fresh_token = TOKENS.refresh_now(shop_id, access_token)
+                    if fresh_token:
+                        access_token = fresh_token
+                        continue
+                raise
+            err = e
+        else:
+            breaker.on_success()
+            return result
+
+        attempt += 1
+        time.sleep(_retry_delay(err, attempt, path, shop_id, budget))
+
+
+def _record_failure(err: ShopeeAPIError, shop_id: int, breaker: CircuitBreaker) -> bool:
+    """Feed a failed attempt to the rate limiter / breaker; True if it may be retried."""
+    if isinstance(err, ShopeeRateLimitError):
+        # Quota hit - not an endpoint health problem, so the breaker is untouched
+        RATE_LIMITER.on_throttle(shop_id)
+        breaker.on_success()
+        return True
+    if not err.retryable:
+        breaker.on_success()
+        return False
+    breaker.on_failure()
+    return True
+
+
+def _retry_delay(err: ShopeeAPIError, attempt: int, path: str, shop_id: int, budget: RetryBudget) -> float:
+    """Backoff before retry number `attempt`; re-raises err when out of attempts or budget."""
+    if attempt >= RETRY_MAX_ATTEMPTS:
+        raise err
+    if not budget.try_spend():
+        print(f"[WARN] Retry budget exhausted for {path}, giving up: {err}")
+        raise err
+    delay = _backoff_delay(attempt - 1)
+    METRICS.inc("retries_total", endpoint=path.rsplit("/", 1)[-1])
+    print(f"[WARN] {err} (shop_id={shop_id}, {path}) - retry {attempt}/{RETRY_MAX_ATTEMPTS - 1} in {delay:.1f}s")
+    return delay
+
+
+def _shopee_get_once(path: str, shop_id: int, access_token: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Single signed GET; see _shopee_get."""
+    endpoint = path.rsplit("/", 1)[-1]
+    with METRICS.timer("rate_limit_wait"):
+        RATE_LIMITER.acquire(shop_id)
+
+    with METRICS.timer("sign"):
+        url = SIGNER.url(path, shop_id, access_token, int(time.time()), params)
+
+    try:
+        with _request_slot(shop_id):
+            start = time.perf_counter()
+            try:
+                resp = get_http_client().get(url, timeout=HTTP_TIMEOUT)
+            finally:
+                _observe_http(endpoint, shop_id, time.perf_counter() - start)
+    except Exception as e:
+        raise _network_error(endpoint, e)
+
+    return _handle_response(resp, endpoint, shop_id)
+
+
+def _observe_http(endpoint: str, shop_id: int, elapsed: float) -> None:
+    METRICS.observe("stage_seconds", elapsed, stage="http")
+    METRICS.observe("http_request_seconds", elapsed, endpoint=endpoint, shop_id=shop_id)
 
-    print(f"[DEBUG] Calling Shopee API for {len(item_ids)} item(s)...")
 
-    resp = requests.get(url, headers={"Accept": "application/json"}, timeout=30)
+def _network_error(endpoint: str, e: Exception) -> ShopeeAPIError:
+    # Connection resets, DNS failures and timeouts are all transient
+    METRICS.inc("api_calls_total", endpoint=endpoint, outcome="network_error")
+    return ShopeeAPIError(f"Shopee request failed: {e}", retryable=True)
+
+
+def _handle_response(resp: Any, endpoint: str, shop_id: int) -> Dict[str, Any]:
+    """
+    Classify a Shopee HTTP response (requests or httpx) and return its
+    `response` object, raising ShopeeRateLimitError / ShopeeAPIError.
+    """
+    METRICS.inc("api_calls_total", endpoint=endpoint, outcome=str(resp.status_code))
+    if _is_rate_limited(resp.status_code, None):
+        METRICS.inc("throttled_total", shop_id=shop_id)
+        raise ShopeeRateLimitError(f"Shopee HTTP {resp.status_code}: {resp.text}", status_code=resp.status_code)
 
     try:
         resp.raise_for_status()
     except Exception as e:
-        raise RuntimeError(f"Shopee HTTP {resp.status_code}: {e} {resp.text}")
+        raise ShopeeAPIError(
+            f"Shopee HTTP {resp.status_code}: {e} {resp.text}",
+            status_code=resp.status_code,
+            retryable=_is_retryable_status(resp.status_code),
+        )
 
-    data = resp.json()
+    try:
+        with METRICS.timer("decode"):
+            data = decode_json(resp.content)
+    except Exception as e:
+        # Gateways occasionally answer with an HTML error page
+        raise ShopeeAPIError(f"Shopee returned invalid JSON: {e}", status_code=resp.status_code, retryable=True)
 
     # Check for API errors
     error = data.get("error")
     if error and error != "" and error != 0:
-        raise RuntimeError(f"Shopee API error: {error} - {data.get('message')}")
+        message = f"Shopee API error: {error} - {data.get('message')}"
+        METRICS.inc("api_errors_total", endpoint=endpoint, error=error)
+        if _is_rate_limited(resp.status_code, error):
+            METRICS.inc("throttled_total", shop_id=shop_id)
+            raise ShopeeRateLimitError(message, error=error, status_code=resp.status_code)
+        raise ShopeeAPIError(message, error=error, status_code=resp.status_code,
+                             retryable=_is_retryable_error(error))
 
     return data.get("response") or {}
 
 
-def fetch_model_list(shop_id: int, access_token: str, item_id: int) -> Dict[str, Any]:
+def fetch_item_base_info(shop_id: int, access_token: str, item_ids: List[int]) -> Dict[str, Any]:
+    """
+    Fetch product base info from Shopee API.
+    Can fetch up to 50 items at once.
+    Items found in the response cache are served from it; only the misses
+    go to Shopee.
+    """
+    cached_items, item_ids = _cached_base_info(shop_id, item_ids)
+    if not item_ids:
+        return {"item_list": cached_items}
+
+    print(f"[DEBUG] Calling Shopee API for {len(item_ids)} item(s)...")
+    response = _shopee_get(PATH_ITEM_BASE_INFO, shop_id, access_token, _base_info_params(item_ids))
+    return _store_base_info(shop_id, response, cached_items)
+
+
+def _cached_base_info(shop_id: int, item_ids: List[int]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """(cached items, item_ids still to fetch)."""
+    cache = get_response_cache()
+    if cache is None:
+        return [], item_ids
+    cached_items: List[Dict[str, Any]] = []
+    missing: List[int] = []
+    for item_id in item_ids:
+        hit = cache.get(shop_id, PATH_ITEM_BASE_INFO, item_id)
+        if hit is not None:
+            cached_items.append(hit)
+        else:
+            missing.append(item_id)
+    return cached_items, missing
+
+
+def _base_info_params(item_ids: List[int]) -> Dict[str, Any]:
+    return {
+        # Convert item_ids list to comma-separated string
+        "item_id_list": ",".join(str(i) for i in item_ids),
+        "need_tax_info": "false",
+        "need_complaint_policy": "false",
+        # Request specific fields so the API returns description & variation data
+        "fields": "item_id,item_name,description,image,tier_variation,update_time",
+    }
+
+
+def _store_base_info(shop_id: int, response: Dict[str, Any],
+                     cached_items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact the fetched items, cache them and merge in the cached ones."""
+    items = [compact_item(item) for item in response.get("item_list") or []]
+    cache = get_response_cache()
+    if cache is not None:
+        for item in items:
+            cache.put(shop_id, PATH_ITEM_BASE_INFO, item["item_id"], item, item.get("update_time"))
+    return {"item_list": cached_items + items}
+
+
+def fetch_model_list(shop_id: int, access_token: str, item_id: int,
+                     update_time: Optional[int] = None) -> Dict[str, Any]:
     """
     Fetch model/variation list for a single item from Shopee API.
-    Returns tier_variation (names + images) and model list.
-    """
-    ts = int(time.time())
-    sign = _sign(PATH_GET_MODEL_LIST, access_token, shop_id, ts)
-
-    url = (
-        f"{HOST}{PATH_GET_MODEL_LIST}"
-        f"?sign={sign}"
-        f"&shop_id={shop_id}"
-        f"&partner_id={PARTNER_ID}"
-        f"&access_token={access_token}"
-        f"&timestamp={ts}"
-        f"&item_id={item_id}"
-    )
+    Returns only its tier_variation (names + images) - see compact_model_list.
+    update_time is the item's base-info update_time; a cached model list
+    recorded against a different update_time is treated as stale.
+    """
+    cache = get_response_cache()
+    if cache is not None:
+        hit = cache.get(shop_id, PATH_GET_MODEL_LIST, item_id, update_time)
+        if hit is not None:
+            return hit
 
-    resp = requests.get(url, headers={"Accept": "application/json"}, timeout=30)
-    resp.raise_for_status()
-    data = resp.json()
+    response = _shopee_get(PATH_GET_MODEL_LIST, shop_id, access_token, {"item_id": item_id})
+    return _store_model_list(shop_id, item_id, update_time, response)
 
-    error = data.get("error")
-    if error and error != "" and error != 0:
-        raise RuntimeError(f"Shopee API error: {error} - {data.get('message')}")
 
-    return data.get("response") or {}
+def _store_model_list(shop_id: int, item_id: int, update_time: Optional[int],
+                      response: Dict[str, Any]) -> Dict[str, Any]:
+    response = compact_model_list(response)
+    cache = get_response_cache()
+    if cache is not None:
+        cache.put(shop_id, PATH_GET_MODEL_LIST, item_id, response, update_time)
+    return response
+
+
+class VariationOption:
+    """One option of a tier, e.g. "Red" with its image."""
 
+    __slots__ = ("option_name", "image_url")
 
-def parse_product_details(item: Dict[str, Any], model_response: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def __init__(self, option_name: str, image_url: Optional[str] = None):
+        self.option_name = option_name
+        self.image_url = image_url
+
+
+class VariationTier:
+    """One tier_variation, e.g. "Color" -> [Red, Blue]."""
+
+    __slots__ = ("tier_name", "options")
+
+    def __init__(self, tier_name: str, options: List[VariationOption]):
+        self.tier_name = tier_name
+        self.options = options
+
+
+class ProductDetails:
+    """
+    Parsed item as stored in shopee_listing_products. listing_values() builds
+    the column values (JSON-encoding the tier option lists) once, however many
+    listing rows share the product.
+    """
+
+    __slots__ = ("item_id", "item_name", "description", "variations", "_listing_values")
+
+    def __init__(self, item_id: int, item_name: str, description: str, variations: List[VariationTier]):
+        self.item_id = item_id
+        self.item_name = item_name
+        self.description = description
+        self.variations = variations
+        self._listing_values: Optional[Tuple[Any, ...]] = None
+
+    def listing_values(self) -> Tuple[Any, ...]:
+        """
+        (shopee_product_name, shopee_description, tier_name_1, t1_variation,
+         shopee_variation_images, tier_name_2, t2_variation)
+        """
+        if self._listing_values is None:
+            tier_1 = self.variations[0] if len(self.variations) > 0 else None
+            tier_2 = self.variations[1] if len(self.variations) > 1 else None
+            self._listing_values = (
+                self.item_name,
+                self.description,
+                tier_1.tier_name if tier_1 else None,
+                json.dumps([opt.option_name for opt in tier_1.options]) if tier_1 else None,
+                json.dumps([opt.image_url for opt in tier_1.options if opt.image_url]) if tier_1 else None,
+                tier_2.tier_name if tier_2 else None,
+                json.dumps([opt.option_name for opt in tier_2.options]) if tier_2 else None,
+            )
+        return self._listing_values
+
+
+def parse_product_details(item: Dict[str, Any], model_response: Optional[Dict[str, Any]] = None) -> ProductDetails:
     """
     Parse item response to extract description, variation names, and variation images.
     Description comes from description_info.extended_description.
-    Variations come from the get_model_list response.
+    Variations come from the get_model_list response when one was fetched,
+    otherwise from the base-info tier_variation (see needs_model_list).
     """
-    item_id = item.get("item_id")
-    item_name = item.get("item_name", "")
-
     # Extract description from extended_description field_list
-    description = ""
+    # (compact_item has already joined it into `description`)
     desc_info = item.get("description_info") or {}
     ext_desc = desc_info.get("extended_description") or {}
     field_list = ext_desc.get("field_list") or []
@@ -157,40 +1273,59 @@ def parse_product_details(item: Dict[str, Any], model_response: Optional[Dict[st
         # Fallback to plain description field
         description = item.get("description", "")
 
-    # Variations from get_model_list response
-    tier_variations = (model_response or {}).get("tier_variation") or []
-
-    result = {
-        "item_id": item_id,
-        "item_name": item_name,
-        "description": description,
-        "variations": []
-    }
+    # Variations from get_model_list response, falling back to base info
+    if model_response is not None:
+        tier_variations = model_response.get("tier_variation") or []
+    else:
+        tier_variations = item.get("tier_variation") or []
+
+    variations = [
+        VariationTier(
+            tier.get("name", ""),  # e.g., "Color", "Size"
+            [
+                VariationOption(opt.get("option", ""), (opt.get("image") or {}).get("image_url"))
+                for opt in tier.get("option_list") or []
+            ],
+        )
+        for tier in tier_variations
+    ]
 
-    for tier in tier_variations:
-        tier_name = tier.get("name", "")  # e.g., "Color", "Size"
-        options = tier.get("option_list") or []
+    return ProductDetails(item.get("item_id"), item.get("item_name", ""), description, variations)
 
-        variation_data = {
-            "tier_name": tier_name,
-            "options": []
-        }
 
-        for opt in options:
-            option_info = {
-                "option_name": opt.get("option", ""),
-                "image_url": None
-            }
-
-            image = opt.get("image")
-            if image:
-                option_info["image_url"] = image.get("image_url")
+# =========================
+# FETCH PLANNER
+# =========================
 
-            variation_data["options"].append(option_info)
+_PLAN_LOCK = threading.Lock()
+PLAN_STATS = {"model_list_needed": 0, "model_list_called": 0, "model_list_avoided": 0}
 
-        result["variations"].append(variation_data)
 
-    return result
+def needs_model_list(item: Dict[str, Any]) -> bool:
+    """
+    Decide whether get_model_list is required for an item with models.
+    The base-info tier_variation is enough when every tier has a name and
+    options, and every tier-1 option (the one stored as shopee_variation_images)
+    carries an image_url. Anything missing -> fetch the model list.
+    """
+    if ALWAYS_FETCH_MODELS:
+        return True
+    tiers = item.get("tier_variation") or []
+    if not tiers:
+        return True
+    for tier in tiers:
+        if not tier.get("name") or not tier.get("option_list"):
+            return True
+    for opt in tiers[0]["option_list"]:
+        if not opt.get("option") or not (opt.get("image") or {}).get("image_url"):
+            return True
+    return False
+
+
+def _record_plan(called: bool) -> None:
+    with _PLAN_LOCK:
+        PLAN_STATS["model_list_needed"] += 1
+        PLAN_STATS["model_list_called" if called else "model_list_avoided"] += 1
 
 
 # =========================
@@ -198,287 +1333,1312 @@ def parse_product_details(item: Dict[str, Any], model_response: Optional[Dict[st
 # =========================
 
 def get_db_connection():
-    """Create database connection."""
-    return mysql.connector.connect(**DB_CFG)
+    """Check out a pooled database connection (close() returns it to the pool)."""
+    return db_pool.get_connection()
 
 
 def fetch_active_shops() -> Dict[int, Dict[str, Any]]:
     """
     Load active shops and tokens from requestDatabase.ShopeeTokens.
-    Returns dict keyed by shop_id for easy lookup.
+    Returns dict keyed by shop_id for easy lookup. Tokens are kept fresh
+    in place by TOKENS (see TokenManager).
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            """
-            SELECT shop_id, shop_name, access_token
-            FROM requestDatabase.ShopeeTokens
-            WHERE access_token IS NOT NULL
-              AND access_token <> ''
-              AND (expires_at IS NULL OR expires_at > UNIX_TIMESTAMP())
-            """
-        )
-        rows = cursor.fetchall()
-        shops: Dict[int, Dict[str, Any]] = {}
-        for shop_id, shop_name, token in rows:
-            shops[int(shop_id)] = {
-                "shop_id": int(shop_id),
-                "shop_name": (shop_name or "").strip(),
-                "access_token": (token or "").strip(),
-            }
-        print(f"[INFO] Loaded {len(shops)} active shop token(s)")
-        return shops
-    finally:
-        cursor.close()
-        conn.close()
+    return TOKENS.load()
+
+
+# Indexes iter_new_variation_items relies on: (table, index name, columns)
+NEW_ITEMS_INDEXES = [
+    ("new_items", "idx_new_items_launch_product", "launch_type, product_id, id"),
+    ("shopee_listing_products", "idx_listing_new_item_id", "new_item_id"),
+]
 
 
-def fetch_new_variation_items() -> List[Dict[str, Any]]:
+def ensure_new_items_indexes() -> None:
     """
-    Fetch product_id from new_items where launch_type = 'New Variation'.
-    Joins with ShopeeTokens to resolve shop name -> shop_id.
+    Create the indexes in NEW_ITEMS_INDEXES that don't exist yet (run with
+    --ensure-indexes). (launch_type, product_id, id) lets the keyset pages
+    below read new_items in order without a filesort.
     """
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for table, name, columns in NEW_ITEMS_INDEXES:
+                cursor.execute(
+                    """
+                    SELECT 1 FROM information_schema.statistics
+                    WHERE table_schema = 'requestDatabase' AND table_name = %s AND index_name = %s
+                    LIMIT 1
+                    """,
+                    (table, name),
+                )
+                if cursor.fetchone():
+                    continue
+                # Also skip when some other index already leads with these columns
+                cursor.execute(
+                    """
+                    SELECT index_name, GROUP_CONCAT(column_name ORDER BY seq_in_index SEPARATOR ', ')
+                    FROM information_schema.statistics
+                    WHERE table_schema = 'requestDatabase' AND table_name = %s
+                    GROUP BY index_name
+                    """,
+                    (table,),
+                )
+                if any(cols.startswith(columns) for _, cols in cursor.fetchall()):
+                    continue
+                print(f"[DB] Creating index {name} ON {table} ({columns})")
+                cursor.execute(f"CREATE INDEX {name} ON requestDatabase.{table} ({columns})")
+        finally:
+            cursor.close()
+
+
+def _shop_key(name: Optional[str]) -> str:
+    """
+    Shop name folded at least as leniently as MySQL's default *_ai_ci
+    collations compare it: case, accents and whitespace differences are ignored.
+    """
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
+
+
+def iter_new_variation_items(shops: Dict[int, Dict[str, Any]], page_size: int = DB_READ_PAGE_SIZE,
+                             only_unsynced: bool = False,
+                             product_range: Optional[Tuple[int, int]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Stream product_id rows from new_items where launch_type = 'New Variation'.
+
+    Shop names are resolved to shop_id from the already-loaded shops instead
+    of joining ShopeeTokens on a collation cast (which can't use an index):
+    only rows of shops with a token are selected, matching on ni.shop's own
+    collation, and mapped back with the equally lenient _shop_key. Rows
+    without a shopee_listing_products row - nothing to update - are filtered
+    out with EXISTS (a JOIN would repeat a row per listing row and upset the
+    keyset paging), and with only_unsynced so are rows whose listing already
+    has Shopee data.
+
+    Rows come ordered by product_id so all rows of one product are adjacent,
+    paged by keyset (product_id, id) page_size at a time. product_range
+    (inclusive) limits the scan to one shard of product_ids.
+    """
+    shop_ids_by_name: Dict[str, int] = {}
+    for shop_id, shop in shops.items():
+        if shop["shop_name"]:
+            shop_ids_by_name[_shop_key(shop["shop_name"])] = shop_id
+    if not shop_ids_by_name:
+        return
+
+    shop_names = [shop["shop_name"] for shop in shops.values() if shop["shop_name"]]
+    placeholders = ", ".join(["%s"] * len(shop_names))
+    unsynced = "AND p.shopee_product_name IS NULL" if only_unsynced else ""
+    in_range = "AND ni.product_id BETWEEN %s AND %s" if product_range else ""
+    range_params = list(product_range) if product_range else []
+    query = f"""
+        SELECT ni.id, ni.product_id, ni.shop, ni.product_name_en, ni.launch_type
+        FROM requestDatabase.new_items ni
+        WHERE ni.launch_type = 'New Variation'
+          AND ni.product_id IS NOT NULL
+          AND ni.shop IN ({placeholders})
+          AND EXISTS (
+              SELECT 1 FROM requestDatabase.shopee_listing_products p
+              WHERE p.new_item_id = ni.id {unsynced}
+          )
+          {in_range}
+          AND (ni.product_id > %s OR (ni.product_id = %s AND ni.id > %s))
+        ORDER BY ni.product_id, ni.id
+        LIMIT %s
+    """
+
+    unmatched: set = set()
+    last_product_id, last_id = -1, -1
     conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute(
-            """
-            SELECT ni.id, ni.product_id, st.shop_id, ni.product_name_en, ni.launch_type
-            FROM requestDatabase.new_items ni
-            LEFT JOIN requestDatabase.ShopeeTokens st
-              ON ni.shop = st.shop_name COLLATE utf8mb4_0900_ai_ci
-            WHERE ni.launch_type = 'New Variation'
-              AND ni.product_id IS NOT NULL
-            """
-        )
-        rows = cursor.fetchall()
-        items: List[Dict[str, Any]] = []
-        for row_id, product_id, shop_id, product_name, launch_type in rows:
-            items.append({
-                "row_id": row_id,
-                "product_id": int(product_id) if product_id else None,
-                "shop_id": int(shop_id) if shop_id else None,
-                "product_name": (product_name or "").strip(),
-                "launch_type": launch_type,
-            })
-        print(f"[INFO] Found {len(items)} item(s) with launch_type = 'New Variation'")
-        return items
+        while True:
+            cursor = conn.cursor()
+            try:
+                with METRICS.timer("db_read"):
+                    cursor.execute(query, shop_names + range_params + [last_product_id, last_product_id, last_id, page_size])
+                    rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+            for row_id, product_id, shop_name, product_name, launch_type in rows:
+                shop_id = shop_ids_by_name.get(_shop_key(shop_name))
+                if shop_id is None and shop_name not in unmatched:
+                    # MySQL matched it but we can't tell which shop - counted as skipped
+                    unmatched.add(shop_name)
+                    print(f"[WARN] new_items shop {shop_name!r} matches no ShopeeTokens shop_name, skipping its rows")
+                yield {
+                    "row_id": row_id,
+                    "product_id": int(product_id) if product_id else None,
+                    "shop_id": shop_id,
+                    "product_name": (product_name or "").strip(),
+                    "launch_type": launch_type,
+                }
+            if len(rows) < page_size:
+                return
+            last_product_id, last_id = rows[-1][1], rows[-1][0]
     finally:
-        cursor.close()
         conn.close()
 
 
-DB_CFG_WEBAPP = dict(
-    host=os.environ.get("DB_HOST", "localhost"),
-    user="root",
-    password=os.environ["DB_PASSWORD"],
-    database="requestDatabase",
+def listing_row(details: ProductDetails, new_item_id: int) -> Tuple[Any, ...]:
+    """
+    Build one shopee_listing_products update row:
+    (new_item_id, shopee_product_name, shopee_description, tier_name_1,
+     t1_variation, shopee_variation_images, tier_name_2, t2_variation)
+    """
+    return (new_item_id,) + details.listing_values()
+
+
+_LISTING_COLUMNS = (
+    "shopee_product_name",
+    "shopee_description",
+    "tier_name_1",
+    "t1_variation",
+    "shopee_variation_images",
+    "tier_name_2",
+    "t2_variation",
 )
 
 
-def save_to_db(shop_name: str, details: Dict[str, Any], new_item_id: int) -> None:
-    """Update product details in shopee_listing_products by new_item_id."""
-    conn = mysql.connector.connect(**DB_CFG_WEBAPP)
-    cursor = conn.cursor()
+class ListingWriter:
+    """
+    Buffers shopee_listing_products updates and flushes them as one multi-row
+    UPDATE ... JOIN per batch over a single connection, committing once per batch.
+    Only existing rows are updated (same as the old per-row UPDATE).
+    on_flush(done_row_ids, failed_row_ids) is called after every flush.
+    """
+
+    def __init__(self, batch_size: int = DB_WRITE_BATCH_SIZE,
+                 on_flush: Optional[Callable[[List[int], List[int]], None]] = None):
+        self.batch_size = batch_size
+        self.on_flush = on_flush
+        self.updated = 0
+        self.missing = 0
+        self.failed_row_ids: set = set()
+        self._rows: List[Tuple[Any, ...]] = []
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def add(self, details: ProductDetails, new_item_id: int) -> None:
+        with self._lock:
+            self._rows.append(listing_row(details, new_item_id))
+            if len(self._rows) >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_locked()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _connection(self):
+        # Hold one pooled connection for the whole run
+        if self._conn is None:
+            self._conn = get_db_connection()
+        return self._conn
+
+    def _flush_locked(self) -> None:
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        # Last write wins if the same new_item_id was queued twice
+        rows = list({row[0]: row for row in rows}.values())
+        row_ids = [row[0] for row in rows]
+
+        cursor = None
+        start = time.perf_counter()
+        try:
+            conn = self._connection()
+            cursor = conn.cursor()
+
+            placeholders = ", ".join(["%s"] * len(row_ids))
+            cursor.execute(
+                f"SELECT new_item_id FROM {LISTING_TABLE} WHERE new_item_id IN ({placeholders})",
+                row_ids,
+            )
+            existing = {r[0] for r in cursor.fetchall()}
+            rows = [row for row in rows if row[0] in existing]
+
+            if rows:
+                select_one = "SELECT " + ", ".join(
+                    ["%s AS new_item_id"] + [f"%s AS {col}" for col in _LISTING_COLUMNS]
+                )
+                derived = " UNION ALL ".join([select_one] * len(rows))
+                assignments = ",\n                    ".join(f"p.{col} = v.{col}" for col in _LISTING_COLUMNS)
+                cursor.execute(
+                    f"""
+                    UPDATE {LISTING_TABLE} p
+                    JOIN ({derived}) v ON p.new_item_id = v.new_item_id
+                    SET {assignments}
+                    """,
+                    [value for row in rows for value in row],
+                )
+            conn.commit()
+
+            self.updated += len(rows)
+            self.missing += len(row_ids) - len(rows)
+            print(f"[DB] Flushed {len(row_ids)} row(s): {len(rows)} updated, "
+                  f"{len(row_ids) - len(rows)} with no matching row")
+            if self.on_flush:
+                self.on_flush(row_ids, [])
+        except Exception as db_err:
+            print(f"[DB ERROR] Failed to flush {len(row_ids)} row(s) (new_item_id {row_ids[0]}..{row_ids[-1]}): {db_err}")
+            self.failed_row_ids.update(row_ids)
+            try:
+                if self._conn is not None:
+                    self._conn.rollback()
+            except Exception:
+                # Hand the broken connection back; the pool health-checks it on next checkout
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+            if self.on_flush:
+                self.on_flush([], row_ids)
+        finally:
+            if cursor is not None:
+                cursor.close()
+            METRICS.observe("stage_seconds", time.perf_counter() - start, stage="write")
+
+
+# =========================
+# TOKENS
+# =========================
+
+class TokenManager:
+    """
+    In-memory cache of ShopeeTokens with background refresh.
+
+    load() only reads ShopeeTokens and returns the shop dicts used throughout
+    the run. Refreshing is lazy: the first real call for a shop whose token is
+    within TOKEN_REFRESH_MARGIN of expires_at refreshes it (fresh_token), and
+    a daemon thread keeps long runs ahead of expiry. A refresh goes through
+    PATH_REFRESH_TOKEN, swaps shop["access_token"] in place and writes the new
+    tokens (and the rotated refresh_token) back to ShopeeTokens, since the old
+    refresh_token stops working once it is used.
+
+    In DRY_RUN nothing is refreshed: rotating the refresh_token from a dry run
+    or benchmark would break any other process holding it. A token someone
+    else already refreshed in ShopeeTokens is still picked up.
+
+    A shop is only usable while its access token is unexpired or can still be
+    refreshed. Expired shops are left out at load() in DRY_RUN or without a
+    refresh_token, and dropped from shops once a refresh fails and the token
+    has run out, so their products are skipped ("No token found") instead of
+    failing every call with an auth error. Failed refreshes back off (doubling
+    from check_interval up to TOKEN_RETRY_MAX), which also bounds how often
+    ShopeeTokens is re-read for them.
+    """
+
+    def __init__(self, refresh_margin: int = TOKEN_REFRESH_MARGIN,
+                 check_interval: int = TOKEN_CHECK_INTERVAL):
+        self.refresh_margin = refresh_margin
+        self.check_interval = check_interval
+        self.shops: Dict[int, Dict[str, Any]] = {}
+        self._refresh_tokens: Dict[int, str] = {}
+        self._expires_at: Dict[int, int] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._retry_at: Dict[int, float] = {}
+        self._failures: Dict[int, int] = {}
+        self._dry_run_skipped: set = set()
+        self.refreshed = 0
+        self.refresh_failures = 0
+
+    def load(self) -> Dict[int, Dict[str, Any]]:
+        """Read ShopeeTokens once. Nothing is refreshed here - see fresh_token()."""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                """
+                SELECT shop_id, shop_name, access_token, refresh_token, expires_at
+                FROM requestDatabase.ShopeeTokens
+                WHERE (access_token IS NOT NULL AND access_token <> '')
+                   OR (refresh_token IS NOT NULL AND refresh_token <> '')
+                """
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        now = int(time.time())
+        unusable = 0
+        for shop_id, shop_name, token, refresh_token, expires_at in rows:
+            shop_id = int(shop_id)
+            expires_at = int(expires_at) if expires_at else 0
+            token = (token or "").strip()
+            refresh_token = (refresh_token or "").strip()
+            expired = not token or (expires_at and expires_at <= now)
+            if expired and (DRY_RUN or not refresh_token):
+                # Nothing can bring this token back this run
+                unusable += 1
+                continue
+            self.shops[shop_id] = {
+                "shop_id": shop_id,
+                "shop_name": (shop_name or "").strip(),
+                "access_token": token,
+            }
+            self._refresh_tokens[shop_id] = refresh_token
+            self._expires_at[shop_id] = expires_at
+            self._locks[shop_id] = threading.Lock()
+
+        stale = [shop_id for shop_id in self.shops if self.needs_refresh(shop_id, now)]
+        print(f"[INFO] Loaded {len(self.shops)} active shop token(s)"
+              + (f", {len(stale)} to refresh on first use" if stale else ""))
+        if unusable:
+            print(f"[WARN] Skipping {unusable} shop(s) with an expired token that "
+                  + ("is not refreshed in DRY_RUN" if DRY_RUN else "has no refresh_token"))
+        return self.shops
+
+    def needs_refresh(self, shop_id: int, now: Optional[float] = None) -> bool:
+        """True when a known shop's token is missing or within refresh_margin of expiry."""
+        shop = self.shops.get(shop_id)
+        if shop is None:
+            return False
+        now = time.time() if now is None else now
+        expires_at = self._expires_at.get(shop_id, 0)
+        return not shop["access_token"] or bool(expires_at and expires_at <= now + self.refresh_margin)
+
+    def fresh_token(self, shop_id: int, access_token: str) -> str:
+        """
+        Token to use for a call about to be made: access_token as-is unless it
+        is about to expire, in which case it is refreshed first (once per shop,
+        failed refreshes back off). Raises ShopeeAPIError when the shop has no
+        usable token left.
+        """
+        if not self.needs_refresh(shop_id):
+            return access_token
+        with self._locks[shop_id]:
+            shop = self.shops.get(shop_id)  # None once another caller dropped it
+            if shop is None or not self._ensure_locked(shop_id):
+                raise ShopeeAPIError(f"No valid access token for shop_id={shop_id} (refresh failed)")
+            return shop["access_token"] or access_token
+
+    def _ensure_locked(self, shop_id: int) -> bool:
+        """Refresh if due and allowed; drops the shop and returns False once its token is unusable."""
+        if self.needs_refresh(shop_id):
+            self._try_refresh_locked(shop_id)
+        expires_at = self._expires_at.get(shop_id, 0)
+        if self.shops[shop_id]["access_token"] and not (expires_at and expires_at <= time.time()):
+            return True
+        # Products read from now on are skipped with "No token found"
+        del self.shops[shop_id]
+        print(f"[WARN] shop_id={shop_id}: access token expired and could not be refreshed, skipping this shop")
+        return False
+
+    def _try_refresh_locked(self, shop_id: int) -> bool:
+        """_refresh_locked, unless the shop's last failure is still backing off."""
+        now = time.monotonic()
+        if now < self._retry_at.get(shop_id, 0):
+            return False
+        if self._refresh_locked(shop_id):
+            self._failures.pop(shop_id, None)
+            self._retry_at.pop(shop_id, None)
+            return True
+        failures = self._failures[shop_id] = self._failures.get(shop_id, 0) + 1
+        self._retry_at[shop_id] = now + min(self.check_interval * 2 ** (failures - 1), TOKEN_RETRY_MAX)
+        return False
+
+    def start(self) -> None:
+        """Start the background refresher (no-op if already running)."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="token-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def refresh_now(self, shop_id: int, stale_token: str) -> Optional[str]:
+        """
+        Called after Shopee rejected stale_token. Returns a fresher token -
+        refreshing only if nobody else already has - or None if there is none.
+        """
+        shop = self.shops.get(shop_id)
+        if shop is None:
+            return None
+        with self._locks[shop_id]:
+            if shop["access_token"] != stale_token:
+                return shop["access_token"]
+            if self._try_refresh_locked(shop_id):
+                return shop["access_token"]
+        return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.check_interval):
+            for shop_id in list(self.shops):
+                if self.needs_refresh(shop_id):
+                    with self._locks[shop_id]:
+                        if shop_id in self.shops:
+                            self._ensure_locked(shop_id)
+
+    def _refresh_locked(self, shop_id: int) -> bool:
+        # Another process may have refreshed this shop already - adopt its token
+        # rather than spending (and rotating) the refresh_token again
+        if self._reload_from_db(shop_id):
+            return True
+
+        if DRY_RUN:
+            if shop_id not in self._dry_run_skipped:
+                self._dry_run_skipped.add(shop_id)
+                print(f"[WARN] shop_id={shop_id}: token needs a refresh, skipped in DRY_RUN (it would rotate the refresh_token)")
+            return False
+
+        refresh_token = self._refresh_tokens.get(shop_id)
+        if not refresh_token:
+            return False
+        try:
+            resp = get_http_client().post(
+                SIGNER.public_url(PATH_REFRESH_TOKEN, int(time.time())),
+                json={"refresh_token": refresh_token, "partner_id": PARTNER_ID, "shop_id": shop_id},
+                timeout=HTTP_TIMEOUT,
+            )
+            data = resp.json()
+        except Exception as e:
+            self.refresh_failures += 1
+            print(f"[WARN] shop_id={shop_id}: token refresh failed: {e}")
+            return False
+
+        error = data.get("error")
+        if (error and error != 0) or not data.get("access_token"):
+            self.refresh_failures += 1
+            print(f"[WARN] shop_id={shop_id}: token refresh rejected: {error} - {data.get('message')}")
+            return False
+
+        expires_at = int(time.time()) + int(data.get("expire_in") or 0)
+        self._store(shop_id, data["access_token"], data.get("refresh_token") or refresh_token, expires_at)
+        self.refreshed += 1
+        print(f"[INFO] shop_id={shop_id}: access token refreshed (expires {datetime.fromtimestamp(expires_at):%H:%M:%S})")
+        return True
+
+    def _reload_from_db(self, shop_id: int) -> bool:
+        """Pick up a token someone else refreshed; True if it is fresher than ours and still valid."""
+        try:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(
+                        """
+                        SELECT access_token, refresh_token, expires_at
+                        FROM requestDatabase.ShopeeTokens
+                        WHERE shop_id = %s
+                        """,
+                        (shop_id,),
+                    )
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+        except Exception as e:
+            print(f"[WARN] shop_id={shop_id}: could not re-read ShopeeTokens: {e}")
+            return False
+        if not row:
+            return False
+
+        token, refresh_token, expires_at = row
+        expires_at = int(expires_at) if expires_at else 0
+        if expires_at <= self._expires_at.get(shop_id, 0) or expires_at <= int(time.time()) + self.refresh_margin:
+            return False
+        self._apply(shop_id, (token or "").strip(), (refresh_token or "").strip(), expires_at)
+        return True
+
+    def _apply(self, shop_id: int, token: str, refresh_token: str, expires_at: int) -> None:
+        self._refresh_tokens[shop_id] = refresh_token
+        self._expires_at[shop_id] = expires_at
+        # Single assignment - workers reading shop["access_token"] see old or new, never partial
+        self.shops[shop_id]["access_token"] = token
+
+    def _store(self, shop_id: int, token: str, refresh_token: str, expires_at: int) -> None:
+        self._apply(shop_id, token, refresh_token, expires_at)
+        try:
+            with db_pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(
+                        """
+                        UPDATE requestDatabase.ShopeeTokens
+                        SET access_token = %s, refresh_token = %s, expires_at = %s
+                        WHERE shop_id = %s
+                        """,
+                        (token, refresh_token, expires_at, shop_id),
+                    )
+                    conn.commit()
+                finally:
+                    cursor.close()
+        except Exception as e:
+            # The in-memory token still works for this run; the next run will
+            # fall back to the stored refresh_token
+            print(f"[ERROR] shop_id={shop_id}: failed to save refreshed token: {e}")
+
+
+TOKENS = TokenManager()
+
+
+# =========================
+# INCREMENTAL SYNC
+# =========================
+
+def load_sync_state() -> Dict[str, Any]:
+    """
+    Load per-shop watermarks from SYNC_STATE_FILE.
+    Shape: {"shops": {"<shop_id>": {"last_sync": ts, "synced_rows": [row_id, ...]}}}
+    """
+    if not os.path.exists(SYNC_STATE_FILE):
+        return {"shops": {}}
+    try:
+        with open(SYNC_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        state.setdefault("shops", {})
+        for shop_state in state["shops"].values():
+            shop_state["synced_rows"] = set(shop_state.get("synced_rows") or [])
+        return state
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Could not read sync state {SYNC_STATE_FILE} ({e}), running full sync")
+        return {"shops": {}}
+
+
+def save_sync_state(state: Dict[str, Any]) -> None:
+    """Atomically write the sync state (write temp file, then replace)."""
+    tmp_path = SYNC_STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, default=sorted)  # synced_rows sets -> sorted lists
+    os.replace(tmp_path, SYNC_STATE_FILE)
+
+
+def fetch_updated_item_ids(shop_id: int, access_token: str, since: int, until: int) -> set:
+    """Item IDs whose Shopee update_time falls in [since, until], via get_item_list."""
+    updated = set()
+    offset = 0
+    while True:
+        response = _shopee_get(PATH_GET_ITEM_LIST, shop_id, access_token, {
+            "offset": offset,
+            "page_size": 100,
+            "update_time_from": since,
+            "update_time_to": until,
+            "item_status": "NORMAL",
+        })
+        cache = get_response_cache()
+        for entry in response.get("item") or []:
+            updated.add(int(entry["item_id"]))
+            if cache is not None:
+                # Anything cached before this edit is stale
+                cache.invalidate(shop_id, int(entry["item_id"]), entry.get("update_time"))
+        if not response.get("has_next_page"):
+            return updated
+        offset = response.get("next_offset") or offset + 100
+
+
+def changed_item_ids(shop: Dict[str, Any], shop_state: Dict[str, Any], run_started: int) -> Optional[set]:
+    """
+    Item IDs updated on Shopee since the shop's last watermark, or None when
+    the shop must be fully synced (no watermark yet, or get_item_list failed).
+    """
+    last_sync = shop_state.get("last_sync")
+    if not last_sync:
+        print(f"[INFO] No watermark for shop_id={shop['shop_id']}, running full sync for this shop")
+        return None
+
     try:
-        variations = details.get("variations") or []
-
-        # Tier 1
-        tier_name_1 = variations[0]["tier_name"] if len(variations) > 0 else None
-        t1_variation = json.dumps(
-            [opt["option_name"] for opt in variations[0]["options"]]
-        ) if len(variations) > 0 else None
-        variation_images = json.dumps(
-            [opt["image_url"] for opt in variations[0]["options"] if opt.get("image_url")]
-        ) if len(variations) > 0 else None
-
-        # Tier 2
-        tier_name_2 = variations[1]["tier_name"] if len(variations) > 1 else None
-        t2_variation = json.dumps(
-            [opt["option_name"] for opt in variations[1]["options"]]
-        ) if len(variations) > 1 else None
-
-        cursor.execute(
+        changed = fetch_updated_item_ids(
+            shop["shop_id"], shop["access_token"],
+            int(last_sync) - SYNC_WATERMARK_OVERLAP, run_started,
+        )
+    except Exception as e:
+        print(f"[WARN] get_item_list failed for shop_id={shop['shop_id']} ({e}), running full sync for this shop")
+        return None
+
+    print(
+        f"[INFO] Incremental: shop_id={shop['shop_id']} has {len(changed)} item(s) updated on Shopee "
+        f"since {datetime.fromtimestamp(int(last_sync))}"
+    )
+    return changed
+
+
+def needs_sync(rows: List[Dict[str, Any]], changed: Optional[set], shop_state: Dict[str, Any]) -> bool:
+    """
+    A product (all of its new_items rows) is fetched if its Shopee item changed
+    or any of its rows was never synced, so all of its rows stay consistent.
+    """
+    if changed is None or rows[0]["product_id"] in changed:
+        return True
+    synced_rows = shop_state.get("synced_rows") or set()
+    return any(row["row_id"] not in synced_rows for row in rows)
+
+
+def mark_synced(shop_state: Dict[str, Any], row_ids: Iterable[int]) -> None:
+    """Remember rows that were written successfully."""
+    shop_state.setdefault("synced_rows", set()).update(row_ids)
+
+
+def advance_watermarks(sync_state: Dict[str, Any], shops: Dict[int, Dict[str, Any]],
+                       stats: "RunStats", run_started: int) -> None:
+    """
+    Move every shop's watermark to run_started. A product that failed this run
+    may have been synced by an earlier one and edited on Shopee before
+    run_started; its rows are dropped from synced_rows so needs_sync fetches
+    it again even though get_item_list will no longer report the edit.
+    """
+    for shop_id in shops:
+        shop_state = sync_state["shops"].setdefault(str(shop_id), {})
+        shop_state.setdefault("synced_rows", set()).difference_update(stats.failed_rows.get(shop_id, ()))
+        shop_state["last_sync"] = run_started
+
+
+# =========================
+# CHECKPOINT JOURNAL
+# =========================
+
+class CheckpointJournal:
+    """
+    SQLite journal of a live run's progress, so a crashed run can be resumed
+    with --resume instead of starting over.
+
+    A product is journalled as in flight when its batch enters the pipeline
+    and as done once every shopee_listing_products row for it is committed.
+    Resuming reuses the last unfinished run: done products are skipped and
+    in-flight ones are simply fetched again. A run that reaches the end is
+    marked finished and its entries are dropped.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoint_runs (
+                run_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+                started  INTEGER NOT NULL,
+                finished INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_items (
+                run_id     INTEGER NOT NULL,
+                shop_id    INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                state      TEXT    NOT NULL,   -- 'inflight' | 'done'
+                updated_at INTEGER NOT NULL,
+                PRIMARY KEY (run_id, shop_id, product_id)
+            );
             """
-            UPDATE shopee_listing_products
-            SET shopee_product_name = %s,
-                shopee_description = %s,
-                tier_name_1 = %s,
-                t1_variation = %s,
-                shopee_variation_images = %s,
-                tier_name_2 = %s,
-                t2_variation = %s
-            WHERE new_item_id = %s
-            """,
-            (
-                details["item_name"],
-                details["description"],
-                tier_name_1,
-                t1_variation,
-                variation_images,
-                tier_name_2,
-                t2_variation,
-                new_item_id,
-            ),
         )
-        conn.commit()
-        return cursor.rowcount > 0
-    finally:
-        cursor.close()
-        conn.close()
+        self._db.commit()
+        self.run_id: Optional[int] = None
+        self._done: set = set()
+
+    def begin(self, resume: bool, run_started: int) -> None:
+        """Start a new run, or with resume=True pick up the last unfinished one."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT run_id, started FROM checkpoint_runs WHERE finished IS NULL ORDER BY run_id DESC LIMIT 1"
+            ).fetchone()
+            if resume and row is not None:
+                self.run_id = row[0]
+                self._done = {
+                    (shop_id, product_id)
+                    for shop_id, product_id in self._db.execute(
+                        "SELECT shop_id, product_id FROM checkpoint_items WHERE run_id = ? AND state = 'done'",
+                        (self.run_id,),
+                    )
+                }
+                inflight = self._db.execute(
+                    "SELECT COUNT(*) FROM checkpoint_items WHERE run_id = ? AND state = 'inflight'",
+                    (self.run_id,),
+                ).fetchone()[0]
+                print(f"[INFO] Resuming run #{self.run_id} from {datetime.fromtimestamp(row[1]):%Y-%m-%d %H:%M:%S}: "
+                      f"{len(self._done)} product(s) done, {inflight} in flight will be re-fetched")
+                return
+
+            if resume:
+                print("[INFO] No unfinished run to resume, starting a new one")
+            # Abandon any unfinished run - a non-resumed run redoes everything anyway
+            self._db.execute("DELETE FROM checkpoint_items")
+            self._db.execute("UPDATE checkpoint_runs SET finished = 0 WHERE finished IS NULL")
+            self.run_id = self._db.execute(
+                "INSERT INTO checkpoint_runs (started) VALUES (?)", (run_started,)
+            ).lastrowid
+            self._db.commit()
+            self._done = set()
+
+    def is_done(self, shop_id: int, product_id: int) -> bool:
+        return (shop_id, product_id) in self._done
+
+    def start_batch(self, shop_id: int, product_ids: List[int]) -> None:
+        self._set_state(shop_id, product_ids, "inflight")
+
+    def mark_done(self, keys: List[Tuple[int, int]]) -> None:
+        """keys are (shop_id, product_id) pairs whose rows are all committed."""
+        now = int(time.time())
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO checkpoint_items (run_id, shop_id, product_id, state, updated_at) "
+                "VALUES (?, ?, ?, 'done', ?)",
+                [(self.run_id, shop_id, product_id, now) for shop_id, product_id in keys],
+            )
+            self._db.commit()
+            self._done.update(keys)
+
+    def _set_state(self, shop_id: int, product_ids: List[int], state: str) -> None:
+        now = int(time.time())
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO checkpoint_items (run_id, shop_id, product_id, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.run_id, shop_id, product_id, state, now) for product_id in product_ids],
+            )
+            self._db.commit()
+
+    def finish(self) -> None:
+        """Mark the run complete; its entries are no longer needed."""
+        with self._lock:
+            self._db.execute("UPDATE checkpoint_runs SET finished = ? WHERE run_id = ?",
+                             (int(time.time()), self.run_id))
+            self._db.execute("DELETE FROM checkpoint_items WHERE run_id = ?", (self.run_id,))
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
 
 
 # =========================
 # MAIN LOGIC
 # =========================
 
-def print_product_details(details: Dict[str, Any]) -> None:
+def print_product_details(details: ProductDetails) -> None:
     """Pretty print product details."""
     print("\n" + "=" * 80)
-    print(f"ITEM ID: {details['item_id']}")
-    print(f"ITEM NAME: {details['item_name']}")
+    print(f"ITEM ID: {details.item_id}")
+    print(f"ITEM NAME: {details.item_name}")
     print("-" * 80)
 
     print("\nDESCRIPTION:")
-    desc = details['description']
+    desc = details.description
     if len(desc) > 500:
         print(f"{desc[:500]}...\n[truncated, total {len(desc)} chars]")
     else:
         print(desc if desc else "(No description)")
 
     print("\nVARIATIONS:")
-    if not details['variations']:
+    if not details.variations:
         print("  (No variations)")
     else:
-        for var in details['variations']:
-            print(f"\n  [{var['tier_name']}]")
-            for opt in var['options']:
-                img_status = f"[Y] {opt['image_url']}" if opt['image_url'] else "[N] No image"
-                print(f"    \u2022 {opt['option_name']}")
+        for var in details.variations:
+            print(f"\n  [{var.tier_name}]")
+            for opt in var.options:
+                img_status = f"[Y] {opt.image_url}" if opt.image_url else "[N] No image"
+                print(f"    \u2022 {opt.option_name}")
                 print(f"      Image: {img_status}")
 
     print("=" * 80)
 
 
-def main():
-    print(f"\n{'='*60}")
-    print("SHOPEE PRODUCT VARIATION FETCHER")
-    print(f"Mode: {'DRY RUN (no DB writes)' if DRY_RUN else 'LIVE'}")
-    print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*60}\n")
+class RunStats:
+    """Counters shared by the pipeline stages. Holds no per-item payloads."""
 
-    # Step 1: Load active shops (for access tokens)
-    shops = fetch_active_shops()
-    if not shops:
-        print("[ERROR] No active shops found. Exiting.")
-        sys.exit(1)
+    def __init__(self):
+        self.read = 0
+        self.skipped = 0
+        self.unchanged = 0
+        self.resumed = 0
+        self.processed = 0
+        self.failed_by_shop: Dict[int, List[int]] = {}
+        # new_items rows not written this run, per shop (incremental runs re-fetch them)
+        self.failed_rows: Dict[int, set] = {}
+        self._lock = threading.Lock()
+
+    def add_failed(self, shop_id: int, product_ids: List[int], row_ids: Iterable[int] = ()) -> None:
+        with self._lock:
+            self.failed_by_shop.setdefault(shop_id, []).extend(product_ids)
+            self.failed_rows.setdefault(shop_id, set()).update(row_ids)
+
+    def add_unwritten(self, shop_id: int, row_ids: Iterable[int]) -> None:
+        """Rows whose listing write failed; the product itself was fetched fine."""
+        with self._lock:
+            self.failed_rows.setdefault(shop_id, set()).update(row_ids)
+
+    def add_processed(self) -> None:
+        with self._lock:
+            self.processed += 1
+
+
+_STOP = object()
+
+
+def _run_stage(name: str, workers: int, handler: Callable[[Any], None],
+               in_q: "queue.Queue", out_q: Optional["queue.Queue"]) -> List[threading.Thread]:
+    """
+    Start `workers` threads that feed in_q tasks to handler until _STOP.
+    The last worker to finish forwards _STOP to out_q.
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            task = in_q.get()
+            if task is _STOP:
+                in_q.put(_STOP)  # let sibling workers see it too
+                break
+            try:
+                handler(task)
+            except Exception as e:
+                # Handlers report their own failures; never let a stage thread die
+                print(f"[ERROR] {name} stage: {e}")
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and out_q is not None:
+            out_q.put(_STOP)
+
+    threads = [threading.Thread(target=worker, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+    for t in threads:
+        t.start()
+    return threads
+
+
+def iter_shop_batches(items: Iterator[Dict[str, Any]], shops: Dict[int, Dict[str, Any]],
+                      stats: RunStats, sync_state: Dict[str, Any], incremental: bool,
+                      run_started: int, journal: Optional[CheckpointJournal] = None,
+                      batch_size: int = 50) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Group the product_id-ordered row stream into per-shop batches of up to
+    batch_size unique product_ids (Shopee's get_item_base_info limit).
+    Only one partial batch per shop is held at a time. Products the journal
+    already has as done (resumed run) are skipped.
+    """
+    pending: Dict[int, Dict[int, List[Dict[str, Any]]]] = {}
+    changed_by_shop: Dict[int, Optional[set]] = {}
+
+    def product_groups():
+        group: List[Dict[str, Any]] = []
+        for item in items:
+            stats.read += 1
+            if group and item["product_id"] != group[0]["product_id"]:
+                yield group
+                group = []
+            group.append(item)
+        if group:
+            yield group
+
+    for group in product_groups():
+        # Rows of one product_id can belong to different shops
+        by_shop: Dict[Optional[int], List[Dict[str, Any]]] = {}
+        for item in group:
+            by_shop.setdefault(item["shop_id"], []).append(item)
+
+        for shop_id, rows in by_shop.items():
+            if not shop_id or shop_id not in shops:
+                if shop_id:
+                    print(f"[WARN] No token found for shop_id={shop_id}, skipping product_id={rows[0]['product_id']}")
+                stats.skipped += len(rows)
+                continue
 
-    # Step 2: Fetch items from new_items where launch_type = 'New Variation'
-    items = fetch_new_variation_items()
-    if not items:
-        print("[WARN] No items with launch_type = 'New Variation' found. Exiting.")
-        sys.exit(0)
+            if journal is not None and journal.is_done(shop_id, rows[0]["product_id"]):
+                stats.resumed += len(rows)
+                continue
 
-    # Step 3: Group items by shop_id for batch processing
-    items_by_shop: Dict[int, List[Dict[str, Any]]] = {}
-    skipped_items = []
+            if incremental:
+                if shop_id not in changed_by_shop:
+                    changed_by_shop[shop_id] = changed_item_ids(
+                        shops[shop_id], sync_state["shops"].get(str(shop_id), {}), run_started,
+                    )
+                if not needs_sync(rows, changed_by_shop[shop_id], sync_state["shops"].get(str(shop_id), {})):
+                    stats.unchanged += len(rows)
+                    continue
 
-    for item in items:
-        shop_id = item.get("shop_id")
-        product_id = item.get("product_id")
+            shop_batch = pending.setdefault(shop_id, {})
+            shop_batch[rows[0]["product_id"]] = rows
+            if len(shop_batch) >= batch_size:
+                yield shops[shop_id], [row for pid_rows in shop_batch.values() for row in pid_rows]
+                del pending[shop_id]
 
-        if not shop_id or not product_id:
-            skipped_items.append(item)
-            continue
+    for shop_id, shop_batch in pending.items():
+        yield shops[shop_id], [row for pid_rows in shop_batch.values() for row in pid_rows]
 
-        if shop_id not in shops:
-            print(f"[WARN] No token found for shop_id={shop_id}, skipping product_id={product_id}")
-            skipped_items.append(item)
-            continue
 
-        if shop_id not in items_by_shop:
-            items_by_shop[shop_id] = []
-        items_by_shop[shop_id].append(item)
+def fetch_batch(shop: Dict[str, Any], rows: List[Dict[str, Any]], item_q: "queue.Queue", stats: RunStats) -> None:
+    """Fetch stage: one get_item_base_info call, then fan the items out to item_q."""
+    shop_id = shop["shop_id"]
+    pid_to_rows: Dict[int, List[int]] = {}
+    for row in rows:
+        pid_to_rows.setdefault(row["product_id"], []).append(row["row_id"])
 
-    if skipped_items:
-        print(f"[WARN] Skipped {len(skipped_items)} item(s) due to missing shop_id or token")
+    try:
+        response = fetch_item_base_info(shop_id, shop["access_token"], list(pid_to_rows.keys()))
+    except Exception as e:
+        # Retries are exhausted (or the error is fatal) by the time we get here
+        print(f"[ERROR] Failed to fetch batch for shop_id={shop_id}: {e}")
+        stats.add_failed(shop_id, list(pid_to_rows.keys()),
+                         [row_id for row_ids in pid_to_rows.values() for row_id in row_ids])
+        return
 
-    # Step 4: Process each shop's items
-    all_results = []
+    item_list = response.get("item_list") or []
+    print(f"[INFO] Received {len(item_list)} item(s) from API (shop_id={shop_id})")
+    for item_data in item_list:
+        item_q.put((shop, item_data, pid_to_rows.get(item_data["item_id"], [])))
 
-    for shop_id, shop_items in items_by_shop.items():
-        shop = shops[shop_id]
-        shop_name = shop["shop_name"]
-        access_token = shop["access_token"]
 
-        print(f"\n[INFO] Processing shop: {shop_name} (shop_id={shop_id})")
-        print(f"[INFO] Items to fetch: {len(shop_items)}")
+def process_item(shop: Dict[str, Any], item_data: Dict[str, Any], row_ids: List[int],
+                 out_q: "queue.Queue", stats: RunStats) -> None:
+    """
+    Item stage: fetch models if the planner says so, parse, hand off to the sink.
+    A failed model-list fetch marks the item as failed instead of storing it
+    without its variations.
+    """
+    shop_id = shop["shop_id"]
+    try:
+        # Fetch variation/model data per item, unless base info already has it
+        model_resp = None
+        if item_data.get("has_model"):
+            call_model_list = needs_model_list(item_data)
+            _record_plan(call_model_list)
+            if call_model_list:
+                model_resp = fetch_model_list(shop_id, shop["access_token"], item_data["item_id"],
+                                              item_data.get("update_time"))
+
+        with METRICS.timer("parse"):
+            details = parse_product_details(item_data, model_resp)
+    except Exception as e:
+        print(f"[ERROR] Failed to process item {item_data.get('item_id')} for shop_id={shop_id}: {e}")
+        stats.add_failed(shop_id, [item_data.get("item_id")], row_ids)
+        return
 
-        # Build mapping from product_id to original items (for new_item_id lookup)
-        pid_to_items: Dict[int, List[Dict[str, Any]]] = {}
-        for item in shop_items:
-            pid = item["product_id"]
-            pid_to_items.setdefault(pid, []).append(item)
-        unique_product_ids = list(pid_to_items.keys())
+    out_q.put((shop_id, details, row_ids))
 
-        # Batch in groups of 50 (Shopee API limit)
-        batch_size = 50
-        for i in range(0, len(unique_product_ids), batch_size):
-            batch = unique_product_ids[i:i + batch_size]
 
-            try:
-                response = fetch_item_base_info(shop_id, access_token, batch)
-                item_list = response.get("item_list") or []
-
-                print(f"[INFO] Received {len(item_list)} item(s) from API")
-
-                for item_data in item_list:
-                    # Fetch variation/model data per item
-                    model_resp = None
-                    if item_data.get("has_model"):
-                        try:
-                            model_resp = fetch_model_list(shop_id, access_token, item_data["item_id"])
-                        except Exception as me:
-                            print(f"[WARN] Failed to fetch models for item {item_data['item_id']}: {me}")
-
-                    details = parse_product_details(item_data, model_resp)
-                    all_results.append({
-                        "shop_id": shop_id,
-                        "shop_name": shop_name,
-                        "details": details
-                    })
-
-                    print_product_details(details)
-
-                    if not DRY_RUN:
-                        # Update all shopee_listing_products rows for this product_id
-                        matching_items = pid_to_items.get(details['item_id'], [])
-                        for orig_item in matching_items:
-                            try:
-                                updated = save_to_db(shop_name, details, orig_item["row_id"])
-                                if updated:
-                                    print(f"[DB] Updated new_item_id={orig_item['row_id']} (product_id={details['item_id']})")
-                                else:
-                                    print(f"[DB] Skipped new_item_id={orig_item['row_id']} (no matching row)")
-                            except Exception as db_err:
-                                print(f"[DB ERROR] Failed to save new_item_id={orig_item['row_id']}: {db_err}")
-
-                # Rate limiting - be nice to Shopee API
-                if i + batch_size < len(unique_product_ids):
-                    print("[INFO] Waiting 1 second before next batch...")
-                    time.sleep(1)
+class PipelineSink:
+    """
+    Write stage shared by the threaded and asyncio drivers: prints (verbose),
+    queues listing rows on the ListingWriter (None in DRY_RUN) and, as
+    flushes land, records finished products in the checkpoint journal and -
+    incremental runs only - synced rows in the in-memory sync state, which
+    main() saves once at the end of the run. Must only be fed from one
+    thread at a time.
+    """
 
-            except Exception as e:
-                print(f"[ERROR] Failed to fetch batch for shop_id={shop_id}: {e}")
-                continue
+    def __init__(self, stats: RunStats, sync_state: Dict[str, Any], verbose: bool,
+                 journal: Optional[CheckpointJournal] = None, incremental: bool = False):
+        self.stats = stats
+        self.sync_state = sync_state
+        self.verbose = verbose
+        self.journal = journal
+        self.incremental = incremental
+        # Rows waiting for their write to land: row_id -> (shop_id, item_id)
+        self._pending_sync: Dict[int, Tuple[int, int]] = {}
+        # Unflushed row count per (shop_id, product_id), for the checkpoint journal
+        self._rows_left: Dict[Tuple[int, int], int] = {}
+        self.writer = None if DRY_RUN else ListingWriter(on_flush=self._on_flush)
+
+    def _on_flush(self, done_row_ids: List[int], failed_row_ids: List[int]) -> None:
+        # Failed rows are dropped from synced_rows at the end of the run, so the next run retries them
+        for row_id in failed_row_ids:
+            entry = self._pending_sync.pop(row_id, None)
+            if entry is not None:
+                self.stats.add_unwritten(entry[0], [row_id])
+                self._rows_left.pop(entry, None)  # never journalled as done
+        finished: List[Tuple[int, int]] = []
+        for row_id in done_row_ids:
+            entry = self._pending_sync.pop(row_id, None)
+            if entry is not None:
+                if self.incremental:
+                    mark_synced(self.sync_state["shops"].setdefault(str(entry[0]), {}), [row_id])
+                key = entry
+                if key in self._rows_left:
+                    self._rows_left[key] -= 1
+                    if self._rows_left[key] == 0:
+                        del self._rows_left[key]
+                        finished.append(key)
+        # Crash recovery is the journal's job (--resume); the sync state is saved once, at the end
+        if self.journal is not None and finished:
+            self.journal.mark_done(finished)
+
+    def write(self, result: Tuple[int, ProductDetails, List[int]]) -> None:
+        shop_id, details, row_ids = result
+        if self.verbose:
+            print_product_details(details)
+        if self.writer is not None:
+            # Queue an update for every shopee_listing_products row of this product_id
+            key = (shop_id, details.item_id)
+            self._rows_left[key] = self._rows_left.get(key, 0) + len(row_ids)
+            for row_id in row_ids:
+                self._pending_sync[row_id] = key
+                self.writer.add(details, row_id)
+        self.stats.add_processed()
+        if self.stats.processed % PROGRESS_EVERY == 0:
+            print(f"[INFO] Progress: {self.stats.processed} item(s) processed")
+
+    def close(self) -> Optional[ListingWriter]:
+        """Flush what's left; returns the writer (None in DRY_RUN)."""
+        if self.writer is not None:
+            self.writer.close()
+        return self.writer
+
+
+def pipeline_batches(shops: Dict[int, Dict[str, Any]], stats: RunStats, sync_state: Dict[str, Any],
+                     incremental: bool, run_started: int, journal: Optional[CheckpointJournal] = None,
+                     only_unsynced: bool = False,
+                     product_range: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """DB read + batch stage: (shop, rows) batches, journalled as in flight as they are handed out."""
+    items = iter_new_variation_items(shops, only_unsynced=only_unsynced, product_range=product_range)
+    for shop, rows in iter_shop_batches(items, shops, stats, sync_state, incremental, run_started, journal):
+        if journal is not None:
+            journal.start_batch(shop["shop_id"], list(dict.fromkeys(row["product_id"] for row in rows)))
+        yield shop, rows
+
+
+def run_pipeline(shops: Dict[int, Dict[str, Any]], stats: RunStats, sync_state: Dict[str, Any],
+                 incremental: bool, verbose: bool, run_started: int,
+                 journal: Optional[CheckpointJournal] = None,
+                 only_unsynced: bool = False,
+                 product_range: Optional[Tuple[int, int]] = None) -> Optional[ListingWriter]:
+    """
+    Streaming run: DB read -> batch -> fetch base info -> fetch models + parse -> write.
+    Stages are connected by bounded queues (PIPELINE_QUEUE_SIZE), so memory
+    stays flat regardless of catalogue size. Returns the writer (None in DRY_RUN).
+    With a journal, batches are checkpointed as they enter the pipeline and
+    products once all their rows are flushed.
+    """
+    batch_q: "queue.Queue" = queue.Queue(maxsize=max(1, MAX_SHOP_WORKERS * 2))
+    item_q: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    out_q: "queue.Queue" = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    sink = PipelineSink(stats, sync_state, verbose, journal, incremental)
+
+    threads = (
+        _run_stage("fetch", MAX_SHOP_WORKERS, lambda task: fetch_batch(task[0], task[1], item_q, stats),
+                   batch_q, item_q)
+        + _run_stage("item", MAX_INFLIGHT_PER_PARTNER,
+                     lambda task: process_item(task[0], task[1], task[2], out_q, stats), item_q, out_q)
+        # One sink thread: the writer and sync state are only touched from here
+        + _run_stage("write", 1, sink.write, out_q, None)
+    )
 
-    # Step 5: Summary
+    # DB read + batch stage runs on this thread
+    try:
+        for batch in pipeline_batches(shops, stats, sync_state, incremental, run_started, journal,
+                                      only_unsynced, product_range):
+            batch_q.put(batch)
+    finally:
+        batch_q.put(_STOP)
+        for t in threads:
+            t.join()
+
+    return sink.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Fetch Shopee product details for 'New Variation' items.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only sync rows that are new or whose Shopee item changed since the last run",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="serve Shopee responses from the on-disk cache when fresh (e.g. re-running after a crash); "
+             "cached items may be up to SHOPEE_CACHE_TTL seconds stale",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="bypass the on-disk response cache for this run (overrides SHOPEE_RESPONSE_CACHE)",
+    )
+    parser.add_argument(
+        "--only-unsynced",
+        action="store_true",
+        help="only fetch rows whose shopee_listing_products row has no Shopee data yet",
+    )
+    parser.add_argument(
+        "--ensure-indexes",
+        action="store_true",
+        help="create the new_items / shopee_listing_products indexes the item query uses, then continue",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the last unfinished run, skipping products it already wrote",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="print the full parsed details of every item",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=METRICS_FILE,
+        help="write run metrics in Prometheus text format to this file (e.g. for node_exporter's textfile collector)",
+    )
+    parser.add_argument(
+        "--report",
+        default=RUN_REPORT_FILE,
+        help="write a JSON run report (stage timings, counters, histograms) to this file",
+    )
+    return parser.parse_args(argv)
+
+
+def collect_run_metrics(stats: RunStats, writer: Optional[ListingWriter]) -> None:
+    """Copy end-of-run totals that live elsewhere (RunStats, writer, planner, limiter) into METRICS."""
+    METRICS.set("rows", stats.read, result="read")
+    METRICS.set("rows", stats.skipped, result="skipped")
+    METRICS.set("rows", stats.unchanged, result="unchanged")
+    METRICS.set("rows", stats.resumed, result="resumed")
+    METRICS.set("items", stats.processed, result="processed")
+    for shop_id, failed in stats.failed_by_shop.items():
+        METRICS.set("items_failed", len(failed), shop_id=shop_id)
+    if writer is not None:
+        METRICS.set("listing_rows", writer.updated, result="updated")
+        METRICS.set("listing_rows", writer.missing, result="missing")
+        METRICS.set("listing_rows", len(writer.failed_row_ids), result="failed")
+    for key, value in PLAN_STATS.items():
+        METRICS.set("fetch_plan", value, decision=key)
+    for bucket in RATE_LIMITER.stats():
+        METRICS.set("rate_limit_throughput", bucket["throughput"], bucket=bucket["bucket"])
+        METRICS.set("rate_limit_rate", bucket["rate"], bucket=bucket["bucket"])
+    METRICS.set("token_refreshes", TOKENS.refreshed, result="ok")
+    METRICS.set("token_refreshes", TOKENS.refresh_failures, result="failed")
+    METRICS.set("run_wall_seconds", round(time.time() - METRICS.started, 3))
+
+
+def export_metrics(metrics_file: Optional[str], report_file: Optional[str]) -> None:
+    if metrics_file:
+        try:
+            _write_atomic(metrics_file, METRICS.prometheus_text())
+            print(f"[INFO] Metrics written to {metrics_file}")
+        except OSError as e:
+            print(f"[WARN] Could not write metrics file {metrics_file}: {e}")
+    if report_file:
+        try:
+            _write_atomic(report_file, json.dumps(METRICS.report(), indent=2))
+            print(f"[INFO] Run report written to {report_file}")
+        except OSError as e:
+            print(f"[WARN] Could not write run report {report_file}: {e}")
+
+
+def main(argv: Optional[List[str]] = None, pipeline: Optional[Callable[..., Optional[ListingWriter]]] = None):
+    """
+    pipeline replaces run_pipeline (same signature) - shopee_api_async passes
+    its asyncio driver here.
+    """
+    global CACHE_ENABLED
+    pipeline = pipeline or run_pipeline
+    args = parse_args(argv)
+    run_started = int(time.time())
+    if args.cache:
+        CACHE_ENABLED = True
+    if args.no_cache:
+        CACHE_ENABLED = False
+
+    print(f"\n{'='*60}")
+    print("SHOPEE PRODUCT VARIATION FETCHER")
+    print(f"Mode: {'DRY RUN (no DB writes)' if DRY_RUN else 'LIVE'}{' / INCREMENTAL' if args.incremental else ''}")
+    print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"{'='*60}\n")
+
+    if args.ensure_indexes:
+        ensure_new_items_indexes()
+
+    # Step 1: Load active shops (for access tokens)
+    shops = fetch_active_shops()
+    if not shops:
+        print("[ERROR] No active shops found. Exiting.")
+        sys.exit(1)
+
+    # Step 2: Stream 'New Variation' items through the fetch/parse/write pipeline
+    stats = RunStats()
+    sync_state = load_sync_state()
+    # Checkpoints only mean something when rows are actually written
+    journal = None
+    if DRY_RUN:
+        if args.resume:
+            print("[WARN] --resume has no effect in DRY_RUN")
+    else:
+        journal = CheckpointJournal(CHECKPOINT_FILE)
+        journal.begin(args.resume, run_started)
+
+    TOKENS.start()
+    try:
+        writer = pipeline(shops, stats, sync_state, args.incremental, args.verbose, run_started,
+                          journal, args.only_unsynced)
+    finally:
+        TOKENS.stop()
+    if journal is not None:
+        journal.finish()
+        journal.close()
+    close_http_client()
+    cache = get_response_cache()
+
+    if stats.read == 0:
+        print("[WARN] No items with launch_type = 'New Variation' found.")
+
+    if writer is not None and args.incremental:
+        # Full runs leave the state alone: the next incremental run re-syncs
+        # the shops in full and records their rows then.
+        advance_watermarks(sync_state, shops, stats, run_started)
+        save_sync_state(sync_state)
+
+    # Step 3: Summary
     print(f"\n{'='*60}")
     print("SUMMARY")
     print(f"{'='*60}")
-    print(f"Total items processed: {len(all_results)}")
-    print(f"Total items skipped: {len(skipped_items)}")
+    print(f"Total rows read: {stats.read}")
+    print(f"Total items processed: {stats.processed}")
+    print(f"Total items skipped: {stats.skipped}")
+    if args.incremental:
+        print(f"Total rows unchanged since last sync: {stats.unchanged}")
+    if args.resume:
+        print(f"Total rows already done before resume: {stats.resumed}")
+    print(f"Total items failed: {sum(len(f) for f in stats.failed_by_shop.values())}")
+    for shop_id, failed in stats.failed_by_shop.items():
+        print(f"  shop_id={shop_id}: product_id(s) {', '.join(str(pid) for pid in failed)}")
+    if writer is not None:
+        print(f"Rows updated: {writer.updated}")
+        print(f"Rows with no matching listing: {writer.missing}")
+        print(f"Rows failed to write: {len(writer.failed_row_ids)}")
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+        cache.close()
+    print(
+        f"Model-list calls avoided: {PLAN_STATS['model_list_avoided']}/{PLAN_STATS['model_list_needed']} "
+        f"(base-info tier_variation was complete)"
+    )
+
+    if TOKENS.refreshed or TOKENS.refresh_failures:
+        print(f"Access tokens refreshed: {TOKENS.refreshed} ({TOKENS.refresh_failures} failed)")
+
+    collect_run_metrics(stats, writer)
+    wall = time.time() - METRICS.started
+    print(f"\nSTAGE TIMINGS (seconds summed over worker threads, wall {wall:.1f}s):")
+    for stage, total in sorted(METRICS.stage_totals().items(), key=lambda kv: -kv[1]["seconds"]):
+        print(f"  {stage}: {total['seconds']:.1f}s over {total['count']} call(s)")
+
+    print("\nRATE LIMITER:")
+    for bucket in RATE_LIMITER.stats():
+        print(
+            f"  {bucket['bucket']}: {bucket['throughput']} req/s "
+            f"(rate {bucket['rate']}/{bucket['max_rate']}, throttled {bucket['throttled']}x)"
+        )
+
+    print("\nRETRIES:")
+    for ep in retry_stats():
+        print(
+            f"  {ep['endpoint']}: {ep['requests']} request(s), {ep['retries']} retries, "
+            f"{ep['retries_denied']} denied by budget, breaker {ep['breaker']} (opened {ep['opened']}x)"
+        )
+
+    export_metrics(args.metrics_file, args.report)
 
     if DRY_RUN:
         print("\n[DRY RUN] No data was written to database.")
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio variant of the shopee_api client and pipeline.
+
+Same signing (shopee_api.SIGNER), rate limiter, retry budget, circuit
+breakers, response cache, error classification and write stage as the
+threaded version - only the HTTP calls and the fetch/item stages are async,
+so one event loop holds every in-flight Shopee request instead of one
+thread per request.
+
+Needs httpx (preferred) or aiohttp. DB reads, the sqlite response cache and
+the ListingWriter stay synchronous and run in worker threads via
+asyncio.to_thread.
+
+Usage:
+    python shopee_api_async.py [shopee_api.py options]
+
+    # or from code
+    async with client_session():
+        info = await fetch_item_base_info(shop_id, token, item_ids)
+        models = await gather_bounded(
+            (fetch_model_list(shop_id, token, i) for i in item_ids), limit=8)
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple
+
+import shopee_api as api
+
+
+# =========================
+# HTTP CLIENT
+# =========================
+
+class _AiohttpResponse:
+    """Buffered aiohttp response exposing the requests/httpx attributes _handle_response uses."""
+
+    def __init__(self, status: int, content: bytes):
+        self.status_code = status
+        self.content = content
+        self.text = content.decode("utf-8", errors="replace")
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class AsyncHTTPClient:
+    """
+    Pooled keep-alive async client: httpx.AsyncClient, else aiohttp.ClientSession.
+    HTTP/2 (SHOPEE_HTTP2) needs httpx[http2]; without h2 httpx runs HTTP/1.1.
+    """
+
+    def __init__(self):
+        try:
+            import httpx
+        except ImportError:
+            httpx = None
+
+        if httpx is not None:
+            http2 = api.HTTP2_ENABLED
+            if http2:
+                try:
+                    import h2  # noqa: F401  (httpx only checks for it when the client is built)
+                except ImportError:
+                    print("[WARN] SHOPEE_HTTP2 set but httpx[http2] is not installed, using HTTP/1.1")
+                    http2 = False
+            self._httpx = httpx.AsyncClient(
+                http2=http2,
+                headers={"Accept": "application/json"},
+                timeout=api.HTTP_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=api.HTTP_POOL_SIZE,
+                    max_keepalive_connections=api.HTTP_POOL_SIZE,
+                ),
+            )
+            self._aiohttp = None
+            print(f"[INFO] Async HTTP client: httpx{' (HTTP/2)' if http2 else ''}, pool size {api.HTTP_POOL_SIZE}")
+        else:
+            import aiohttp
+            self._httpx = None
+            self._aiohttp = aiohttp.ClientSession(
+                headers={"Accept": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=api.HTTP_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=api.HTTP_POOL_SIZE),
+            )
+            print(f"[INFO] Async HTTP client: aiohttp, pool size {api.HTTP_POOL_SIZE}")
+
+    async def get(self, url: str) -> Any:
+        if self._httpx is not None:
+            return await self._httpx.get(url)
+        async with self._aiohttp.get(url) as resp:
+            return _AiohttpResponse(resp.status, await resp.read())
+
+    async def close(self) -> None:
+        if self._httpx is not None:
+            await self._httpx.aclose()
+        else:
+            await self._aiohttp.close()
+
+
+_CLIENT: Optional[AsyncHTTPClient] = None
+
+# In-flight caps, mirroring shopee_api._request_slot (created inside the running loop)
+_PARTNER_SLOTS: Optional[asyncio.Semaphore] = None
+_SHOP_SLOTS: Dict[int, asyncio.Semaphore] = {}
+
+
+@asynccontextmanager
+async def client_session():
+    """Open the shared async client (and in-flight caps) for the current event loop."""
+    global _CLIENT, _PARTNER_SLOTS
+    _CLIENT = AsyncHTTPClient()
+    _PARTNER_SLOTS = asyncio.Semaphore(api.MAX_INFLIGHT_PER_PARTNER)
+    _SHOP_SLOTS.clear()
+    try:
+        yield _CLIENT
+    finally:
+        await _CLIENT.close()
+        _CLIENT = None
+
+
+@asynccontextmanager
+async def _request_slot(shop_id: int):
+    shop_sem = _SHOP_SLOTS.get(shop_id)
+    if shop_sem is None:
+        shop_sem = _SHOP_SLOTS[shop_id] = asyncio.Semaphore(api.MAX_INFLIGHT_PER_SHOP)
+    async with shop_sem:
+        async with _PARTNER_SLOTS:
+            yield
+
+
+async def _acquire_rate(shop_id: int) -> None:
+    """Non-blocking version of RATE_LIMITER.acquire: same buckets, awaits instead of sleeping."""
+    for bucket in (api.RATE_LIMITER.shop_bucket(shop_id), api.RATE_LIMITER.partner):
+        while True:
+            wait = bucket.try_acquire()
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+
+
+# =========================
+# SHOPEE API
+# =========================
+
+async def _shopee_get(path: str, shop_id: int, access_token: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Async shopee_api._shopee_get: same retries, budget, breaker and token refresh."""
+    breaker, budget = api._endpoint_guards(path)
+    budget.on_request()
+    if api.TOKENS.needs_refresh(shop_id):
+        access_token = await asyncio.to_thread(api.TOKENS.fresh_token, shop_id, access_token)
+
+    attempt = 0
+    token_refreshed = False
+    while True:
+        breaker.before_call()
+        try:
+            result = await _shopee_get_once(path, shop_id, access_token, params)
+        except api.ShopeeAPIError as e:
+            if not api._record_failure(e, shop_id, breaker):
+                if api._is_auth_error(e.error) and not token_refreshed:
+                    token_refreshed = True
+                    fresh_token = await asyncio.to_thread(api.TOKENS.refresh_now, shop_id, access_token)
+                    if fresh_token:
+                        access_token = fresh_token
+                        continue
+                raise
+            err = e
+        else:
+            breaker.on_success()
+            return result
+
+        attempt += 1
+        await asyncio.sleep(api._retry_delay(err, attempt, path, shop_id, budget))
+
+
+async def _shopee_get_once(path: str, shop_id: int, access_token: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    endpoint = path.rsplit("/", 1)[-1]
+    start = time.perf_counter()
+    await _acquire_rate(shop_id)
+    api.METRICS.observe("stage_seconds", time.perf_counter() - start, stage="rate_limit_wait")
+
+    with api.METRICS.timer("sign"):
+        url = api.SIGNER.url(path, shop_id, access_token, int(time.time()), params)
+
+    try:
+        async with _request_slot(shop_id):
+            start = time.perf_counter()
+            try:
+                resp = await _CLIENT.get(url)
+            finally:
+                api._observe_http(endpoint, shop_id, time.perf_counter() - start)
+    except Exception as e:
+        raise api._network_error(endpoint, e)
+
+    return api._handle_response(resp, endpoint, shop_id)
+
+
+async def fetch_item_base_info(shop_id: int, access_token: str, item_ids: List[int]) -> Dict[str, Any]:
+    """Async shopee_api.fetch_item_base_info (cache-aware, up to 50 items)."""
+    # The response cache is sqlite; its reads and writes run in a worker thread
+    cache_on = api.get_response_cache() is not None
+    cached_items: List[Dict[str, Any]] = []
+    if cache_on:
+        cached_items, item_ids = await asyncio.to_thread(api._cached_base_info, shop_id, item_ids)
+    if not item_ids:
+        return {"item_list": cached_items}
+
+    print(f"[DEBUG] Calling Shopee API for {len(item_ids)} item(s)...")
+    response = await _shopee_get(api.PATH_ITEM_BASE_INFO, shop_id, access_token, api._base_info_params(item_ids))
+    if cache_on:
+        return await asyncio.to_thread(api._store_base_info, shop_id, response, cached_items)
+    return api._store_base_info(shop_id, response, cached_items)
+
+
+async def fetch_model_list(shop_id: int, access_token: str, item_id: int,
+                           update_time: Optional[int] = None) -> Dict[str, Any]:
+    """Async shopee_api.fetch_model_list (cache-aware)."""
+    cache = api.get_response_cache()
+    if cache is not None:
+        hit = await asyncio.to_thread(cache.get, shop_id, api.PATH_GET_MODEL_LIST, item_id, update_time)
+        if hit is not None:
+            return hit
+
+    response = await _shopee_get(api.PATH_GET_MODEL_LIST, shop_id, access_token, {"item_id": item_id})
+    if cache is not None:
+        return await asyncio.to_thread(api._store_model_list, shop_id, item_id, update_time, response)
+    return api._store_model_list(shop_id, item_id, update_time, response)
+
+
+async def gather_bounded(aws: Iterable[Awaitable[Any]], limit: int,
+                         return_exceptions: bool = False) -> List[Any]:
+    """asyncio.gather with at most `limit` awaitables running at once; results keep input order."""
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def run(aw: Awaitable[Any]) -> Any:
+        async with sem:
+            return await aw
+
+    tasks = [asyncio.ensure_future(run(aw)) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    except BaseException:
+        # gather leaves the siblings of a failed awaitable running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+# =========================
+# PIPELINE
+# =========================
+
+async def _process_item(shop: Dict[str, Any], item_data: Dict[str, Any], row_ids: List[int],
+                        out_q: "asyncio.Queue", stats: api.RunStats) -> None:
+    """Async shopee_api.process_item."""
+    shop_id = shop["shop_id"]
+    try:
+        model_resp = None
+        if item_data.get("has_model"):
+            call_model_list = api.needs_model_list(item_data)
+            api._record_plan(call_model_list)
+            if call_model_list:
+                model_resp = await fetch_model_list(shop_id, shop["access_token"], item_data["item_id"],
+                                                    item_data.get("update_time"))
+
+        with api.METRICS.timer("parse"):
+            details = api.parse_product_details(item_data, model_resp)
+    except Exception as e:
+        print(f"[ERROR] Failed to process item {item_data.get('item_id')} for shop_id={shop_id}: {e}")
+        stats.add_failed(shop_id, [item_data.get("item_id")], row_ids)
+        return
+
+    await out_q.put((shop_id, details, row_ids))
+
+
+async def _fetch_batch(shop: Dict[str, Any], rows: List[Dict[str, Any]],
+                       out_q: "asyncio.Queue", stats: api.RunStats) -> None:
+    """Async shopee_api.fetch_batch; the batch's items are processed concurrently."""
+    shop_id = shop["shop_id"]
+    pid_to_rows: Dict[int, List[int]] = {}
+    for row in rows:
+        pid_to_rows.setdefault(row["product_id"], []).append(row["row_id"])
+
+    try:
+        response = await fetch_item_base_info(shop_id, shop["access_token"], list(pid_to_rows.keys()))
+    except Exception as e:
+        print(f"[ERROR] Failed to fetch batch for shop_id={shop_id}: {e}")
+        stats.add_failed(shop_id, list(pid_to_rows.keys()),
+                         [row_id for row_ids in pid_to_rows.values() for row_id in row_ids])
+        return
+
+    item_list = response.get("item_list") or []
+    print(f"[INFO] Received {len(item_list)} item(s) from API (shop_id={shop_id})")
+    await gather_bounded(
+        (_process_item(shop, item_data, pid_to_rows.get(item_data["item_id"], []), out_q, stats)
+         for item_data in item_list),
+        api.MAX_INFLIGHT_PER_SHOP,
+    )
+
+
+async def _drain(out_q: "asyncio.Queue", sink: api.PipelineSink) -> None:
+    """Write stage: feeds the sink one result at a time off the event loop (it does DB I/O)."""
+    while True:
+        result = await out_q.get()
+        if result is api._STOP:
+            return
+        try:
+            await asyncio.to_thread(sink.write, result)
+        except Exception as e:
+            print(f"[ERROR] write stage: {e}")
+
+
+async def run_pipeline_async(shops: Dict[int, Dict[str, Any]], stats: api.RunStats, sync_state: Dict[str, Any],
+                             incremental: bool, verbose: bool, run_started: int,
+                             journal: Optional[api.CheckpointJournal] = None,
+                             only_unsynced: bool = False,
+                             product_range: Optional[Tuple[int, int]] = None) -> Optional[api.ListingWriter]:
+    """
+    asyncio driver with run_pipeline's stages and signature. Up to
+    MAX_SHOP_WORKERS * 2 batches are in flight; the rate limiter and
+    in-flight caps bound the actual requests.
+    """
+    out_q: "asyncio.Queue" = asyncio.Queue(maxsize=api.PIPELINE_QUEUE_SIZE)
+    sink = api.PipelineSink(stats, sync_state, verbose, journal, incremental)
+    batches = api.pipeline_batches(shops, stats, sync_state, incremental, run_started, journal,
+                                   only_unsynced, product_range)
+    max_batches = max(1, api.MAX_SHOP_WORKERS * 2)
+
+    async with client_session():
+        writer_task = asyncio.create_task(_drain(out_q, sink))
+        in_flight: set = set()
+        reading: Optional[asyncio.Future] = None
+        try:
+            while True:
+                # DB read (and incremental get_item_list checks) happen in a worker thread.
+                # Shielded: a cancel must not leave next() running while the generator is closed
+                reading = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+                batch = await asyncio.shield(reading)
+                if batch is None:
+                    break
+                in_flight.add(asyncio.create_task(_fetch_batch(batch[0], batch[1], out_q, stats)))
+                if len(in_flight) >= max_batches:
+                    _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        except BaseException:
+            for task in in_flight:
+                task.cancel()
+            # Let the cancelled batches unwind before the writer is stopped
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            raise
+        finally:
+            if reading is not None and not reading.done():
+                await asyncio.wait([reading])
+            # Closing the generator hands its pooled MySQL connection back
+            await asyncio.to_thread(batches.close)
+            await out_q.put(api._STOP)
+            await writer_task
+
+    return await asyncio.to_thread(sink.close)
+
+
+def run_pipeline(*args, **kwargs) -> Optional[api.ListingWriter]:
+    """Synchronous entry point with run_pipeline's signature, for shopee_api.main."""
+    return asyncio.run(run_pipeline_async(*args, **kwargs))
+
+
+def main(argv: Optional[List[str]] = None):
+    api.main(argv, pipeline=run_pipeline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmark for the shopee_api fetch pipeline.
+
+Starts shopee_mock_server in-process, points shopee_api at it and streams a
+synthetic catalogue through run_pipeline (batch -> base info -> model list ->
+parse -> write) once per scenario. Reports items/sec, p50/p99 latency per
+endpoint and the DB write rate.
+
+The mock server always checks signatures against its own partner key, so
+SHOPEE_PARTNER_KEY is overridden for this process whatever the environment
+holds.
+
+Without --db the write stage is DRY_RUN (no MySQL needed) and the DB write
+rate is not measured. With --db, ListingWriter is pointed at a scratch table
+(BENCH_LISTING_TABLE) seeded with one row per synthetic new_item_id before
+each scenario, so every flush does its real SELECT + UPDATE + commit; the
+real shopee_listing_products is never touched and the scratch table is
+dropped at the end.
+
+Usage:
+    python shopee_benchmark.py
+    python shopee_benchmark.py --scenario clean --shops 4 --items 2000 --latency-ms 120
+    python shopee_benchmark.py --db --json bench.json
+"""
+
+import argparse
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from typing import Any, Dict, Iterator, List
+from urllib.parse import urlsplit
+
+from shopee_mock_server import DEFAULT_PARTNER_KEY, MockConfig, start_mock_server
+
+
+# Scratch table ListingWriter updates in --db mode
+BENCH_LISTING_TABLE = "shopee_listing_products_bench"
+
+
+# =========================
+# SCENARIOS
+# =========================
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    # Healthy API: measures concurrency + pooling
+    "clean": dict(error_rate=0.0, shop_rps=0),
+    # 5% error_server / 503: measures retry overhead
+    "lossy": dict(error_rate=0.05, shop_rps=0),
+    # Tight per-shop quota: measures rate limiter adaptation
+    "throttled": dict(error_rate=0.0, shop_rps=4),
+}
+
+
+def _percentile(samples: List[float], pct: int) -> float:
+    if not samples:
+        return 0.0
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def _load_client(server_url: str, use_db: bool, state_dir: str):
+    """Import shopee_api configured for the mock server (config is read at import)."""
+    os.environ["SHOPEE_HOST"] = server_url
+    # The mock only accepts its own key; a real exported key would fail every request
+    os.environ["SHOPEE_PARTNER_KEY"] = DEFAULT_PARTNER_KEY
+    if not use_db:
+        os.environ.setdefault("DB_PASSWORD", "")
+    os.environ["SHOPEE_SYNC_STATE_FILE"] = os.path.join(state_dir, "sync_state.json")
+    os.environ["SHOPEE_RESPONSE_CACHE"] = "0"
+    import shopee_api
+    return shopee_api
+
+
+class _Recorder:
+    """Wraps the shared HTTP client and ListingWriter to time requests and DB flushes."""
+
+    def __init__(self, api):
+        self.latencies: Dict[str, List[float]] = {}
+        self.write_rows = 0
+        self.write_seconds = 0.0
+        self._lock = threading.Lock()
+
+        # Time the HTTP round trip only, not rate-limiter waits or retry backoff
+        client = api.get_http_client()
+        client_get = client.get
+
+        def timed_get(url, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return client_get(url, *args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                endpoint = urlsplit(url).path.rsplit("/", 1)[-1]
+                with self._lock:
+                    self.latencies.setdefault(endpoint, []).append(elapsed)
+
+        flush_locked = api.ListingWriter._flush_locked
+        recorder = self
+
+        def timed_flush_locked(writer):
+            rows = len(writer._rows)
+            start = time.perf_counter()
+            try:
+                return flush_locked(writer)
+            finally:
+                recorder.write_seconds += time.perf_counter() - start
+                recorder.write_rows += rows
+
+        client.get = timed_get
+        api.ListingWriter._flush_locked = timed_flush_locked
+
+    def reset(self) -> None:
+        self.latencies = {}
+        self.write_rows = 0
+        self.write_seconds = 0.0
+
+
+def _reset_client(api) -> None:
+    """Fresh limiter, breakers and counters so scenarios don't bleed into each other."""
+    api.RATE_LIMITER = api.RateLimiter(api.PARTNER_RATE_LIMIT, api.SHOP_RATE_LIMIT)
+    api._BREAKERS.clear()
+    api._BUDGETS.clear()
+    for key in api.PLAN_STATS:
+        api.PLAN_STATS[key] = 0
+
+
+def _synthetic_rows(shops: int, items: int) -> Iterator[Dict[str, Any]]:
+    """new_items-shaped rows ordered by product_id, spread across shops."""
+    for product_id in range(1, shops * items + 1):
+        yield {
+            "row_id": -product_id,
+            "product_id": product_id,
+            "shop_id": 900000 + product_id % shops,
+            "product_name": f"Mock Product {product_id}",
+            "launch_type": "New Variation",
+        }
+
+
+def _create_bench_table(api) -> None:
+    """Scratch copy of the columns ListingWriter touches."""
+    columns = ",\n".join(f"    {col} TEXT NULL" for col in api._LISTING_COLUMNS)
+    with api.db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_LISTING_TABLE}")
+            cursor.execute(
+                f"CREATE TABLE {BENCH_LISTING_TABLE} (\n"
+                f"    new_item_id BIGINT NOT NULL PRIMARY KEY,\n{columns}\n)"
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+def _seed_bench_table(api, rows: int) -> None:
+    """One empty listing row per synthetic new_item_id (-1 .. -rows)."""
+    with api.db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DELETE FROM {BENCH_LISTING_TABLE}")
+            ids = [(-i,) for i in range(1, rows + 1)]
+            for i in range(0, len(ids), 1000):
+                cursor.executemany(f"INSERT INTO {BENCH_LISTING_TABLE} (new_item_id) VALUES (%s)", ids[i:i + 1000])
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+def _drop_bench_table(api) -> None:
+    with api.db_pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_LISTING_TABLE}")
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+def run_scenario(api, server, recorder: _Recorder, name: str, args) -> Dict[str, Any]:
+    server.reconfigure(MockConfig(
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_ms / 2,
+        **SCENARIOS[name],
+    ))
+    _reset_client(api)
+    recorder.reset()
+
+    shops = {
+        900000 + i: {"shop_id": 900000 + i, "shop_name": f"mock-shop-{i}", "access_token": f"mock-token-{i}"}
+        for i in range(args.shops)
+    }
+    api.iter_new_variation_items = lambda *_, **__: _synthetic_rows(args.shops, args.items)
+    api.DRY_RUN = not args.db
+    if args.db:
+        _seed_bench_table(api, args.shops * args.items)
+
+    stats = api.RunStats()
+    log = sys.stdout if args.show_log else io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(log):
+        api.run_pipeline(shops, stats, {"shops": {}}, False, False, int(time.time()))
+    elapsed = time.perf_counter() - start
+
+    result: Dict[str, Any] = {
+        "scenario": name,
+        "items": stats.processed,
+        "failed": sum(len(f) for f in stats.failed_by_shop.values()),
+        "seconds": round(elapsed, 2),
+        "items_per_sec": round(stats.processed / elapsed, 1) if elapsed else 0.0,
+        "requests": dict(server.counters),
+        "model_list_avoided": api.PLAN_STATS["model_list_avoided"],
+        "latency_ms": {},
+    }
+    for endpoint, samples in recorder.latencies.items():
+        result["latency_ms"][endpoint] = {
+            "count": len(samples),
+            "p50": round(_percentile(samples, 50) * 1000, 1),
+            "p99": round(_percentile(samples, 99) * 1000, 1),
+        }
+    if args.db:
+        result["db_rows_written"] = recorder.write_rows
+        result["db_rows_per_sec"] = (
+            round(recorder.write_rows / recorder.write_seconds, 1) if recorder.write_seconds else 0.0
+        )
+    return result
+
+
+def print_result(result: Dict[str, Any]) -> None:
+    print(f"\n[{result['scenario']}] {result['items']} item(s) in {result['seconds']}s "
+          f"-> {result['items_per_sec']} items/sec ({result['failed']} failed)")
+    for endpoint, lat in result["latency_ms"].items():
+        print(f"  {endpoint}: {lat['count']} call(s), p50 {lat['p50']} ms, p99 {lat['p99']} ms")
+    print(f"  model-list calls avoided: {result['model_list_avoided']}")
+    print(f"  server counters: {result['requests']}")
+    if "db_rows_per_sec" in result:
+        print(f"  DB writes: {result['db_rows_written']} row(s), {result['db_rows_per_sec']} rows/sec")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the shopee_api fetch pipeline against a local mock.")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--shops", type=int, default=4)
+    parser.add_argument("--items", type=int, default=500, help="items per shop")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="mean mock response latency")
+    parser.add_argument("--db", action="store_true",
+                        help=f"also measure ListingWriter against MySQL (uses a scratch {BENCH_LISTING_TABLE} table)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--show-log", action="store_true", help="show shopee_api's own output")
+    args = parser.parse_args()
+
+    server = start_mock_server(MockConfig(), catalogue_size=args.shops * args.items)
+    with tempfile.TemporaryDirectory() as state_dir:
+        api = _load_client(server.url, args.db, state_dir)
+        recorder = _Recorder(api)
+        if args.db:
+            _create_bench_table(api)
+            api.LISTING_TABLE = BENCH_LISTING_TABLE
+
+        print(f"Mock Shopee API at {server.url}: {args.shops} shop(s) x {args.items} item(s), "
+              f"~{args.latency_ms:.0f} ms latency")
+        results = []
+        try:
+            for name in args.scenario or list(SCENARIOS):
+                result = run_scenario(api, server, recorder, name, args)
+                print_result(result)
+                results.append(result)
+        finally:
+            if args.db:
+                _drop_bench_table(api)
+            api.close_http_client()
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
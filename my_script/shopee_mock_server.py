@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the Shopee Open API product endpoints used by shopee_api.py.
+
+Implements:
+  /api/v2/product/get_item_base_info
+  /api/v2/product/get_model_list
+  /api/v2/product/get_item_list
+
+Payloads are generated deterministically from item_id and sized like real
+listings (long extended descriptions, two-tier variations with images).
+Latency, error rate and per-shop rate limits are configurable, and every
+request's `sign` is checked with the same HMAC scheme as shopee_api._sign.
+
+Run standalone:
+    python shopee_mock_server.py --port 8900 --latency-ms 80 --error-rate 0.02 --shop-rps 5
+
+then point shopee_api at it:
+    SHOPEE_HOST=http://127.0.0.1:8900 SHOPEE_PARTNER_KEY=mock-partner-key python shopee_api.py
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+DEFAULT_PARTNER_ID = 2012161
+DEFAULT_PARTNER_KEY = "mock-partner-key"
+
+PATH_ITEM_BASE_INFO = "/api/v2/product/get_item_base_info"
+PATH_GET_MODEL_LIST = "/api/v2/product/get_model_list"
+PATH_GET_ITEM_LIST = "/api/v2/product/get_item_list"
+
+# Shopee rejects timestamps more than 5 minutes off
+MAX_TIMESTAMP_SKEW = 300
+
+# Items the mock reports as edited, as a fraction of the catalogue
+UPDATED_FRACTION = 0.05
+BASE_UPDATE_TIME = 1_700_000_000
+
+
+class MockConfig:
+    """Knobs for one mock server instance."""
+
+    def __init__(self, partner_id: int = DEFAULT_PARTNER_ID, partner_key: str = DEFAULT_PARTNER_KEY,
+                 latency_ms: float = 80.0, latency_jitter_ms: float = 40.0,
+                 error_rate: float = 0.0, shop_rps: float = 0.0,
+                 description_fields: int = 12, description_chars: int = 400,
+                 image_rate: float = 0.7, seed: int = 1688):
+        self.partner_id = partner_id
+        self.partner_key = partner_key.encode()
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.shop_rps = shop_rps                    # 0 = unlimited
+        self.description_fields = description_fields
+        self.description_chars = description_chars
+        self.image_rate = image_rate                # share of items whose base info carries option images
+        self.seed = seed
+
+
+# =========================
+# PAYLOADS
+# =========================
+
+def _rng(config: MockConfig, item_id: int) -> random.Random:
+    return random.Random(config.seed * 1_000_003 + item_id)
+
+
+def _update_time(item_id: int) -> int:
+    return BASE_UPDATE_TIME + (item_id % 1000)
+
+
+def _tiers(config: MockConfig, item_id: int, with_images: bool) -> list:
+    rng = _rng(config, item_id)
+    colours = ["Black", "White", "Grey", "Beige", "Brown", "Navy", "Green", "Pink"]
+    sizes = ["S", "M", "L", "XL", "XXL"]
+    tier_1 = []
+    for colour in rng.sample(colours, rng.randint(2, 6)):
+        option: Dict[str, Any] = {"option": colour}
+        if with_images:
+            option["image"] = {
+                "image_id": f"sg-11134201-{item_id}-{colour.lower()}",
+                "image_url": f"https://cf.shopee.com.my/file/sg-11134201-{item_id}-{colour.lower()}",
+            }
+        tier_1.append(option)
+    tiers = [{"name": "Colour", "option_list": tier_1}]
+    if rng.random() < 0.6:
+        tiers.append({"name": "Size", "option_list": [{"option": s} for s in sizes[:rng.randint(2, 5)]]})
+    return tiers
+
+
+def base_info_item(config: MockConfig, item_id: int) -> Dict[str, Any]:
+    """One get_item_base_info item_list entry."""
+    rng = _rng(config, item_id)
+    field_list = []
+    for i in range(config.description_fields):
+        if i % 4 == 3:
+            field_list.append({"field_type": "image", "image_info": {"image_id": f"desc-{item_id}-{i}"}})
+        else:
+            text = " ".join(rng.choice(["durable", "premium", "foldable", "compact", "easy", "clean",
+                                        "steel", "fabric", "cushion", "frame", "warranty", "MY stock"])
+                            for _ in range(config.description_chars // 8))
+            field_list.append({"field_type": "text", "text": text[:config.description_chars]})
+    return {
+        "item_id": item_id,
+        "item_name": f"Mock Product {item_id}",
+        "item_status": "NORMAL",
+        "has_model": True,
+        "update_time": _update_time(item_id),
+        "image": {"image_url_list": [f"https://cf.shopee.com.my/file/main-{item_id}-{i}" for i in range(5)]},
+        "description_type": "extended",
+        "description_info": {"extended_description": {"field_list": field_list}},
+        "tier_variation": _tiers(config, item_id, with_images=rng.random() < config.image_rate),
+    }
+
+
+def model_list(config: MockConfig, item_id: int) -> Dict[str, Any]:
+    """get_model_list response for one item."""
+    tiers = _tiers(config, item_id, with_images=True)
+    counts = [len(t["option_list"]) for t in tiers]
+    models = []
+    for a in range(counts[0]):
+        for b in range(counts[1] if len(counts) > 1 else 1):
+            index = [a, b] if len(counts) > 1 else [a]
+            models.append({
+                "model_id": item_id * 100 + len(models),
+                "tier_index": index,
+                "model_sku": f"SKU-{item_id}-{'-'.join(map(str, index))}",
+                "price_info": [{"current_price": 59.9, "original_price": 79.9}],
+                "stock_info_v2": {"summary_info": {"total_available_stock": 25}},
+            })
+    return {"tier_variation": tiers, "model": models}
+
+
+# =========================
+# SERVER
+# =========================
+
+class _ShopLimiter:
+    """Per-shop token bucket; the mock's stand-in for Shopee's quota."""
+
+    def __init__(self, rps: float):
+        self.rps = rps
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, shop_id: str) -> bool:
+        if self.rps <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(shop_id, (self.rps, now))
+            tokens = min(self.rps, tokens + (now - last) * self.rps)
+            if tokens < 1:
+                self._buckets[shop_id] = (tokens, now)
+                return False
+            self._buckets[shop_id] = (tokens - 1, now)
+            return True
+
+
+class MockShopeeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real API
+    server: "MockShopeeServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, error: str, message: str) -> None:
+        self._send(status, {"error": error, "message": message, "request_id": "mock"})
+
+    def _check_sign(self, path: str, q: Dict[str, str]) -> Optional[str]:
+        config = self.server.config
+        try:
+            partner_id = int(q["partner_id"])
+            timestamp = int(q["timestamp"])
+        except (KeyError, ValueError):
+            return "partner_id and timestamp are required"
+        if partner_id != config.partner_id:
+            return "Invalid partner_id"
+        if abs(time.time() - timestamp) > MAX_TIMESTAMP_SKEW:
+            return "Timestamp is expired"
+        base = f"{partner_id}{path}{timestamp}{q.get('access_token', '')}{q.get('shop_id', '')}".encode()
+        expected = hmac.new(config.partner_key, base, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(expected, q.get("sign", "")):
+            return "Wrong sign"
+        return None
+
+    def do_GET(self):
+        config = self.server.config
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        self.server.count(url.path)
+
+        delay = max(0.0, random.gauss(config.latency_ms, config.latency_jitter_ms)) / 1000
+        time.sleep(delay)
+
+        sign_error = self._check_sign(url.path, q)
+        if sign_error:
+            return self._error(403, "error_sign", sign_error)
+
+        if not self.server.limiter.allow(q.get("shop_id", "")):
+            self.server.count("throttled")
+            return self._error(429, "error_too_many_request", "Too many requests, please slow down.")
+
+        if random.random() < config.error_rate:
+            self.server.count("errors")
+            if random.random() < 0.5:
+                return self._error(503, "error_server", "Service temporarily unavailable.")
+            return self._error(200, "error_server", "Something wrong. Please try later.")
+
+        if url.path == PATH_ITEM_BASE_INFO:
+            try:
+                item_ids = [int(i) for i in q["item_id_list"].split(",") if i]
+            except (KeyError, ValueError):
+                return self._error(400, "error_param", "item_id_list is required")
+            if len(item_ids) > 50:
+                return self._error(400, "error_param", "item_id_list exceeds 50 items")
+            items = [base_info_item(config, i) for i in item_ids]
+            return self._send(200, {"error": "", "message": "", "response": {"item_list": items}})
+
+        if url.path == PATH_GET_MODEL_LIST:
+            try:
+                item_id = int(q["item_id"])
+            except (KeyError, ValueError):
+                return self._error(400, "error_param", "item_id is required")
+            return self._send(200, {"error": "", "message": "", "response": model_list(config, item_id)})
+
+        if url.path == PATH_GET_ITEM_LIST:
+            offset = int(q.get("offset", 0))
+            page_size = min(int(q.get("page_size", 100)), 100)
+            updated = self.server.updated_item_ids
+            page = updated[offset:offset + page_size]
+            return self._send(200, {"error": "", "message": "", "response": {
+                "item": [{"item_id": i, "item_status": "NORMAL", "update_time": _update_time(i)} for i in page],
+                "total_count": len(updated),
+                "has_next_page": offset + page_size < len(updated),
+                "next_offset": offset + page_size,
+            }})
+
+        return self._error(404, "error_not_found", f"Unknown path {url.path}")
+
+
+class MockShopeeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: MockConfig, catalogue_size: int = 0):
+        super().__init__(address, MockShopeeHandler)
+        self.config = config
+        self.limiter = _ShopLimiter(config.shop_rps)
+        rng = random.Random(config.seed)
+        self.updated_item_ids = sorted(rng.sample(range(1, catalogue_size + 1),
+                                                  int(catalogue_size * UPDATED_FRACTION))) if catalogue_size else []
+        self.counters: Dict[str, int] = {}
+        self._counter_lock = threading.Lock()
+
+    def reconfigure(self, config: MockConfig) -> None:
+        """Swap latency/error/quota settings between benchmark scenarios."""
+        self.config = config
+        self.limiter = _ShopLimiter(config.shop_rps)
+        with self._counter_lock:
+            self.counters = {}
+
+    def count(self, key: str) -> None:
+        with self._counter_lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0,
+                      catalogue_size: int = 0) -> MockShopeeServer:
+    """Start a mock server on a background thread; port 0 picks a free port."""
+    server = MockShopeeServer((host, port), config, catalogue_size)
+    threading.Thread(target=server.serve_forever, name="shopee-mock", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Shopee Open API stand-in for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--partner-id", type=int, default=DEFAULT_PARTNER_ID)
+    parser.add_argument("--partner-key", default=DEFAULT_PARTNER_KEY)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=40.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of calls answered with error_server")
+    parser.add_argument("--shop-rps", type=float, default=0.0, help="per-shop quota, 0 = unlimited")
+    parser.add_argument("--catalogue-size", type=int, default=10000, help="item ids get_item_list draws from")
+    args = parser.parse_args()
+
+    config = MockConfig(
+        partner_id=args.partner_id,
+        partner_key=args.partner_key,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        error_rate=args.error_rate,
+        shop_rps=args.shop_rps,
+    )
+    server = MockShopeeServer((args.host, args.port), config, args.catalogue_size)
+    print(f"[INFO] Mock Shopee API listening on {server.url} (partner_id={args.partner_id})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[INFO] Requests served: {server.counters}")
+
+
+if __name__ == "__main__":
+    main()
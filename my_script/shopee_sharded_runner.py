@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sharded runner for shopee_api.py.
+
+Splits the 'New Variation' catalogue into work units (one shop x a range of
+product_ids) in a shared MySQL work table, then lets any number of worker
+processes - on this machine or others pointing at the same requestDatabase -
+claim units under a lease, run them through shopee_api.run_pipeline and mark
+them done.
+
+Workers can join at any time and leave safely: SIGTERM (or Ctrl+C on a
+multi-process `work`) stops a worker after its current unit, Ctrl+C on a
+single worker hands the current unit straight back, and a unit whose worker
+stops heartbeating (crash, kill, network loss) becomes claimable again once
+its lease expires. Re-running a unit is harmless - the listing updates are
+idempotent.
+
+Rate limits in shopee_api are per process. A shop is only ever leased to one
+worker at a time, so SHOPEE_SHOP_RPS holds across workers. --processes
+divides SHOPEE_PARTNER_RPS between local workers; when running on several
+machines, set SHOPEE_PARTNER_RPS on each so the total stays within the
+partner quota.
+
+Usage:
+    python shopee_sharded_runner.py plan --shard-size 2000
+    python shopee_sharded_runner.py work --processes 4
+    python shopee_sharded_runner.py status
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# =========================
+# CONFIGURATION
+# =========================
+
+WORK_TABLE = "requestDatabase.shopee_sync_work"
+
+# Products per work unit (within one shop)
+DEFAULT_SHARD_SIZE = int(os.environ.get("SHOPEE_SHARD_SIZE", "2000"))
+
+# A claimed unit is handed to another worker if not renewed within this many seconds
+LEASE_SECONDS = int(os.environ.get("SHOPEE_LEASE_SECONDS", "300"))
+HEARTBEAT_SECONDS = max(5, LEASE_SECONDS // 3)
+
+# Units that failed this many times are parked as 'failed'
+MAX_UNIT_ATTEMPTS = 3
+
+# MySQL named lock serializing claims, so the one-unit-per-shop check can't race
+CLAIM_LOCK = "shopee_sync_work_claim"
+CLAIM_LOCK_TIMEOUT = 10     # seconds
+
+# Seconds an idle worker waits before looking for work again (units may still
+# come back from expired leases)
+IDLE_POLL_SECONDS = 15
+
+
+# =========================
+# WORK TABLE
+# =========================
+
+def ensure_work_table(conn) -> None:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {WORK_TABLE} (
+                run_id          BIGINT       NOT NULL,
+                unit_id         INT          NOT NULL,
+                shop_id         BIGINT       NOT NULL,
+                product_id_min  BIGINT       NOT NULL,
+                product_id_max  BIGINT       NOT NULL,
+                products        INT          NOT NULL,
+                state           VARCHAR(16)  NOT NULL DEFAULT 'pending',
+                owner           VARCHAR(128) NULL,
+                lease_expires   DATETIME     NULL,
+                attempts        INT          NOT NULL DEFAULT 0,
+                items_processed INT          NULL,
+                items_failed    INT          NULL,
+                updated_at      TIMESTAMP    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                PRIMARY KEY (run_id, unit_id),
+                KEY idx_claim (run_id, state, lease_expires)
+            )
+            """
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def latest_run_id(conn) -> Optional[int]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT MAX(run_id) FROM {WORK_TABLE}")
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    finally:
+        cursor.close()
+
+
+def claim_unit(conn, run_id: int, owner: str) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the next pending unit, or one whose lease has expired.
+
+    At most one unit per shop is leased at a time: shopee_api's shop rate
+    limit is per process, so two workers on the same shop would double its
+    request rate. Claims are serialized with a MySQL named lock so two
+    workers can't both see a shop as free; units whose lease lapsed after
+    their last allowed attempt are parked as 'failed' on the way.
+
+    The busy shops are read before the UPDATE rather than in a subquery on
+    the same table: MySQL refuses that (error 1093) once the optimizer merges
+    the derived table. Under the lock no other claim can slip in between.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (CLAIM_LOCK, CLAIM_LOCK_TIMEOUT))
+        if not cursor.fetchone()[0]:
+            print(f"[WARN] Could not get the claim lock within {CLAIM_LOCK_TIMEOUT}s, retrying later")
+            return None
+        try:
+            cursor.execute(
+                f"""
+                UPDATE {WORK_TABLE}
+                SET state = 'failed', owner = NULL, lease_expires = NULL
+                WHERE run_id = %s AND state = 'claimed' AND lease_expires < NOW() AND attempts >= %s
+                """,
+                (run_id, MAX_UNIT_ATTEMPTS),
+            )
+            cursor.execute(
+                f"""
+                SELECT DISTINCT shop_id FROM {WORK_TABLE}
+                WHERE run_id = %s AND state = 'claimed' AND lease_expires >= NOW()
+                """,
+                (run_id,),
+            )
+            busy = [row[0] for row in cursor.fetchall()]
+            busy_clause = f"AND shop_id NOT IN ({', '.join(['%s'] * len(busy))})" if busy else ""
+            # LAST_INSERT_ID(unit_id) hands the claimed unit_id back on this connection
+            cursor.execute(
+                f"""
+                UPDATE {WORK_TABLE}
+                SET state = 'claimed', owner = %s,
+                    lease_expires = NOW() + INTERVAL %s SECOND,
+                    attempts = attempts + 1,
+                    unit_id = LAST_INSERT_ID(unit_id)
+                WHERE run_id = %s
+                  AND attempts < %s
+                  AND (state = 'pending' OR (state = 'claimed' AND lease_expires < NOW()))
+                  {busy_clause}
+                ORDER BY unit_id
+                LIMIT 1
+                """,
+                (owner, LEASE_SECONDS, run_id, MAX_UNIT_ATTEMPTS, *busy),
+            )
+            claimed = cursor.rowcount
+            conn.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (CLAIM_LOCK,))
+            cursor.fetchone()
+        if claimed == 0:
+            return None
+        cursor.execute(
+            f"""
+            SELECT unit_id, shop_id, product_id_min, product_id_max, products, attempts
+            FROM {WORK_TABLE}
+            WHERE run_id = %s AND unit_id = LAST_INSERT_ID()
+            """,
+            (run_id,),
+        )
+        row = cursor.fetchone()
+        if not row:
+            return None
+        unit_id, shop_id, lo, hi, products, attempts = row
+        return {
+            "run_id": run_id,
+            "unit_id": int(unit_id),
+            "shop_id": int(shop_id),
+            "product_range": (int(lo), int(hi)),
+            "products": int(products),
+            "attempts": int(attempts),
+        }
+    finally:
+        cursor.close()
+
+
+def renew_lease(conn, unit: Dict[str, Any], owner: str) -> bool:
+    """Extend our lease; False if the unit is no longer ours."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            UPDATE {WORK_TABLE}
+            SET lease_expires = NOW() + INTERVAL %s SECOND
+            WHERE run_id = %s AND unit_id = %s AND owner = %s AND state = 'claimed'
+            """,
+            (LEASE_SECONDS, unit["run_id"], unit["unit_id"], owner),
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        cursor.close()
+
+
+def finish_unit(conn, unit: Dict[str, Any], owner: str, state: str,
+                processed: Optional[int] = None, failed: Optional[int] = None) -> None:
+    """
+    Record the unit's outcome: 'done', 'failed', or 'pending' to hand it back.
+    Only applies while we still own it - a unit re-claimed after our lease
+    lapsed belongs to the new owner.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            UPDATE {WORK_TABLE}
+            SET state = %s, owner = NULL, lease_expires = NULL,
+                items_processed = COALESCE(%s, items_processed),
+                items_failed = COALESCE(%s, items_failed)
+            WHERE run_id = %s AND unit_id = %s AND owner = %s
+            """,
+            (state, processed, failed, unit["run_id"], unit["unit_id"], owner),
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+# =========================
+# PLAN
+# =========================
+
+def plan_run(shard_size: int) -> None:
+    """Create a new run: one unit per shard_size product_ids of each shop."""
+    import shopee_api
+    import db_pool
+
+    shops = shopee_api.fetch_active_shops()
+    product_ids: Dict[int, List[int]] = {}
+    for row in shopee_api.iter_new_variation_items(shops):
+        if row["shop_id"] is None:
+            continue
+        ids = product_ids.setdefault(row["shop_id"], [])
+        if not ids or ids[-1] != row["product_id"]:
+            ids.append(row["product_id"])
+
+    units: List[Tuple[int, int, int, int]] = []
+    for shop_id, ids in sorted(product_ids.items()):
+        for i in range(0, len(ids), shard_size):
+            chunk = ids[i:i + shard_size]
+            units.append((shop_id, chunk[0], chunk[-1], len(chunk)))
+
+    run_id = int(time.time())
+    with db_pool.connection() as conn:
+        ensure_work_table(conn)
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(
+                f"""
+                INSERT INTO {WORK_TABLE} (run_id, unit_id, shop_id, product_id_min, product_id_max, products)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                """,
+                [(run_id, unit_id, *unit) for unit_id, unit in enumerate(units, start=1)],
+            )
+            conn.commit()
+        finally:
+            cursor.close()
+
+    print(f"[INFO] Planned run {run_id}: {len(units)} unit(s) across {len(product_ids)} shop(s), "
+          f"{sum(u[3] for u in units)} product(s)")
+
+
+def print_status() -> None:
+    import db_pool
+
+    with db_pool.connection() as conn:
+        ensure_work_table(conn)
+        run_id = latest_run_id(conn)
+        if run_id is None:
+            print("[INFO] No runs planned yet")
+            return
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                f"""
+                SELECT state, COUNT(*), SUM(products), SUM(COALESCE(items_processed, 0)),
+                       SUM(COALESCE(items_failed, 0)), GROUP_CONCAT(DISTINCT owner)
+                FROM {WORK_TABLE}
+                WHERE run_id = %s
+                GROUP BY state
+                """,
+                (run_id,),
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+    print(f"Run {run_id}:")
+    for state, units, products, processed, failed, owners in rows:
+        line = f"  {state}: {units} unit(s), {products} product(s), {processed} processed, {failed} failed"
+        if state == "claimed" and owners:
+            line += f" (workers: {owners})"
+        print(line)
+
+
+# =========================
+# WORKER
+# =========================
+
+class _Heartbeat:
+    """Renews the current unit's lease in the background while it runs."""
+
+    def __init__(self, unit: Dict[str, Any], owner: str):
+        self.unit = unit
+        self.owner = owner
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        import db_pool
+
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            try:
+                with db_pool.connection() as conn:
+                    if not renew_lease(conn, self.unit, self.owner):
+                        self.lost = True
+                        print(f"[WARN] Lost lease on unit {self.unit['unit_id']} - another worker may redo it")
+                        return
+            except Exception as e:
+                print(f"[WARN] Lease heartbeat failed for unit {self.unit['unit_id']}: {e}")
+
+
+def work(partner_rps: Optional[float]) -> None:
+    """Worker process: claim units of the latest run until none are left."""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    # Per-process settings must be in place before shopee_api reads them at import
+    if partner_rps is not None:
+        os.environ["SHOPEE_PARTNER_RPS"] = str(partner_rps)
+    state_dir = tempfile.mkdtemp(prefix="shopee_shard_")
+    # Units aren't incremental and the work table is the checkpoint; keep each
+    # process's sync state private so concurrent workers don't overwrite it
+    os.environ["SHOPEE_SYNC_STATE_FILE"] = os.path.join(state_dir, "sync_state.json")
+
+    import shopee_api
+    import db_pool
+
+    stopping = threading.Event()
+
+    def request_stop(signum, frame):
+        print(f"[INFO] Worker {owner}: stop requested, finishing current unit")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+
+    with db_pool.connection() as conn:
+        ensure_work_table(conn)
+        run_id = latest_run_id(conn)
+    if run_id is None:
+        print(f"[WARN] Worker {owner}: no run planned, exiting")
+        return
+
+    shops = shopee_api.fetch_active_shops()
+    shopee_api.TOKENS.start()
+    units_done = 0
+    try:
+        while not stopping.is_set():
+            with db_pool.connection() as conn:
+                unit = claim_unit(conn, run_id, owner)
+            if unit is None:
+                with db_pool.connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        # Units still leased, or that could be claimed again once a lease lapses
+                        cursor.execute(
+                            f"""
+                            SELECT COUNT(*) FROM {WORK_TABLE}
+                            WHERE run_id = %s
+                              AND state IN ('pending', 'claimed')
+                              AND (attempts < %s OR lease_expires >= NOW())
+                            """,
+                            (run_id, MAX_UNIT_ATTEMPTS),
+                        )
+                        open_units = cursor.fetchone()[0]
+                    finally:
+                        cursor.close()
+                if not open_units:
+                    break
+                # Everything left is leased, or waits on a shop another worker holds -
+                # wait for a unit to finish or a lease to expire
+                stopping.wait(IDLE_POLL_SECONDS)
+                continue
+
+            shop = shops.get(unit["shop_id"])
+            if shop is None:
+                print(f"[WARN] Worker {owner}: no token for shop_id={unit['shop_id']}, marking unit {unit['unit_id']} failed")
+                with db_pool.connection() as conn:
+                    finish_unit(conn, unit, owner, "failed")
+                continue
+
+            lo, hi = unit["product_range"]
+            print(f"[INFO] Worker {owner}: unit {unit['unit_id']} shop_id={unit['shop_id']} "
+                  f"product_id {lo}..{hi} (attempt {unit['attempts']})")
+            stats = shopee_api.RunStats()
+            try:
+                with _Heartbeat(unit, owner):
+                    shopee_api.run_pipeline(
+                        {unit["shop_id"]: shop}, stats, {"shops": {}}, False, False, int(time.time()),
+                        product_range=unit["product_range"],
+                    )
+            except KeyboardInterrupt:
+                with db_pool.connection() as conn:
+                    finish_unit(conn, unit, owner, "pending")
+                raise
+            except Exception as e:
+                print(f"[ERROR] Worker {owner}: unit {unit['unit_id']} failed: {e}")
+                with db_pool.connection() as conn:
+                    finish_unit(conn, unit, owner,
+                                "failed" if unit["attempts"] >= MAX_UNIT_ATTEMPTS else "pending")
+                continue
+
+            failed = sum(len(f) for f in stats.failed_by_shop.values())
+            with db_pool.connection() as conn:
+                finish_unit(conn, unit, owner, "done", stats.processed, failed)
+            units_done += 1
+    except KeyboardInterrupt:
+        print(f"[INFO] Worker {owner}: interrupted, current unit handed back")
+    finally:
+        shopee_api.TOKENS.stop()
+        shopee_api.close_http_client()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    print(f"[INFO] Worker {owner}: finished {units_done} unit(s)")
+
+
+def _work_entry(partner_rps: Optional[float]) -> None:
+    # Ctrl+C goes to the parent; it forwards SIGTERM so children finish their unit
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(partner_rps)
+
+
+def run_workers(processes: int) -> None:
+    partner_rps = None
+    if processes > 1:
+        total = float(os.environ.get("SHOPEE_PARTNER_RPS", "10"))
+        partner_rps = total / processes
+        print(f"[INFO] Starting {processes} worker process(es), {partner_rps:.2f} partner req/s each")
+
+    if processes == 1:
+        work(partner_rps)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    children = [ctx.Process(target=_work_entry, args=(partner_rps,), name=f"shopee-worker-{n}")
+                for n in range(1, processes + 1)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        print("[INFO] Stopping workers after their current unit (Ctrl+C again to abort)")
+        for child in children:
+            if child.is_alive():
+                os.kill(child.pid, signal.SIGTERM)
+        for child in children:
+            child.join()
+
+
+# =========================
+# MAIN
+# =========================
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run shopee_api sharded across processes / machines.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    plan = sub.add_parser("plan", help="create a new run in the work table")
+    plan.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                      help="product_ids per work unit")
+
+    worker = sub.add_parser("work", help="claim and process units of the latest run")
+    worker.add_argument("--processes", type=int, default=1, help="worker processes on this machine")
+
+    sub.add_parser("status", help="show progress of the latest run")
+
+    args = parser.parse_args(argv)
+    if args.command == "plan":
+        plan_run(max(1, args.shard_size))
+    elif args.command == "work":
+        run_workers(max(1, args.processes))
+    else:
+        print_status()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared setup for the my_script unit tests.
+
+The scripts are flat modules imported by name, so my_script/ goes on
+sys.path. shopee_api and db_pool read their credentials at import time;
+the tests never sign a real request or open a DB connection, so dummy
+values are enough.
+
+Usage:
+    cd my_script && python -m pytest tests -q
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("SHOPEE_PARTNER_KEY", "test-partner-key")
+os.environ.setdefault("DB_PASSWORD", "test-db-password")
+
+# shopee_api rewraps sys.stdout for Windows consoles when imported. Import it
+# once here and put pytest's capture stream back; the wrapper is kept alive
+# so it doesn't close the capture file when it is garbage collected.
+_stdout = sys.stdout
+import shopee_api  # noqa: E402
+_SHOPEE_STDOUT = sys.stdout
+sys.stdout = _stdout
+
+
+class FakeClock:
+    """Stands in for the `time` module inside shopee_api; sleep() advances the clock."""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(shopee_api, "time", fake)
+    return fake
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        params = list(params)
+        self.conn.executed.append((sql, params))
+        result = self.conn.handler(sql, params)
+        if isinstance(result, int):
+            self.rowcount, self._rows = result, []
+        else:
+            self._rows = list(result or [])
+            self.rowcount = len(self._rows)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """
+    A DB-API connection whose cursors log every statement (whitespace
+    collapsed) and answer it with handler(sql, params): a list of rows, or
+    an int rowcount.
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler or (lambda sql, params: [])
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+    def statements(self, prefix):
+        return [(sql, params) for sql, params in self.executed if sql.startswith(prefix)]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """A FakeConnection handed out by shopee_api.get_db_connection."""
+    conn = FakeConnection()
+    monkeypatch.setattr(shopee_api, "get_db_connection", lambda: conn)
+    return conn
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.CheckpointJournal."""
+
+import pytest
+
+import shopee_api as api
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / "checkpoint.sqlite3")
+
+
+def test_journal_resume_skips_done_products(journal_path):
+    journal = api.CheckpointJournal(journal_path)
+    journal.begin(resume=False, run_started=100)
+    journal.start_batch(1, [10, 11, 12])
+    journal.mark_done([(1, 10), (1, 11)])
+    first_run = journal.run_id
+    journal.close()
+
+    journal = api.CheckpointJournal(journal_path)
+    journal.begin(resume=True, run_started=200)
+    assert journal.run_id == first_run
+    assert journal.is_done(1, 10) and journal.is_done(1, 11)
+    assert not journal.is_done(1, 12)
+    assert not journal.is_done(2, 10)
+    journal.close()
+
+
+def test_journal_new_run_drops_unfinished_progress(journal_path):
+    journal = api.CheckpointJournal(journal_path)
+    journal.begin(resume=False, run_started=100)
+    journal.mark_done([(1, 10)])
+    first_run = journal.run_id
+
+    journal.begin(resume=False, run_started=200)
+    assert journal.run_id != first_run
+    assert not journal.is_done(1, 10)
+    journal.close()
+
+
+def test_journal_finished_run_is_not_resumed(journal_path):
+    journal = api.CheckpointJournal(journal_path)
+    journal.begin(resume=False, run_started=100)
+    journal.mark_done([(1, 10)])
+    first_run = journal.run_id
+    journal.finish()
+
+    journal.begin(resume=True, run_started=200)
+    assert journal.run_id != first_run
+    assert not journal.is_done(1, 10)
+    journal.close()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.CircuitBreaker."""
+
+import pytest
+
+import shopee_api as api
+
+
+def _trip(breaker: api.CircuitBreaker) -> None:
+    for _ in range(api.BREAKER_FAILURE_THRESHOLD):
+        breaker.on_failure()
+
+
+def test_breaker_opens_after_threshold_failures(clock):
+    breaker = api.CircuitBreaker("/test")
+    for _ in range(api.BREAKER_FAILURE_THRESHOLD - 1):
+        breaker.on_failure()
+    breaker.before_call()
+    assert breaker.state == "closed"
+
+    breaker.on_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 1
+    with pytest.raises(api.CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_success_resets_failure_count(clock):
+    breaker = api.CircuitBreaker("/test")
+    for _ in range(api.BREAKER_FAILURE_THRESHOLD - 1):
+        breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+    assert breaker.state == "closed"
+    assert breaker.failures == 1
+
+
+def test_breaker_allows_one_probe_when_half_open(clock):
+    breaker = api.CircuitBreaker("/test")
+    _trip(breaker)
+
+    clock.now += api.BREAKER_RESET_TIMEOUT
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(api.CircuitOpenError):
+        breaker.before_call()
+
+    breaker.on_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = api.CircuitBreaker("/test")
+    _trip(breaker)
+    clock.now += api.BREAKER_RESET_TIMEOUT
+    breaker.before_call()
+
+    breaker.on_failure()
+    assert breaker.state == "open"
+    assert breaker.opened == 2
+    with pytest.raises(api.CircuitOpenError):
+        breaker.before_call()
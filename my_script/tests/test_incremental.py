@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for the incremental sync state: needs_sync, watermarks and the state file."""
+
+import json
+
+import pytest
+
+import shopee_api as api
+
+SHOP = {"shop_id": 1, "shop_name": "Home Shop", "access_token": "tok"}
+
+
+def _rows(product_id, *row_ids):
+    return [{"row_id": row_id, "product_id": product_id, "shop_id": 1} for row_id in row_ids]
+
+
+@pytest.fixture
+def state_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "sync_state.json")
+    monkeypatch.setattr(api, "SYNC_STATE_FILE", path)
+    return path
+
+
+def test_needs_sync():
+    shop_state = {"synced_rows": {1, 2}}
+    # No watermark / get_item_list failed: everything is fetched
+    assert api.needs_sync(_rows(100, 1, 2), None, shop_state) is True
+    # Edited on Shopee
+    assert api.needs_sync(_rows(100, 1, 2), {100}, shop_state) is True
+    # Unchanged and every row already written
+    assert api.needs_sync(_rows(100, 1, 2), {200}, shop_state) is False
+    # A row that was never written pulls in the whole product
+    assert api.needs_sync(_rows(100, 1, 3), set(), shop_state) is True
+    assert api.needs_sync(_rows(100, 1), set(), {}) is True
+
+
+def test_changed_item_ids_scans_from_the_watermark(monkeypatch):
+    calls = []
+    monkeypatch.setattr(api, "fetch_updated_item_ids",
+                        lambda shop_id, token, since, until: calls.append((shop_id, since, until)) or {100})
+
+    assert api.changed_item_ids(SHOP, {}, 5000) is None
+    assert api.changed_item_ids(SHOP, {"last_sync": 4000}, 5000) == {100}
+    assert calls == [(1, 4000 - api.SYNC_WATERMARK_OVERLAP, 5000)]
+
+
+def test_changed_item_ids_falls_back_to_full_sync_on_error(monkeypatch):
+    def fail(*args):
+        raise api.ShopeeAPIError("boom")
+    monkeypatch.setattr(api, "fetch_updated_item_ids", fail)
+    assert api.changed_item_ids(SHOP, {"last_sync": 4000}, 5000) is None
+
+
+def test_failed_product_is_fetched_again_after_the_watermark_moves():
+    sync_state = {"shops": {"1": {"last_sync": 1000, "synced_rows": {1, 2, 3}}}}
+    stats = api.RunStats()
+    # Product 100 (rows 1, 2) was edited on Shopee but its fetch failed this run;
+    # row 3's listing write failed
+    stats.add_failed(1, [100], [1, 2])
+    stats.add_unwritten(1, [3])
+
+    api.advance_watermarks(sync_state, {1: SHOP, 2: dict(SHOP, shop_id=2)}, stats, 2000)
+
+    assert sync_state["shops"]["1"] == {"last_sync": 2000, "synced_rows": set()}
+    assert sync_state["shops"]["2"] == {"last_sync": 2000, "synced_rows": set()}
+    # Next run: get_item_list no longer reports product 100, it's still fetched
+    assert api.needs_sync(_rows(100, 1, 2), set(), sync_state["shops"]["1"]) is True
+
+
+def test_mark_synced_accumulates_rows():
+    shop_state = {}
+    api.mark_synced(shop_state, [1, 2])
+    api.mark_synced(shop_state, [2, 3])
+    assert shop_state == {"synced_rows": {1, 2, 3}}
+
+
+def test_state_round_trips(state_file):
+    with open(state_file, "w", encoding="utf-8") as f:
+        json.dump({"shops": {"1": {"last_sync": 1000, "synced_rows": [3, 1]}}}, f)
+
+    state = api.load_sync_state()
+    assert state == {"shops": {"1": {"last_sync": 1000, "synced_rows": {1, 3}}}}
+
+    api.mark_synced(state["shops"]["1"], [2])
+    api.save_sync_state(state)
+    with open(state_file, encoding="utf-8") as f:
+        assert json.load(f) == {"shops": {"1": {"last_sync": 1000, "synced_rows": [1, 2, 3]}}}
+
+
+@pytest.mark.parametrize("content", [None, "{not json"])
+def test_missing_or_corrupt_state_means_full_sync(state_file, content):
+    if content is not None:
+        with open(state_file, "w", encoding="utf-8") as f:
+            f.write(content)
+    assert api.load_sync_state() == {"shops": {}}
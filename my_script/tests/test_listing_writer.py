@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.ListingWriter's batched UPDATE ... JOIN."""
+
+import json
+
+import pytest
+
+import shopee_api as api
+
+
+def _details(item_id, name="Item", tiers=()):
+    variations = [
+        api.VariationTier(tier_name, [api.VariationOption(option, image) for option, image in options])
+        for tier_name, options in tiers
+    ]
+    return api.ProductDetails(item_id, name, "desc", variations)
+
+
+@pytest.fixture
+def listing_db(fake_db):
+    """fake_db where shopee_listing_products holds rows 1..9."""
+    def handler(sql, params):
+        if sql.startswith("SELECT new_item_id"):
+            return [(row_id,) for row_id in params if row_id < 10]
+        return []
+    fake_db.handler = handler
+    return fake_db
+
+
+def test_flush_updates_existing_rows_in_one_statement(listing_db):
+    flushed = []
+    writer = api.ListingWriter(batch_size=3, on_flush=lambda done, failed: flushed.append((done, failed)))
+    details = _details(100, "Lamp", [("Color", [("Red", "https://img/red"), ("Blue", None)]),
+                                     ("Size", [("S", None)])])
+    writer.add(details, 1)
+    writer.add(details, 2)
+    assert listing_db.executed == []
+
+    writer.add(_details(200, "Chair"), 42)  # no listing row
+
+    select, update = listing_db.executed
+    assert select[1] == [1, 2, 42]
+    sql, params = update
+    assert sql.startswith(f"UPDATE {api.LISTING_TABLE} p JOIN (SELECT %s AS new_item_id")
+    assert sql.count("UNION ALL") == 1
+    assert "p.shopee_variation_images = v.shopee_variation_images" in sql
+    row = [1, "Lamp", "desc", "Color", json.dumps(["Red", "Blue"]), json.dumps(["https://img/red"]),
+           "Size", json.dumps(["S"])]
+    assert params == row + [2] + row[1:]
+    assert listing_db.commits == 1
+    assert (writer.updated, writer.missing) == (2, 1)
+    assert flushed == [([1, 2, 42], [])]
+
+
+def test_duplicate_rows_keep_the_last_write(listing_db):
+    writer = api.ListingWriter(batch_size=10)
+    writer.add(_details(100, "Old"), 1)
+    writer.add(_details(100, "New"), 1)
+    writer.flush()
+
+    select, (sql, params) = listing_db.executed
+    assert select[1] == [1]
+    assert "UNION ALL" not in sql
+    assert params[:2] == [1, "New"]
+
+
+def test_flush_without_matching_rows_skips_the_update(listing_db):
+    writer = api.ListingWriter(batch_size=10)
+    writer.add(_details(100), 50)
+    writer.close()
+
+    assert [sql.split()[0] for sql, _ in listing_db.executed] == ["SELECT"]
+    assert listing_db.commits == 1
+    assert writer.missing == 1
+    assert listing_db.closed
+
+
+def test_failed_flush_rolls_back_and_reports_rows(listing_db):
+    def handler(sql, params):
+        if sql.startswith("UPDATE"):
+            raise RuntimeError("deadlock")
+        return [(row_id,) for row_id in params]
+    listing_db.handler = handler
+
+    flushed = []
+    writer = api.ListingWriter(batch_size=10, on_flush=lambda done, failed: flushed.append((done, failed)))
+    writer.add(_details(100), 1)
+    writer.add(_details(101), 2)
+    writer.flush()
+
+    assert listing_db.rollbacks == 1
+    assert listing_db.commits == 0
+    assert writer.failed_row_ids == {1, 2}
+    assert writer.updated == 0
+    assert flushed == [([], [1, 2])]
+
+    # The writer keeps going with the next batch
+    listing_db.handler = lambda sql, params: [(row_id,) for row_id in params] if sql.startswith("SELECT") else []
+    writer.add(_details(102), 3)
+    writer.flush()
+    assert writer.updated == 1
+    assert flushed[-1] == ([3], [])
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.needs_model_list."""
+
+import pytest
+
+import shopee_api as api
+
+
+def _item(*tiers):
+    return {"item_id": 1, "has_model": True, "tier_variation": list(tiers)}
+
+
+def _tier(name, *options):
+    return {"name": name, "option_list": list(options)}
+
+
+def _option(name, image_url=None):
+    option = {"option": name}
+    if image_url is not None:
+        option["image"] = {"image_url": image_url}
+    return option
+
+
+def test_model_list_skipped_when_base_info_is_complete():
+    item = _item(
+        _tier("Color", _option("Red", "https://img/red"), _option("Blue", "https://img/blue")),
+        # Only tier-1 options need images
+        _tier("Size", _option("S"), _option("M")),
+    )
+    assert api.needs_model_list(item) is False
+
+
+@pytest.mark.parametrize("item", [
+    {"item_id": 1, "has_model": True},
+    _item(),
+    _item(_tier("", _option("Red", "https://img/red"))),
+    _item(_tier("Color")),
+    _item(_tier("Color", _option("Red", "https://img/red"), _option("Blue"))),
+    _item(_tier("Color", _option("", "https://img/red"))),
+    _item(_tier("Color", _option("Red", "https://img/red")), _tier("Size")),
+])
+def test_model_list_needed_when_base_info_is_incomplete(item):
+    assert api.needs_model_list(item) is True
+
+
+def test_always_fetch_models_forces_model_list(monkeypatch):
+    monkeypatch.setattr(api, "ALWAYS_FETCH_MODELS", True)
+    assert api.needs_model_list(_item(_tier("Color", _option("Red", "https://img/red")))) is True
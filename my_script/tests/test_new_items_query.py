@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for iter_new_variation_items' keyset paging and shop-name mapping."""
+
+import pytest
+
+import shopee_api as api
+
+SHOPS = {
+    1: {"shop_id": 1, "shop_name": "Home Shop"},
+    2: {"shop_id": 2, "shop_name": "Café Deco"},
+    3: {"shop_id": 3, "shop_name": ""},
+}
+
+# new_items rows: (id, product_id, shop, product_name_en, launch_type)
+NEW_ITEMS = [
+    (7, 300, "home shop", " Lamp ", "New Variation"),
+    (2, 100, "Home Shop", "Chair", "New Variation"),
+    (5, 100, "Home Shop", "Chair", "New Variation"),
+    (3, 200, "cafe  deco", "Vase", "New Variation"),
+    (9, 200, "Cafe Deco", "Vase", "New Variation"),
+    (4, 250, "Other Shop", "Rug", "New Variation"),
+    (8, 400, "Home Shop", None, "New Variation"),
+]
+
+
+@pytest.fixture
+def new_items_db(fake_db):
+    """Answers the keyset query from NEW_ITEMS the way MySQL would."""
+    def handler(sql, params):
+        last_product_id, _, last_id, limit = params[-4:]
+        lo, hi = (params[-6], params[-5]) if "BETWEEN" in sql else (None, None)
+        rows = [
+            row for row in NEW_ITEMS
+            if (row[1], row[0]) > (last_product_id, last_id)
+            and (lo is None or lo <= row[1] <= hi)
+        ]
+        return sorted(rows, key=lambda row: (row[1], row[0]))[:limit]
+    fake_db.handler = handler
+    return fake_db
+
+
+def test_pages_cover_every_row_once_in_product_order(new_items_db):
+    items = list(api.iter_new_variation_items(SHOPS, page_size=2))
+
+    assert [(item["product_id"], item["row_id"]) for item in items] == [
+        (100, 2), (100, 5), (200, 3), (200, 9), (250, 4), (300, 7), (400, 8),
+    ]
+    # 7 rows in pages of 2: the fourth page is short and ends the scan
+    pages = new_items_db.statements("SELECT")
+    assert len(pages) == 4
+    assert [params[-4:-1] for _, params in pages] == [[-1, -1, -1], [100, 100, 5], [200, 200, 9], [300, 300, 7]]
+    assert new_items_db.closed
+
+
+def test_shop_names_map_back_leniently(new_items_db, capsys):
+    items = list(api.iter_new_variation_items(SHOPS, page_size=100))
+
+    assert {item["row_id"]: item["shop_id"] for item in items} == {2: 1, 5: 1, 7: 1, 8: 1, 3: 2, 9: 2, 4: None}
+    assert capsys.readouterr().out.count("'Other Shop' matches no ShopeeTokens shop_name") == 1
+    assert items[5]["product_name"] == "Lamp"
+    assert items[6]["product_name"] == ""
+
+    sql, params = new_items_db.executed[0]
+    assert "ni.shop IN (%s, %s)" in sql
+    assert params[:2] == ["Home Shop", "Café Deco"]
+
+
+def test_filters_and_product_range(new_items_db):
+    items = list(api.iter_new_variation_items(SHOPS, page_size=100, only_unsynced=True, product_range=(150, 300)))
+
+    assert [item["product_id"] for item in items] == [200, 200, 250, 300]
+    sql, params = new_items_db.executed[0]
+    assert "AND p.shopee_product_name IS NULL" in sql
+    assert "AND ni.product_id BETWEEN %s AND %s" in sql
+    assert params == ["Home Shop", "Café Deco", 150, 300, -1, -1, -1, 100]
+
+
+def test_no_named_shops_reads_nothing(fake_db):
+    assert list(api.iter_new_variation_items({3: SHOPS[3]})) == []
+    assert fake_db.executed == []
+
+
+@pytest.mark.parametrize("name", ["Café Deco", "cafe deco", "  CAFE\tDECO ", "Café Deco"])
+def test_shop_key_folds_case_accents_and_spaces(name):
+    assert api._shop_key(name) == "cafe deco"
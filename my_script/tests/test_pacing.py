@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for pacing.PacingPolicy and load_settings."""
+
+import json
+
+import pytest
+
+import pacing
+
+
+def _policy(monkeypatch, **overrides):
+    """A policy with fixed delays whose sleeps are recorded instead of slept."""
+    settings = dict(pacing.DEFAULT_SETTINGS)
+    settings.update(min_gap_seconds=5, max_gap_seconds=5, idle_chance=0.0,
+                    break_every=0, long_break_every=0, cooldown_seconds=[60, 60])
+    settings.update(overrides)
+    policy = pacing.PacingPolicy("test", settings)
+    policy.slept = []
+    monkeypatch.setattr(policy, "_sleep", lambda seconds, kind: policy.slept.append((kind, seconds)))
+    return policy
+
+
+def test_defaults_never_back_off_or_stop(monkeypatch):
+    policy = _policy(monkeypatch, **{k: pacing.DEFAULT_SETTINGS[k] for k in ("break_every", "long_break_every")})
+    for _ in range(20):
+        policy.signal("login_redirect")
+        policy.signal("empty_result")
+        assert policy.pace(ok=False) is True
+    assert policy.backoffs == 0
+    assert policy.caution == 1.0
+    assert policy.signals == {"login_redirect": 20, "empty_result": 20}
+
+
+def test_defaults_keep_previous_fixed_breaks(monkeypatch):
+    policy = _policy(monkeypatch, break_every=5, long_break_every=15)
+    for _ in range(15):
+        policy.pace()
+    kinds = [kind for kind, _ in policy.slept]
+    assert kinds.count("break") == 2
+    assert kinds.count("long_break") == 1
+
+
+def test_failed_product_is_not_a_signal(monkeypatch):
+    policy = _policy(monkeypatch, signal_weights={"login_redirect": 1.0, "empty_result": 1.0},
+                     max_signals_per_hour=1)
+    for _ in range(5):
+        assert policy.pace(ok=False) is True
+    assert policy.backoffs == 0
+    assert policy.signals == {}
+
+
+def test_unknown_signal_is_counted_but_ignored(monkeypatch):
+    policy = _policy(monkeypatch, signal_weights={"login_redirect": 1.0})
+    policy.signal("something_else")
+    assert policy.signals == {"something_else": 1}
+    assert policy.backoffs == 0
+
+
+def test_weighted_signal_backs_off_and_cools_down(monkeypatch):
+    policy = _policy(monkeypatch, signal_weights={"login_redirect": 1.0, "empty_result": 0.5})
+    policy.signal("empty_result")
+    assert policy.backoffs == 0
+
+    policy.signal("empty_result")
+    assert policy.backoffs == 1
+    assert policy.caution == 2.0
+
+    assert policy.pace(ok=False) is True
+    kind, seconds = policy.slept[-1]
+    # The cool-down (60s x caution) outlasts the gap (5s x caution)
+    assert kind == "cooldown"
+    assert seconds == pytest.approx(120, abs=1)
+
+
+def test_success_decays_caution(monkeypatch):
+    policy = _policy(monkeypatch, signal_weights={"login_redirect": 1.0}, recovery_step=0.5)
+    policy.signal("login_redirect")
+    assert policy.caution == 2.0
+    policy.pace(ok=True)
+    assert policy.caution == 1.5
+    policy.pace(ok=True)
+    policy.pace(ok=True)
+    assert policy.caution == 1.0
+
+
+def test_caution_is_capped(monkeypatch):
+    policy = _policy(monkeypatch, signal_weights={"login_redirect": 1.0}, max_caution=4.0)
+    for _ in range(5):
+        policy.signal("login_redirect")
+    assert policy.caution == 4.0
+
+
+def test_too_many_backoffs_stop_the_run(monkeypatch):
+    policy = _policy(monkeypatch, signal_weights={"login_redirect": 1.0}, max_signals_per_hour=2)
+    policy.signal("login_redirect")
+    policy.signal("login_redirect")
+    assert policy.pace() is True
+
+    policy.signal("login_redirect")
+    assert policy.pace() is False
+
+
+def test_max_per_day_stops_the_run(monkeypatch):
+    policy = _policy(monkeypatch, max_per_day=3)
+    assert [policy.pace() for _ in range(4)] == [True, True, True, False]
+
+
+def test_max_per_hour_waits_for_budget(monkeypatch):
+    policy = _policy(monkeypatch, max_per_hour=2)
+    policy.pace()
+    policy.pace()
+    policy.pace()
+    kind, seconds = policy.slept[-1]
+    assert kind == "budget"
+    assert seconds > 3000
+
+
+def test_load_settings_layers_default_and_account(tmp_path, capsys):
+    path = tmp_path / "scraper_pacing.json"
+    path.write_text(json.dumps({
+        "default": {"target_per_hour": 60, "max_per_day": 500, "bogus": 1},
+        "accounts": {"shop2": {"max_per_day": 200}},
+    }), encoding="utf-8")
+
+    settings = pacing.load_settings(str(path), "shop2")
+    assert settings["target_per_hour"] == 60
+    assert settings["max_per_day"] == 200
+    assert settings["min_gap_seconds"] == pacing.DEFAULT_SETTINGS["min_gap_seconds"]
+    assert "bogus" not in settings
+    assert "Unknown pacing setting 'bogus'" in capsys.readouterr().out
+
+    assert pacing.load_settings(str(path), "default")["max_per_day"] == 500
+
+
+def test_load_settings_without_file_uses_defaults(tmp_path):
+    assert pacing.load_settings(str(tmp_path / "missing.json")) == pacing.DEFAULT_SETTINGS
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for page_nav's offer-ID extraction and navigation paths."""
+
+import pytest
+
+import page_nav
+
+OFFER_URL = "https://detail.1688.com/offer/804862876701.html"
+
+
+@pytest.mark.parametrize("raw", [
+    '["https://detail.1688.com/offer/804862876701.html?spm=a2615.7691456"]',
+    '["https://detail.1688.com/offer/804862876701.html", "https://detail.1688.com/offer/1.html"]',
+    "https://detail.1688.com/offer/804862876701.html",
+    '["https://m.1688.com/details?offerId=804862876701&spm=x"]',
+    '["https://air.1688.com/app/804862876701"]',
+    "804862876701",
+    '"804862876701"',
+    ["https://detail.1688.com/offer/804862876701.html"],
+])
+def test_extract_offer_id(raw):
+    assert page_nav.extract_1688_offer_id(raw) == ("804862876701", OFFER_URL)
+
+
+@pytest.mark.parametrize("raw", [
+    None,
+    "",
+    "[]",
+    "{}",
+    '["https://www.taobao.com/item/123"]',
+    "12345",
+    "not a link",
+])
+def test_extract_offer_id_without_offer(raw):
+    assert page_nav.extract_1688_offer_id(raw) == (None, None)
+
+
+# =========================
+# NAVIGATION
+# =========================
+
+class FakeSite:
+    """The scraper callbacks, with a scripted outcome for each step."""
+
+    def __init__(self, product_page=True, session_expired=False, search_ok=True, result_ok=True):
+        self.product_page = product_page
+        self.session_expired = session_expired
+        self.search_ok = search_ok
+        self.result_ok = result_ok
+        self.visited = []
+
+    def navigate(self, url):
+        return page_nav.navigate_to_1688_product(
+            "driver", url, "product",
+            safe_get=lambda driver, u, rebuild_driver_fn=None: self.visited.append(u) or driver,
+            check_session_expired=lambda driver: self.session_expired,
+            navigate_to_order_list=lambda driver, rebuild_driver_fn=None: self.visited.append("order_list") or driver,
+            search_product=lambda driver, name: self.search_ok,
+            click_product_result=lambda driver: self.result_ok,
+        )
+
+
+@pytest.fixture
+def site(monkeypatch):
+    site = FakeSite()
+    monkeypatch.setattr(page_nav.page_waits, "wait_for", lambda driver, name, timeout=None: True)
+    monkeypatch.setattr(page_nav.page_waits, "check_now", lambda driver, name: site.product_page)
+    monkeypatch.setattr(page_nav, "NAV_STATS", dict.fromkeys(page_nav.NAV_STATS, 0))
+    return site
+
+
+def test_direct_url(site):
+    assert site.navigate(OFFER_URL) == ("driver", True)
+    assert site.visited == [OFFER_URL]
+    assert page_nav.NAV_STATS["direct"] == 1
+
+
+def test_search_fallback_when_offer_page_is_empty(site):
+    site.product_page = False
+    assert site.navigate(OFFER_URL) == ("driver", True)
+    assert site.visited == [OFFER_URL, "order_list"]
+    assert page_nav.NAV_STATS["search_fallback"] == 1
+
+
+def test_search_only_without_url(site):
+    assert site.navigate(None) == ("driver", True)
+    assert site.visited == ["order_list"]
+    assert page_nav.NAV_STATS["search_only"] == 1
+
+
+@pytest.mark.parametrize("outcome", [
+    {"session_expired": True}, {"search_ok": False}, {"result_ok": False},
+])
+def test_failed_navigation(site, outcome):
+    site.product_page = False
+    for name, value in outcome.items():
+        setattr(site, name, value)
+    assert site.navigate(OFFER_URL) == ("driver", False)
+    assert page_nav.NAV_STATS["failed"] == 1
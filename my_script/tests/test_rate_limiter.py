@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.TokenBucket."""
+
+import pytest
+
+import shopee_api as api
+
+
+def test_token_bucket_grants_burst_then_waits(clock):
+    bucket = api.TokenBucket("test", rate=2.0, capacity=2)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0.0
+
+
+def test_token_bucket_acquire_sleeps_until_a_token_is_free(clock):
+    bucket = api.TokenBucket("test", rate=4.0, capacity=1)
+    bucket.acquire()
+    start = clock.now
+    bucket.acquire()
+    assert clock.now - start == pytest.approx(0.25)
+
+
+def test_token_bucket_throttle_halves_rate_once_per_second(clock):
+    bucket = api.TokenBucket("test", rate=8.0)
+    bucket.on_throttle()
+    bucket.on_throttle()
+    assert bucket.rate == 4.0
+    assert bucket.throttled == 2
+    assert bucket.tokens == 0
+
+    clock.now += 1.0
+    bucket.on_throttle()
+    assert bucket.rate == 2.0
+
+
+def test_token_bucket_rate_never_drops_below_min(clock):
+    bucket = api.TokenBucket("test", rate=16.0)
+    for _ in range(10):
+        bucket.on_throttle()
+        clock.now += 1.0
+    assert bucket.rate == bucket.min_rate == 1.0
+
+
+def test_token_bucket_recovers_after_cooldown(clock):
+    bucket = api.TokenBucket("test", rate=10.0)
+    bucket.on_throttle()
+    assert bucket.rate == 5.0
+
+    # Still inside the cooldown: no recovery
+    clock.now += api.THROTTLE_COOLDOWN - 1
+    bucket.try_acquire()
+    assert bucket.rate == 5.0
+
+    # Past the cooldown the rate climbs by 10% of max per second, capped at max
+    clock.now += 1
+    bucket.try_acquire()
+    clock.now += 2
+    bucket.try_acquire()
+    assert bucket.rate == pytest.approx(8.0)
+    clock.now += 60
+    bucket.try_acquire()
+    assert bucket.rate == bucket.max_rate
+
+
+def test_token_bucket_throughput_counts_recent_grants(clock):
+    bucket = api.TokenBucket("test", rate=100.0)
+    clock.now += 10
+    for _ in range(20):
+        bucket.try_acquire()
+    assert bucket.throughput(window=10) == pytest.approx(2.0)
+
+    clock.now += 11
+    assert bucket.throughput(window=10) == 0.0
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.ResponseCache."""
+
+import os
+
+import pytest
+
+import shopee_api as api
+
+ENDPOINT = api.PATH_GET_MODEL_LIST
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+@pytest.fixture
+def cache(cache_path, clock):
+    cache = api.ResponseCache(cache_path, ttl=600, max_bytes=10_000)
+    yield cache
+    cache.close()
+
+
+def test_hit_after_put(cache):
+    assert cache.get(1, ENDPOINT, 10) is None
+    cache.put(1, ENDPOINT, 10, {"tier_variation": [{"name": "Color"}]}, update_time=500)
+
+    assert cache.get(1, ENDPOINT, 10) == {"tier_variation": [{"name": "Color"}]}
+    assert cache.get(1, ENDPOINT, 10, update_time=500) is not None
+    assert cache.get(2, ENDPOINT, 10) is None
+    assert cache.get(1, api.PATH_ITEM_BASE_INFO, 10) is None
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_entry_expires_after_ttl(cache, clock):
+    cache.put(1, ENDPOINT, 10, {"a": 1}, update_time=None)
+    clock.now += 600
+    assert cache.get(1, ENDPOINT, 10) == {"a": 1}
+    clock.now += 1
+    assert cache.get(1, ENDPOINT, 10) is None
+
+
+def test_newer_update_time_is_a_miss(cache):
+    cache.put(1, ENDPOINT, 10, {"a": 1}, update_time=500)
+    assert cache.get(1, ENDPOINT, 10, update_time=501) is None
+
+
+def test_invalidate_keeps_entries_at_the_given_update_time(cache):
+    cache.put(1, ENDPOINT, 10, {"a": 1}, update_time=500)
+    cache.put(1, api.PATH_ITEM_BASE_INFO, 10, {"b": 1}, update_time=600)
+    cache.put(1, ENDPOINT, 11, {"c": 1}, update_time=500)
+
+    cache.invalidate(1, 10, update_time=600)
+    assert cache.get(1, ENDPOINT, 10) is None
+    assert cache.get(1, api.PATH_ITEM_BASE_INFO, 10) == {"b": 1}
+
+    cache.invalidate(1, 10)
+    assert cache.get(1, api.PATH_ITEM_BASE_INFO, 10) is None
+    assert cache.get(1, ENDPOINT, 11) == {"c": 1}
+
+
+def test_oldest_entries_are_evicted_past_max_bytes(cache_path, clock):
+    cache = api.ResponseCache(cache_path, ttl=600, max_bytes=1000)
+    payload = {"blob": "x" * 180}  # ~190 bytes each
+    for item_id in range(5):
+        cache.put(1, ENDPOINT, item_id, payload, update_time=None)
+        clock.now += 1
+    assert all(cache.get(1, ENDPOINT, item_id) for item_id in range(5))
+
+    cache.put(1, ENDPOINT, 5, payload, update_time=None)
+    assert cache.get(1, ENDPOINT, 0) is None
+    assert cache.get(1, ENDPOINT, 5) is not None
+    assert cache._total_bytes <= 900
+    cache.close()
+
+
+def test_size_is_restored_on_reopen(cache_path, clock):
+    cache = api.ResponseCache(cache_path, ttl=600, max_bytes=10_000)
+    cache.put(1, ENDPOINT, 10, {"a": "x" * 50}, update_time=None)
+    cache.put(1, ENDPOINT, 10, {"a": "x" * 100}, update_time=None)  # replaced, not added
+    size = cache._total_bytes
+    cache.close()
+
+    reopened = api.ResponseCache(cache_path, ttl=600, max_bytes=10_000)
+    assert reopened._total_bytes == size < 150
+    assert reopened.get(1, ENDPOINT, 10) == {"a": "x" * 100}
+    reopened.close()
+
+
+@pytest.mark.skipif("SHOPEE_RESPONSE_CACHE" in os.environ, reason="cache configured in the environment")
+def test_cache_is_off_by_default():
+    assert api.CACHE_ENABLED is False
+    assert api.get_response_cache() is None
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests for shopee_sharded_runner.claim_unit.
+
+The MySQL check runs only when SHOPEE_TEST_MYSQL_HOST is set. It uses a
+scratch work table in SHOPEE_TEST_MYSQL_DATABASE (default "test"), with
+SHOPEE_TEST_MYSQL_USER / SHOPEE_TEST_MYSQL_PASSWORD / SHOPEE_TEST_MYSQL_PORT.
+"""
+
+import os
+
+import pytest
+
+import shopee_sharded_runner as runner
+from conftest import FakeConnection
+
+UNIT_ROW = (3, 7, 100, 199, 50, 1)
+
+
+def _claim_db(lock=1, busy=(), claimed=1, fail_update=False):
+    def handler(sql, params):
+        if sql.startswith("SELECT GET_LOCK"):
+            return [(lock,)]
+        if sql.startswith("SELECT DISTINCT shop_id"):
+            return [(shop_id,) for shop_id in busy]
+        if sql.startswith("UPDATE") and "state = 'claimed', owner" in sql:
+            if fail_update:
+                raise RuntimeError("lock wait timeout")
+            return claimed
+        if sql.startswith("SELECT RELEASE_LOCK"):
+            return [(1,)]
+        if sql.startswith("SELECT unit_id"):
+            return [UNIT_ROW]
+        return 0
+    return FakeConnection(handler)
+
+
+def _claim_update(conn):
+    return [(sql, params) for sql, params in conn.statements("UPDATE") if "owner = %s" in sql][0]
+
+
+def test_claims_next_unit_outside_busy_shops():
+    conn = _claim_db(busy=(5, 6))
+    unit = runner.claim_unit(conn, 42, "host:1")
+
+    assert unit == {"run_id": 42, "unit_id": 3, "shop_id": 7, "product_range": (100, 199),
+                    "products": 50, "attempts": 1}
+    sql, params = _claim_update(conn)
+    assert "AND shop_id NOT IN (%s, %s)" in sql
+    # The work table is only read by the statement before, never by a subquery
+    assert sql.count(runner.WORK_TABLE) == 1
+    assert params == ["host:1", runner.LEASE_SECONDS, 42, runner.MAX_UNIT_ATTEMPTS, 5, 6]
+    assert conn.commits == 1
+    assert conn.statements("SELECT RELEASE_LOCK")
+
+
+def test_no_busy_shops_means_no_shop_filter():
+    conn = _claim_db()
+    runner.claim_unit(conn, 42, "host:1")
+    sql, params = _claim_update(conn)
+    assert "NOT IN" not in sql
+    assert params == ["host:1", runner.LEASE_SECONDS, 42, runner.MAX_UNIT_ATTEMPTS]
+
+
+def test_nothing_claimable():
+    conn = _claim_db(claimed=0)
+    assert runner.claim_unit(conn, 42, "host:1") is None
+    assert conn.statements("SELECT RELEASE_LOCK")
+    assert not conn.statements("SELECT unit_id")
+
+
+def test_lock_timeout_claims_nothing():
+    conn = _claim_db(lock=0)
+    assert runner.claim_unit(conn, 42, "host:1") is None
+    assert not conn.statements("UPDATE")
+    assert not conn.statements("SELECT RELEASE_LOCK")
+
+
+def test_lock_is_released_when_the_claim_fails():
+    conn = _claim_db(fail_update=True)
+    with pytest.raises(RuntimeError):
+        runner.claim_unit(conn, 42, "host:1")
+    assert conn.statements("SELECT RELEASE_LOCK")
+    assert conn.commits == 0
+
+
+# =========================
+# MYSQL
+# =========================
+
+@pytest.fixture
+def mysql_work_table(monkeypatch):
+    if not os.environ.get("SHOPEE_TEST_MYSQL_HOST"):
+        pytest.skip("SHOPEE_TEST_MYSQL_HOST not set")
+    import mysql.connector
+
+    conn = mysql.connector.connect(
+        host=os.environ["SHOPEE_TEST_MYSQL_HOST"],
+        port=int(os.environ.get("SHOPEE_TEST_MYSQL_PORT", "3306")),
+        user=os.environ.get("SHOPEE_TEST_MYSQL_USER", "root"),
+        password=os.environ.get("SHOPEE_TEST_MYSQL_PASSWORD", ""),
+        database=os.environ.get("SHOPEE_TEST_MYSQL_DATABASE", "test"),
+    )
+    table = "shopee_sync_work_test"
+    monkeypatch.setattr(runner, "WORK_TABLE", table)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    runner.ensure_work_table(conn)
+    yield conn, table
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    cursor.close()
+    conn.close()
+
+
+def test_claims_on_mysql_leave_one_unit_per_shop(mysql_work_table):
+    conn, table = mysql_work_table
+    cursor = conn.cursor()
+    cursor.executemany(
+        f"INSERT INTO {table} (run_id, unit_id, shop_id, product_id_min, product_id_max, products) "
+        "VALUES (1, %s, %s, %s, %s, 10)",
+        [(1, 10, 1, 100), (2, 10, 101, 200), (3, 20, 1, 100), (4, 10, 201, 300)],
+    )
+    # A lease that ran out is claimable again
+    cursor.execute(
+        f"INSERT INTO {table} (run_id, unit_id, shop_id, product_id_min, product_id_max, products, "
+        "state, owner, lease_expires, attempts) "
+        "VALUES (1, 5, 30, 1, 100, 10, 'claimed', 'gone:1', NOW() - INTERVAL 1 MINUTE, 1)"
+    )
+    conn.commit()
+    cursor.close()
+
+    claimed = [runner.claim_unit(conn, 1, f"worker:{n}") for n in range(4)]
+
+    assert [(unit["unit_id"], unit["shop_id"]) for unit in claimed[:3]] == [(1, 10), (3, 20), (5, 30)]
+    assert claimed[2]["attempts"] == 2
+    assert claimed[3] is None
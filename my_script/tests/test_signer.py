@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.ShopeeSigner, checked against a plain HMAC-SHA256."""
+
+import hashlib
+import hmac
+import time
+
+import shopee_api as api
+
+
+def _reference_sign(partner_id: int, key: bytes, path: str, timestamp: int,
+                    token: str = "", shop_id="") -> str:
+    base = f"{partner_id}{path}{timestamp}{token}{shop_id}"
+    return hmac.new(key, base.encode(), hashlib.sha256).hexdigest()
+
+
+def test_signer_matches_plain_hmac():
+    signer = api.ShopeeSigner(1234, b"secret", "https://host")
+    for path in (api.PATH_ITEM_BASE_INFO, api.PATH_GET_MODEL_LIST, api.PATH_ITEM_BASE_INFO):
+        assert signer.sign(path, 1700000000, "tok", 42) == \
+            _reference_sign(1234, b"secret", path, 1700000000, "tok", 42)
+    assert signer.sign("/api/v2/auth/access_token/get", 1700000001) == \
+        _reference_sign(1234, b"secret", "/api/v2/auth/access_token/get", 1700000001)
+
+
+def test_module_sign_uses_partner_credentials():
+    ts = int(time.time())
+    assert api._sign(api.PATH_GET_MODEL_LIST, "tok", 42, ts) == \
+        _reference_sign(api.PARTNER_ID, api.PARTNER_KEY, api.PATH_GET_MODEL_LIST, ts, "tok", 42)
+
+
+def test_sign_many_matches_sign():
+    signer = api.ShopeeSigner(1234, b"secret", "https://host")
+    entries = [
+        (api.PATH_ITEM_BASE_INFO, 1, 100, "a"),
+        (api.PATH_ITEM_BASE_INFO, 1, 100, "a"),
+        (api.PATH_GET_MODEL_LIST, 2, 100, "b"),
+    ]
+    assert signer.sign_many(entries) == [signer.sign(p, ts, tok, sid) for p, sid, ts, tok in entries]
+
+
+def test_signer_urls():
+    signer = api.ShopeeSigner(1234, b"secret", "https://host")
+    sign = signer.sign(api.PATH_GET_MODEL_LIST, 100, "tok", 7)
+    assert signer.url(api.PATH_GET_MODEL_LIST, 7, "tok", 100, {"item_id": 5}) == (
+        f"https://host{api.PATH_GET_MODEL_LIST}?partner_id=1234&timestamp=100"
+        f"&shop_id=7&access_token=tok&sign={sign}&item_id=5"
+    )
+    path = "/api/v2/auth/access_token/get"
+    assert signer.public_url(path, 100) == \
+        f"https://host{path}?partner_id=1234&timestamp=100&sign={signer.sign(path, 100)}"
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""Unit tests for shopee_api.TokenManager's lazy refresh and usable-shop rules."""
+
+import pytest
+
+import shopee_api as api
+
+NOW = 1000.0
+HOUR = 3600
+
+
+@pytest.fixture
+def tokens(fake_db, clock, monkeypatch):
+    """A TokenManager loading from fake_db's ShopeeTokens rows; refreshes are scripted."""
+    rows = [
+        # shop_id, shop_name, access_token, refresh_token, expires_at
+        (1, "Fresh", "tok1", "ref1", NOW + HOUR),
+        (2, "Expiring", "tok2", "ref2", NOW + 250),
+        (3, "Expired", "tok3", "ref3", NOW - 60),
+        (4, "Refresh only", "", "ref4", 0),
+        (5, "No refresh token", "tok5", "", NOW - 60),
+    ]
+    fake_db.handler = lambda sql, params: rows
+    manager = api.TokenManager(refresh_margin=300, check_interval=60)
+    manager.refresh_results = {}
+    manager.refresh_calls = []
+
+    def refresh(shop_id):
+        manager.refresh_calls.append(shop_id)
+        if manager.refresh_results.get(shop_id):
+            manager._apply(shop_id, f"new{shop_id}", f"ref{shop_id}", int(clock.now) + HOUR)
+            return True
+        return False
+    monkeypatch.setattr(manager, "_refresh_locked", refresh)
+    return manager
+
+
+def test_load_keeps_refreshable_shops(tokens):
+    shops = tokens.load()
+    assert sorted(shops) == [1, 2, 3, 4]
+    assert [shop_id for shop_id in shops if tokens.needs_refresh(shop_id, NOW)] == [2, 3, 4]
+    assert tokens.refresh_calls == []
+
+
+def test_load_in_dry_run_skips_expired_tokens(tokens, monkeypatch, capsys):
+    monkeypatch.setattr(api, "DRY_RUN", True)
+    assert sorted(tokens.load()) == [1, 2]
+    assert "Skipping 3 shop(s) with an expired token that is not refreshed in DRY_RUN" in capsys.readouterr().out
+
+
+def test_fresh_token_refreshes_once_due(tokens):
+    tokens.load()
+    assert tokens.fresh_token(1, "tok1") == "tok1"
+
+    tokens.refresh_results[2] = True
+    assert tokens.fresh_token(2, "tok2") == "new2"
+    assert tokens.fresh_token(2, "tok2") == "tok2"  # caller's copy is fresh now
+    assert tokens.refresh_calls == [2]
+
+
+def test_failed_refresh_keeps_an_unexpired_token(tokens):
+    tokens.load()
+    assert tokens.fresh_token(2, "tok2") == "tok2"
+    assert 2 in tokens.shops
+
+
+def test_failed_refresh_of_expired_token_drops_the_shop(tokens):
+    tokens.load()
+    with pytest.raises(api.ShopeeAPIError, match="shop_id=3"):
+        tokens.fresh_token(3, "tok3")
+    assert 3 not in tokens.shops
+    assert tokens.needs_refresh(3) is False
+
+
+def test_failed_refreshes_back_off(tokens, clock):
+    tokens.load()
+    for _ in range(3):
+        tokens.fresh_token(2, "tok2")
+    assert tokens.refresh_calls == [2]
+
+    clock.now += 60
+    tokens.fresh_token(2, "tok2")
+    assert tokens.refresh_calls == [2, 2]
+
+    # Second failure doubles the wait
+    clock.now += 60
+    tokens.fresh_token(2, "tok2")
+    assert tokens.refresh_calls == [2, 2]
+    clock.now += 60
+    tokens.refresh_results[2] = True
+    assert tokens.fresh_token(2, "tok2") == "new2"
+    assert tokens.refresh_calls == [2, 2, 2]
+    assert 2 not in tokens._retry_at
+
+
+def test_refresh_now_reuses_a_token_already_refreshed(tokens):
+    tokens.load()
+    tokens.refresh_results[1] = True
+    assert tokens.refresh_now(1, "tok1") == "new1"
+    assert tokens.refresh_now(1, "tok1") == "new1"
+    assert tokens.refresh_calls == [1]
+    assert tokens.refresh_now(9, "tok9") is None